@@ -0,0 +1,21 @@
+"""Move completed and cancelled orders older than ORDER_ARCHIVE_AFTER_DAYS
+into the archive tables.
+
+Run periodically (e.g. nightly from cron). Pass --days N to override the
+configured age.
+"""
+import sys
+from ecommerce import create_app
+from ecommerce.utils.order_archive import archive_orders
+
+def main():
+    app = create_app()
+    days = None
+    if '--days' in sys.argv:
+        days = int(sys.argv[sys.argv.index('--days') + 1])
+    with app.app_context():
+        archived = archive_orders(older_than_days=days)
+        print(f"Archived {archived} orders")
+
+if __name__ == '__main__':
+    main()
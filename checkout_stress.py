@@ -0,0 +1,85 @@
+"""Concurrent checkout stress test for the stock decrement.
+
+Gives every customer a cart holding --quantity units of one product that
+has --stock units, fires all the checkouts at once from --threads threads
+and verifies that no more stock was sold than existed. Runs against the
+testing database, which is dropped and recreated.
+
+    python checkout_stress.py --customers 200 --stock 150 --threads 16
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop, Product
+from ecommerce.models.cart import Cart, CartItem
+from ecommerce.models.order import Order, OrderItem
+
+def setup(customers, stock, quantity):
+    db.drop_all()
+    db.create_all()
+    owner = User(username='stressowner', email='stressowner@example.com', role='shop_owner')
+    owner.set_password('password')
+    db.session.add(owner)
+    db.session.commit()
+    shop = Shop(name='Stress Shop', description='', owner_id=owner.id)
+    db.session.add(shop)
+    db.session.commit()
+    product = Product(name='Limited Edition', description='', price=10.0, stock=stock, shop_id=shop.id)
+    db.session.add(product)
+
+    users = [User(username=f'stress{i}', email=f'stress{i}@example.com', role='user') for i in range(customers)]
+    for user in users:
+        user.password_hash = owner.password_hash
+    db.session.add_all(users)
+    db.session.commit()
+    carts = [Cart(user_id=user.id) for user in users]
+    db.session.add_all(carts)
+    db.session.commit()
+    db.session.add_all([CartItem(cart_id=cart.id, product_id=product.id, quantity=quantity) for cart in carts])
+    db.session.commit()
+    return product.id, [user.id for user in users]
+
+def checkout(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+    return client.post('/api/checkout', json={
+        'shipping': {'address': '1 Stress Street'},
+        'payment_method': 'cod'
+    }).status_code
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--customers', type=int, default=100)
+    parser.add_argument('--stock', type=int, default=60)
+    parser.add_argument('--quantity', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        product_id, user_ids = setup(args.customers, args.stock, args.quantity)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        statuses = list(pool.map(lambda user_id: checkout(app, user_id), user_ids))
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        stock = db.session.get(Product, product_id).stock
+        orders = Order.query.count()
+        sold = db.session.query(db.func.coalesce(db.func.sum(OrderItem.quantity), 0)).scalar()
+
+    print(f"{len(user_ids)} checkouts in {elapsed:.2f}s from {args.threads} threads, "
+          f"{orders / elapsed:.1f} orders/s")
+    print(f"Orders placed: {orders}, units sold: {sold}, stock left: {stock}, "
+          f"rejected: {statuses.count(400)}")
+    oversold = sold > args.stock or stock != args.stock - sold or stock < 0
+    print('OVERSOLD' if oversold else 'No oversell')
+    return 1 if oversold else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
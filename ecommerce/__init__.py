@@ -91,8 +91,41 @@ def create_app(config_name='default'):
         app.logger.setLevel(logging.INFO)
         app.logger.info('E-commerce startup')
     
-    # Create database tables
+    # Keep session data server-side unless SESSION_BACKEND is 'cookie'
+    from .utils.server_session import init_session_interface
+    init_session_interface(app)
+    
+    # Create database tables and the product search indexes
+    from .utils.search_index import ensure_search_index
+    from .utils.autocomplete import suggestion_index
+    from .utils.trigram import ensure_trigram_index
+    from .utils.ranking import ensure_ranking_index
+    from .utils.order_events import ensure_order_events
     with app.app_context():
         db.create_all()
+        ensure_search_index()
+        ensure_trigram_index()
+        ensure_ranking_index()
+        ensure_order_events()
+        suggestion_index.build()
     
-    return app
\ No newline at end of file
+    return app
+
+
+def start_background_workers(app):
+    """Start the web server's maintenance and notification threads.
+
+    Called by the server entry point only, so CLI scripts that build an
+    app do not start them. Releases abandoned cart reservations, purges
+    expired idempotency keys and old outbox rows, folds new order events
+    into the daily counters, and sends queued notifications after their
+    transaction commits.
+    """
+    from .utils.inventory import start_reservation_reaper
+    from .utils.idempotency import purge_expired_keys
+    from .utils.order_events import fold_order_events
+    from .utils.outbox import purge_outbox, start_outbox_worker
+    app.extensions['reservation_reaper'] = start_reservation_reaper(
+        app, tasks=[purge_expired_keys, purge_outbox, fold_order_events]
+    )
+    app.extensions['outbox_worker'] = start_outbox_worker(app)
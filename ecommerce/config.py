@@ -34,6 +34,35 @@ class Config:
     WTF_CSRF_ENABLED = True
     WTF_CSRF_SECRET_KEY = 'your-csrf-secret-key-here'  # Change this in production
     WTF_CSRF_TIME_LIMIT = 3600  # 1 hour
+    
+    # Session storage: 'cookie' (signed cookie), 'sqlalchemy' or 'dbm' (server-side).
+    # Opt-in: set SESSION_BACKEND=sqlalchemy (or dbm) to keep carts out of the cookie
+    SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'cookie')
+    SESSION_DBM_PATH = os.getenv('SESSION_DBM_PATH')  # Defaults to instance/sessions
+    SESSION_TTL = int(os.getenv('SESSION_TTL', 7 * 24 * 3600))  # Seconds since last write
+    
+    # Stock reservations held by cart lines
+    RESERVATION_TTL = int(os.getenv('RESERVATION_TTL', 15 * 60))  # Seconds
+    RESERVATION_REAP_INTERVAL = int(os.getenv('RESERVATION_REAP_INTERVAL', 60))  # Seconds
+    
+    # How long Idempotency-Key responses are kept for replay
+    IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', 24 * 3600))  # Seconds
+    
+    # Notification outbox drained after commit
+    OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 50))
+    OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', 4))  # Concurrent sends
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5))
+    OUTBOX_POLL_INTERVAL = int(os.getenv('OUTBOX_POLL_INTERVAL', 5))  # Seconds
+    OUTBOX_BASE_URL = os.getenv('OUTBOX_BASE_URL', 'http://localhost:5000/')  # For links in mail queued outside a request
+    OUTBOX_SENT_RETENTION = int(os.getenv('OUTBOX_SENT_RETENTION', 24 * 3600))  # Seconds sent rows are kept
+    OUTBOX_FAILED_RETENTION = int(os.getenv('OUTBOX_FAILED_RETENTION', 30 * 24 * 3600))  # Seconds failed rows are kept
+    
+    # Order event folding: a missing event id is waited for this many seconds
+    ORDER_EVENT_GAP_TIMEOUT = int(os.getenv('ORDER_EVENT_GAP_TIMEOUT', 3600))
+
+    # Finished orders are moved to the archive tables after this many days
+    ORDER_ARCHIVE_AFTER_DAYS = int(os.getenv('ORDER_ARCHIVE_AFTER_DAYS', 90))
+    ORDER_ARCHIVE_BATCH_SIZE = int(os.getenv('ORDER_ARCHIVE_BATCH_SIZE', 500))
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -3,7 +3,10 @@ from .. import db
 
 class Cart(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    # Maintained by utils.cart_counters in the same transaction as item changes
+    item_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_amount = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -13,11 +16,8 @@ class Cart(db.Model):
 
     def __init__(self, user_id):
         self.user_id = user_id
-    
-    @property
-    def total_amount(self):
-        """Calculate total amount for all items in cart"""
-        return sum(item.total_price for item in self.items)
+        self.item_count = 0
+        self.total_amount = 0.0
     
     def to_dict(self):
         """Convert cart to dictionary"""
@@ -25,6 +25,7 @@ class Cart(db.Model):
             'id': self.id,
             'user_id': self.user_id,
             'items': [item.to_dict() for item in self.items],
+            'item_count': self.item_count,
             'total_amount': self.total_amount,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
@@ -42,6 +43,10 @@ class CartItem(db.Model):
     # Relationships
     product = db.relationship('Product', backref='cart_items')
     
+    __table_args__ = (
+        db.Index('ix_cart_item_cart_product', 'cart_id', 'product_id'),
+    )
+    
     def __init__(self, cart_id, product_id, quantity=1, negotiated_price=None):
         self.cart_id = cart_id
         self.product_id = product_id
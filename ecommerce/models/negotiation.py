@@ -18,6 +18,11 @@ class Negotiation(db.Model):
     product = db.relationship('Product', backref='negotiations')
     customer = db.relationship('User', backref='negotiations')
     
+    __table_args__ = (
+        # A customer's negotiations, and their open negotiation for a product
+        db.Index('ix_negotiation_customer_product_status', 'customer_id', 'product_id', 'status'),
+    )
+    
     def __init__(self, product_id, customer_id, initial_price, offered_price):
         self.product_id = product_id
         self.customer_id = customer_id
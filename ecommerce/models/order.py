@@ -28,6 +28,20 @@ class Order(db.Model):
     delivery_person = db.relationship('User', foreign_keys=[delivery_person_id], backref='delivery_orders')
     shop = db.relationship('Shop', foreign_keys=[shop_id], backref='orders')
     
+    __table_args__ = (
+        # Customer order lists and dashboards, filtered by status
+        db.Index('ix_order_customer_status', 'customer_id', 'status'),
+        # Shop order lists by status, newest first
+        db.Index('ix_order_shop_status_created_at', 'shop_id', 'status', 'created_at'),
+        # Delivery dashboards, including unassigned orders (delivery_person_id IS NULL)
+        db.Index('ix_order_delivery_status_updated_at', 'delivery_person_id', 'status', 'updated_at'),
+        # Admin dashboards and order lists across every shop, by status and newest first
+        db.Index('ix_order_status_created_at', 'status', 'created_at'),
+        db.Index('ix_order_created_at', 'created_at'),
+    )
+    
+    is_archived = False
+    
     def __init__(self, **kwargs):
         super(Order, self).__init__(**kwargs)
         self.status = 'pending'
@@ -97,7 +111,7 @@ class Order(db.Model):
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)
@@ -131,4 +145,66 @@ class OrderNote(db.Model):
 
     # Relationships
     order = db.relationship('Order', backref='notes')
-    user = db.relationship('User', backref='order_notes')
\ No newline at end of file
+    user = db.relationship('User', backref='order_notes')
+
+class ArchivedOrder(db.Model):
+    """A completed or cancelled order moved out of the hot order table.
+
+    Mirrors Order's columns so the order detail templates can render either
+    one; written only by utils.order_archive.
+    """
+    __tablename__ = 'order_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # Keeps the original order id
+    customer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    shop_id = db.Column(db.Integer, db.ForeignKey('shop.id'), nullable=False)
+    delivery_person_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    status = db.Column(db.String(20), nullable=False)
+    total_amount = db.Column(db.Float, nullable=False, default=0.0)
+    delivery_fee = db.Column(db.Float, nullable=False, default=5.0)
+    delivery_address = db.Column(db.String(200), nullable=True)
+    delivery_lat = db.Column(db.Float, nullable=True)
+    delivery_lng = db.Column(db.Float, nullable=True)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    estimated_delivery_time = db.Column(db.DateTime)
+    special_instructions = db.Column(db.Text)
+    payment_method = db.Column(db.String(20), nullable=False, default='cod')
+    payment_status = db.Column(db.String(20), nullable=False, default='pending')
+    payment_details = db.Column(db.JSON)
+    payment_transaction_id = db.Column(db.String(100))
+    notes = db.Column(db.JSON)  # The order's notes: [{'user_id', 'content', 'created_at'}]
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # Relationships
+    items = db.relationship('ArchivedOrderItem', backref='order', lazy=True, order_by='ArchivedOrderItem.id')
+    customer = db.relationship('User', foreign_keys=[customer_id], viewonly=True)
+    delivery_person = db.relationship('User', foreign_keys=[delivery_person_id], viewonly=True)
+    shop = db.relationship('Shop', foreign_keys=[shop_id], viewonly=True)
+
+    __table_args__ = (
+        # A customer's order history, newest first
+        db.Index('ix_order_archive_customer_created_at', 'customer_id', 'created_at'),
+        db.Index('ix_order_archive_shop_created_at', 'shop_id', 'created_at'),
+    )
+
+    is_archived = True
+    subtotal = Order.subtotal
+    to_dict = Order.to_dict
+
+
+class ArchivedOrderItem(db.Model):
+    __tablename__ = 'order_item_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # Keeps the original item id
+    order_id = db.Column(db.Integer, db.ForeignKey('order_archive.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    negotiated_price = db.Column(db.Float)
+
+    # Relationships
+    product = db.relationship('Product', viewonly=True)
+
+    subtotal = OrderItem.subtotal
+    to_dict = OrderItem.to_dict
@@ -1,6 +1,8 @@
 from datetime import datetime
+from sqlalchemy import event
 from .. import db
 from .review import Review
+from ..utils.geohash import encode_geohash
 
 class Shop(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -10,6 +12,7 @@ class Shop(db.Model):
     owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     location_lat = db.Column(db.Float, nullable=True)
     location_lng = db.Column(db.Float, nullable=True)
+    geohash = db.Column(db.String(12), index=True)  # Derived from location for nearby searches
     address = db.Column(db.String(200), nullable=True)
     # Contact information fields
     phone = db.Column(db.String(20))
@@ -34,6 +37,14 @@ class Shop(db.Model):
         self.website = website
         self.business_hours = business_hours
 
+    @staticmethod
+    def update_geohash(mapper, connection, target):
+        """SQLAlchemy event listener to keep the geohash in sync with the location"""
+        if target.location_lat is not None and target.location_lng is not None:
+            target.geohash = encode_geohash(target.location_lat, target.location_lng)
+        else:
+            target.geohash = None
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -56,6 +67,10 @@ class Shop(db.Model):
             'is_active': self.is_active
         }
 
+# Register SQLAlchemy event listeners
+event.listen(Shop, 'before_insert', Shop.update_geohash)
+event.listen(Shop, 'before_update', Shop.update_geohash)
+
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -77,6 +92,11 @@ class Product(db.Model):
     max_discount_percentage = db.Column(db.Float, default=20.0)  # Maximum allowed discount
     continue_iteration = db.Column(db.Boolean, default=False)  # Whether to continue negotiation after max discount
 
+    __table_args__ = (
+        # Serves the homepage "top rated, newest first" listing
+        db.Index('ix_product_rating_created_at', 'rating', 'created_at'),
+    )
+
     def __init__(self, name, description, price, stock, shop_id, min_price=None, max_discount_percentage=20.0, image_url=None, continue_iteration=False, category=None):
         self.name = name
         self.description = description
@@ -1,22 +1,23 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app
 from flask_login import login_required, current_user
 from flask_wtf.csrf import generate_csrf
-from sqlalchemy import func, or_
+from sqlalchemy import or_
 from functools import wraps
+from datetime import datetime
 from ..models.user import User
 from ..models.shop import Shop
 from ..models.order import Order
-from ..utils.notifications import (
-    notify_all_delivery_persons,
-    notify_admin_order_status,
-    notify_delivery_assignment,
-    notify_customer_order_status
-)
+from ..utils.outbox import enqueue, enqueue_order_status
+from ..utils.order_events import order_totals
 from ..utils.sms import send_sms
+from ..utils.pagination import keyset_paginate, InvalidCursor
+from .user import ORDER_SORTS
 from .. import db
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
+ADMIN_ORDERS_PER_PAGE = 50
+
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -30,15 +31,14 @@ def admin_required(f):
 @login_required
 @admin_required
 def dashboard():    # Calculate dashboard statistics
+    today = datetime.utcnow().date()
     stats = {
         'total_users': User.query.filter_by(role='user').count(),
         'active_shops': Shop.query.filter_by(is_active=True).count(),
         'total_delivery': User.query.filter_by(role='delivery').count(),
         'pending_orders': Order.query.filter_by(status='pending').count(),
-        'daily_revenue': Order.query.filter(
-            Order.status == 'completed',
-            func.date(Order.created_at) == func.date(func.now())
-        ).with_entities(func.sum(Order.total_amount)).scalar() or 0,
+        # Orders completed today, from the daily counters
+        'daily_revenue': order_totals('completed', day_from=today, day_to=today)[1],
         'recent_orders': Order.query.order_by(Order.created_at.desc()).limit(5).all(),
         'latest_shops': Shop.query.order_by(Shop.created_at.desc()).limit(5).all()
     }
@@ -55,7 +55,13 @@ def orders():
     if status:
         query = query.filter_by(status=status)
         
-    orders = query.order_by(Order.created_at.desc()).all()
+    # Newest first, a page at a time along the created_at indexes
+    try:
+        pagination = keyset_paginate(query, ORDER_SORTS['newest'], cursor=request.args.get('cursor'),
+                                     per_page=ADMIN_ORDERS_PER_PAGE)
+    except InvalidCursor:
+        return redirect(url_for('admin.orders', status=status))
+    orders = pagination.items
     
     # Define status color mapping for Bootstrap badges
     order_status_colors = {
@@ -68,6 +74,7 @@ def orders():
     
     return render_template('admin/orders.html', 
                          orders=orders,
+                         pagination=pagination,
                          order_status_colors=order_status_colors)
 
 @admin_bp.route('/order/<int:order_id>/details')
@@ -110,11 +117,11 @@ def assign_delivery(order_id):
         
     order.delivery_person_id = delivery_id
     order.status = 'delivering'
-    db.session.commit()
     
-    # Send notifications
-    notify_delivery_assignment(order, delivery_person)
-    notify_customer_order_status(order)
+    # Queue notifications with the assignment
+    enqueue('delivery_assignment', order_id=order.id, delivery_person_id=delivery_person.id)
+    enqueue('customer_order_status', order_id=order.id)
+    db.session.commit()
     
     return jsonify({'success': True})
 
@@ -133,6 +140,8 @@ def confirm_order(order_id):
     try:
         # Update order status to confirmed
         order.status = 'confirmed'
+        # Queue the email notification regardless of SMS status
+        enqueue('customer_order_status', order_id=order.id)
         db.session.commit()
         
         # Send SMS to customer if phone number is available
@@ -141,9 +150,6 @@ def confirm_order(order_id):
             sms_sent = send_sms(order.customer.phone, message)
         else:
             sms_sent = False
-            
-        # Send email notification regardless of SMS status
-        notify_customer_order_status(order)
         
         return jsonify({
             'status': 'success',
@@ -176,13 +182,12 @@ def update_order_status(order_id):
         if notes:
             order.notes = notes
 
-        # Send notifications
-        notify_admin_order_status(order)
-        notify_customer_order_status(order)
+        # Queue notifications
+        enqueue_order_status(order)
         
         # If order is confirmed, notify delivery persons
         if status == 'confirmed':
-            notify_all_delivery_persons(order)
+            enqueue('all_delivery_persons', message=f'Order #{order.id} is confirmed and ready for delivery.')
         
         db.session.commit()
         flash('Order status updated successfully', 'success')
@@ -202,15 +207,14 @@ def cancel_order(order_id):
     try:
         # Update order status with validation
         order.update_status('cancelled')
-        db.session.commit()
         
-        # Send notifications
-        notify_customer_order_status(order)
-        notify_admin_order_status(order, {
+        # Queue notifications with the status change
+        enqueue_order_status(order, {
             'old': 'pending',
             'new': 'cancelled',
             'action': 'order_cancelled'
         })
+        db.session.commit()
         
         return jsonify({
             'status': 'success',
@@ -3,19 +3,26 @@ from flask_login import login_required, current_user
 from ..models.user import User
 from ..models.shop import Shop, Product
 from datetime import datetime
-from ..models.order import Order, OrderItem
+from ..models.order import Order, ArchivedOrder
 from ..models.negotiation import Negotiation, DeliveryNegotiation
 from ..models.cart import Cart, CartItem
 from ..utils.ai.negotiation_bot import create_negotiation_session, create_delivery_negotiation_session, process_delivery_negotiation
-from ..utils.notifications import (
-    notify_shop_owner_new_order,
-    notify_customer_order_status,
-    notify_admin_order_status
-)
 from ..utils.distance import calculate_distance
+from ..utils.search_index import product_match_query
+from ..utils.autocomplete import get_suggestions
+from ..utils.search_cache import search_cache, suggestions_key, get_cached, set_cached
+from ..utils.pagination import keyset_paginate, keyset_paginate_merged, InvalidCursor
+from ..utils.cart_hydration import hydrate_cart, line_to_dict
+from ..utils.order_placement import place_orders
+from ..utils.idempotency import idempotent, commit_effects
+from ..utils.cart_counters import refresh_cart_counters
+from ..utils.inventory import available_stock, reserved_stock, reserve, release
+from ..utils.serializers import ORDER, InvalidFields
+from ..utils.order_archive import customer_archive_query, shop_archive_query
 from .. import db
 from sqlalchemy import or_, and_, func
 from ..routes.auth import customer_required
+from ..routes.user import ORDER_SORTS, ARCHIVED_ORDER_SORTS, NEGOTIATION_SORTS
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -171,22 +178,43 @@ def dashboard_stats():
         pending_orders = Order.query.filter_by(status='pending').count()
         active_deliveries = Order.query.filter_by(status='in_delivery').count()
         
-        # Get recent orders
-        recent_orders = Order.query.order_by(Order.created_at.desc()).limit(10).all()
+        # Get recent orders, with only the requested fields (?fields=id,status,items.product.name)
+        plan = ORDER.plan(request.args.get('fields'))
+        recent_orders = Order.query.options(*plan.load_options())\
+            .order_by(Order.created_at.desc()).limit(10).all()
         
         return jsonify({
             'status': 'success',
             'pending_orders': pending_orders,
             'active_deliveries': active_deliveries,
-            'recent_orders': [order.to_dict() for order in recent_orders]
+            'recent_orders': plan.dump_many(recent_orders)
         })
         
+    except InvalidFields as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
 
+@api_bp.route('/admin/search-cache-stats')
+@login_required
+def search_cache_stats():
+    if not current_user.is_admin:
+        return jsonify({
+            'status': 'error',
+            'message': 'Admin access required'
+        }), 403
+    
+    return jsonify({
+        'status': 'success',
+        'search_cache': search_cache.stats()
+    })
+
 @api_bp.route('/add', methods=['POST'])
 @login_required
 @customer_required  
@@ -206,16 +234,17 @@ def add_to_cart():
 
         # Validate product exists
         product = Product.query.get_or_404(product_id)
+
+        # Get user's cart
+        cart = init_cart()
         
-        # Validate product is in stock
-        if not product.stock:
+        # Validate product is in stock, ignoring what this cart already holds
+        available = available_stock([product_id], exclude_cart_id=cart.id)[product_id]
+        if not available:
             return jsonify({
                 'status': 'error',
                 'message': 'Product is out of stock'
             }), 400
-
-        # Get user's cart
-        cart = init_cart()
         
         # Check if product already in cart
         existing_item = CartItem.query.filter_by(
@@ -229,10 +258,10 @@ def add_to_cart():
             new_total_quantity += existing_item.quantity
         
         # Validate total quantity against stock
-        if product.stock < new_total_quantity:
+        if available < new_total_quantity:
             return jsonify({
                 'status': 'error', 
-                'message': f'Only {product.stock} items available'
+                'message': f'Only {available} items available'
             }), 400
             
         # Update or create cart item
@@ -249,24 +278,19 @@ def add_to_cart():
             )
             db.session.add(cart_item)
         
-        # Temporarily reduce product stock
-        product.stock -= quantity
+        # Hold the stock until checkout or until the reservation expires
+        reserve(cart.id, {product_id: new_total_quantity})
         
         db.session.commit()
         
-        # Calculate cart statistics
-        cart_count = CartItem.query.with_entities(
-            func.sum(CartItem.quantity)
-        ).filter_by(cart_id=cart.id).scalar() or 0
-        
         return jsonify({
             'status': 'success',
             'message': f'Added {quantity} {product.name} to cart',
-            'cart_count': cart_count,
+            'cart_count': cart.item_count,
             'product': {
                 'id': product.id,
                 'name': product.name,
-                'remaining_stock': product.stock
+                'remaining_stock': available - new_total_quantity
             }
         })
         
@@ -288,13 +312,15 @@ def update_cart():
         
         # Validate product exists and has enough stock
         product = Product.query.get_or_404(product_id)
-        if quantity > 0 and product.stock < quantity:
+        cart = init_cart()
+        available = available_stock(
+            [product_id], exclude_cart_id=None if isinstance(cart, dict) else cart.id
+        )[product_id]
+        if quantity > 0 and available < quantity:
             return jsonify({
                 'status': 'error',
-                'message': f'Only {product.stock} items available'
+                'message': f'Only {available} items available'
             }), 400
-
-        cart = init_cart()
         
         if isinstance(cart, dict):  # Session cart
             if quantity <= 0:
@@ -326,6 +352,7 @@ def update_cart():
                     db.session.delete(cart_item)
                 else:
                     cart_item.quantity = quantity
+                reserve(cart.id, {product_id: max(quantity, 0)})
                 db.session.commit()
             elif quantity > 0:
                 cart_item = CartItem(
@@ -334,14 +361,11 @@ def update_cart():
                     quantity=quantity
                 )
                 db.session.add(cart_item)
+                reserve(cart.id, {product_id: quantity})
                 db.session.commit()
             
-            # Calculate totals for database cart
-            cart_total = sum(
-                item.quantity * (item.negotiated_price or item.product.price)
-                for item in cart.items
-            )
-            cart_count = sum(item.quantity for item in cart.items)
+            cart_total = cart.total_amount
+            cart_count = cart.item_count
         
         return jsonify({
             'status': 'success',
@@ -379,12 +403,13 @@ def remove_from_cart():
         
         if cart_item:
             db.session.delete(cart_item)
+            release(cart.id, [product_id])
             db.session.commit()
         
         return jsonify({
             'status': 'success',
             'message': 'Item removed from cart',
-            'cart_count': sum(item.quantity for item in cart.items)
+            'cart_count': cart.item_count
         })
     except Exception as e:
         db.session.rollback()
@@ -396,6 +421,7 @@ def remove_from_cart():
 @api_bp.route('/checkout', methods=['POST'])
 @login_required
 @customer_required
+@idempotent
 def checkout():
     data = request.get_json()
     shipping = data.get('shipping', {})
@@ -440,125 +466,59 @@ def checkout():
             'message': 'Please log in to checkout'
         }), 401
     
-    if not cart.items:
-        return jsonify({
-            'status': 'error',
-            'message': 'Cart is empty'
-        }), 400
-
-    # Group cart items by shop
-    shop_orders = {}
-    for cart_item in cart.items:
-        product = cart_item.product
-        if not product:
-            continue
-            
-        if product.stock < cart_item.quantity:
-            return jsonify({
-                'status': 'error',
-                'message': f'Not enough stock for {product.name}'
-            }), 400
-            
-        if product.shop_id not in shop_orders:
-            shop_orders[product.shop_id] = []
-            
-        shop_orders[product.shop_id].append({
-            'product': product,
-            'quantity': cart_item.quantity,
-            'price': cart_item.negotiated_price or product.price
+    # Payment details are the same for every shop's order
+    payment_details = {}
+    if payment_method in ['bkash', 'nagad']:
+        payment_details['mobile_number'] = data.get(f'{payment_method}_number')
+    elif payment_method == 'card':
+        payment_details.update({
+            'card_number': data.get('card_number'),
+            'card_expiry': data.get('card_expiry'),
+            'card_cvv': data.get('card_cvv')
         })
 
     try:
-        # Create separate orders for each shop
-        orders = []
-        for shop_id, items in shop_orders.items():
-            order = Order(
-                customer_id=current_user.id,
-                shop_id=shop_id,
-                delivery_address=shipping['address'],
-                delivery_lat=shipping.get('lat'),
-                delivery_lng=shipping.get('lng'),
-                status='pending',
-                payment_method=payment_method,
-                payment_status='pending'
-            )
-            
-            # Add payment details
-            payment_details = {}
-            if payment_method in ['bkash', 'nagad']:
-                payment_details['mobile_number'] = data.get(f'{payment_method}_number')
-            elif payment_method == 'card':
-                payment_details.update({
-                    'card_number': data.get('card_number'),
-                    'card_expiry': data.get('card_expiry'),
-                    'card_cvv': data.get('card_cvv')
-                })
-            order.payment_details = payment_details
-            
-            order.special_instructions = data.get('special_instructions', '')
-            db.session.add(order)
-            
-            # Add items to order
-            total_amount = 0
-            for item in items:
-                product = item['product']
-                order_item = OrderItem(
-                    order=order,
-                    product_id=product.id,
-                    quantity=item['quantity'],
-                    price=item['price']
-                )
-                db.session.add(order_item)
-                # Update product stock
-                product.stock -= item['quantity']
-                total_amount += item['quantity'] * item['price']
-            
-            order.total_amount = total_amount
-            orders.append(order)
-        
-        # Clear cart after creating orders
-        for item in cart.items:
-            db.session.delete(item)
-        
-        db.session.commit()
-        
-        # Send notifications
-        for order in orders:
-            notify_shop_owner_new_order(order)
-            notify_customer_order_status(order)
-            notify_admin_order_status(order)
-        
+        placement = place_orders(
+            cart,
+            current_user.id,
+            delivery_address=shipping['address'],
+            delivery_lat=shipping.get('lat'),
+            delivery_lng=shipping.get('lng'),
+            payment_method=payment_method,
+            payment_status='pending',
+            payment_details=payment_details,
+            special_instructions=data.get('special_instructions', '')
+        )
+    except ValueError as e:
+        # CheckoutError for lines that cannot be ordered, InsufficientStock if the stock just ran out
         return jsonify({
-            'status': 'success',
-            'message': 'Orders placed successfully',
-            'order_ids': [order.id for order in orders]
-        })
-        
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except Exception as e:
-        db.session.rollback()
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
 
+    response = jsonify({
+        'status': 'success',
+        'message': 'Orders placed successfully',
+        'order_ids': placement.order_ids
+    })
+    response.headers['Server-Timing'] = placement.server_timing()
+    return response
+
 @api_bp.route('/cart/count')
 @login_required
 @customer_required
 def get_cart_count():
     """Get the total number of items in cart (sum of quantities)"""
     try:
-        cart = init_cart()
-        if isinstance(cart, dict):  # Session cart
-            count = sum(item['quantity'] for item in cart.values())
-            total = sum(
-                item['quantity'] * (
-                    item.get('negotiated_price', 
-                    Product.query.get(int(product_id)).price)
-                ) for product_id, item in cart.items()
-            )
-        else:  # Database cart
-            count = sum(item.quantity for item in cart.items)
-            total = cart.total_amount
+        # The counters are kept on the cart row, so this is a single read
+        counters = db.session.query(Cart.item_count, Cart.total_amount)\
+            .filter_by(user_id=current_user.id).first()
+        count, total = counters if counters else (0, 0.0)
             
         return jsonify({
             'status': 'success',
@@ -577,53 +537,8 @@ def get_cart_count():
 def get_cart_items():
     try:
         cart = init_cart()
-        items = []
-        total = 0
-        
-        if isinstance(cart, dict):  # Session cart
-            for product_id, item in cart.items():
-                product = Product.query.get(int(product_id))
-                if product:
-                    item_price = item.get('negotiated_price', product.price)
-                    item_total = item['quantity'] * item_price
-                    total += item_total
-                    
-                    items.append({
-                        'id': product.id,
-                        'name': product.name,
-                        'price': float(item_price),
-                        'original_price': float(product.price),
-                        'quantity': item['quantity'],
-                        'total': float(item_total),
-                        'image_url': product.image_url if hasattr(product, 'image_url') else None,
-                        'shop_name': product.shop.name if product.shop else None,
-                        'shop_id': product.shop_id,
-                        'stock': product.stock,
-                        'description': product.description,
-                        'is_negotiable': product.is_negotiable() if hasattr(product, 'is_negotiable') else False
-                    })
-        else:  # Database cart
-            for cart_item in cart.items:
-                product = cart_item.product
-                if product:
-                    item_price = cart_item.negotiated_price or product.price
-                    item_total = cart_item.quantity * item_price
-                    total += item_total
-                    
-                    items.append({
-                        'id': product.id,
-                        'name': product.name,
-                        'price': float(item_price),
-                        'original_price': float(product.price),
-                        'quantity': cart_item.quantity,
-                        'total': float(item_total),
-                        'image_url': product.image_url if hasattr(product, 'image_url') else None,
-                        'shop_name': product.shop.name if product.shop else None,
-                        'shop_id': product.shop_id,
-                        'stock': product.stock,
-                        'description': product.description,
-                        'is_negotiable': product.is_negotiable() if hasattr(product, 'is_negotiable') else False
-                    })
+        lines, total = hydrate_cart(cart)
+        items = [line_to_dict(line) for line in lines]
         
         return jsonify({
             'status': 'success',
@@ -718,6 +633,8 @@ def batch_delete_cart_items():
                     CartItem.cart_id == cart.id,
                     CartItem.product_id.in_(product_ids)
                 ).delete(synchronize_session=False)
+                refresh_cart_counters(cart.id)
+                release(cart.id, product_ids)
                 db.session.commit()
             except Exception as e:
                 db.session.rollback()
@@ -733,6 +650,109 @@ def batch_delete_cart_items():
             'message': str(e)
         }), 500
 
+CART_OPS = ('add', 'set', 'remove')
+MAX_CART_OPS = 100
+
+def _parse_cart_ops(ops):
+    """Validate a list of cart operations, returning (op, product_id, quantity) tuples"""
+    if not isinstance(ops, list) or not ops:
+        raise ValueError('No operations provided')
+    if len(ops) > MAX_CART_OPS:
+        raise ValueError(f'At most {MAX_CART_OPS} operations are allowed')
+    parsed = []
+    for index, op in enumerate(ops):
+        if not isinstance(op, dict) or op.get('op') not in CART_OPS:
+            raise ValueError(f'Operation {index}: op must be one of {", ".join(CART_OPS)}')
+        try:
+            product_id = int(op['product_id'])
+            quantity = int(op.get('quantity', 1 if op['op'] == 'add' else 0))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f'Operation {index}: invalid product_id or quantity')
+        if quantity < 0 or (op['op'] == 'add' and quantity == 0):
+            raise ValueError(f'Operation {index}: invalid quantity')
+        parsed.append((op['op'], product_id, quantity))
+    return parsed
+
+@api_bp.route('/cart/ops', methods=['POST'])
+@login_required
+@customer_required
+def cart_ops():
+    """Apply an ordered list of add/set/remove operations in one transaction"""
+    data = request.get_json(silent=True) or {}
+    try:
+        ops = _parse_cart_ops(data.get('ops'))
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+
+    try:
+        cart = init_cart()
+        product_ids = {product_id for _, product_id, _ in ops}
+
+        # Products, their current cart lines and other carts' reservations in one query
+        reserved = reserved_stock(product_ids, exclude_cart_id=cart.id)
+        rows = db.session.query(Product, CartItem, func.coalesce(reserved.c.quantity, 0))\
+            .outerjoin(CartItem, and_(CartItem.product_id == Product.id, CartItem.cart_id == cart.id))\
+            .outerjoin(reserved, reserved.c.product_id == Product.id)\
+            .filter(Product.id.in_(product_ids))\
+            .all()
+        products = {product.id: product for product, _, _ in rows}
+        items = {product.id: item for product, item, _ in rows if item is not None}
+        available = {product.id: max(product.stock - held, 0) for product, _, held in rows}
+        missing = product_ids - set(products)
+        if missing:
+            return jsonify({
+                'status': 'error',
+                'message': f'Product {min(missing)} not found'
+            }), 404
+
+        quantities = {product_id: item.quantity for product_id, item in items.items()}
+        for op, product_id, quantity in ops:
+            if op == 'add':
+                quantities[product_id] = quantities.get(product_id, 0) + quantity
+            elif op == 'set':
+                quantities[product_id] = quantity
+            else:
+                quantities[product_id] = 0
+
+        for product_id in product_ids:
+            product, quantity = products[product_id], quantities.get(product_id, 0)
+            previous = items[product_id].quantity if product_id in items else 0
+            if quantity > previous and quantity > available[product_id]:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'Only {available[product_id]} {product.name} available',
+                    'product_id': product_id
+                }), 400
+
+        for product_id in product_ids:
+            quantity, item = quantities.get(product_id, 0), items.get(product_id)
+            if item is not None and quantity == 0:
+                db.session.delete(item)
+            elif item is not None:
+                item.quantity = quantity
+            elif quantity > 0:
+                db.session.add(CartItem(cart_id=cart.id, product_id=product_id, quantity=quantity))
+        reserve(cart.id, {product_id: quantities.get(product_id, 0) for product_id in product_ids})
+        db.session.commit()
+
+        return jsonify({
+            'status': 'success',
+            'cart': {
+                'count': cart.item_count,
+                'total': cart.total_amount,
+                'items': {str(product_id): quantities.get(product_id, 0) for product_id in product_ids}
+            }
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
 @api_bp.route('/cart/shipping-address', methods=['GET', 'POST'])
 @login_required
 @customer_required
@@ -773,6 +793,7 @@ def cart_shipping_address():
 
 @api_bp.route('/product/<int:product_id>/negotiate', methods=['POST'])
 @login_required
+@idempotent
 def negotiate_price(product_id):
     product = Product.query.get_or_404(product_id)
     data = request.get_json()
@@ -823,7 +844,7 @@ def negotiate_price(product_id):
         negotiation.counter_price = counter_price
     
     try:
-        db.session.commit()
+        commit_effects()
         return jsonify({
             'status': 'success',
             'negotiation': {
@@ -841,6 +862,7 @@ def negotiate_price(product_id):
 
 @api_bp.route('/negotiation/<int:negotiation_id>/accept', methods=['POST'])
 @login_required
+@idempotent
 def accept_negotiation(negotiation_id):
     negotiation = Negotiation.query.get_or_404(negotiation_id)
     
@@ -866,6 +888,7 @@ def accept_negotiation(negotiation_id):
         if not cart:
             cart = Cart(user_id=current_user.id)
             db.session.add(cart)
+            db.session.flush()  # Assign cart.id for the item below
         
         # Check if product already in cart
         cart_item = CartItem.query.filter_by(
@@ -883,8 +906,9 @@ def accept_negotiation(negotiation_id):
                 negotiated_price=negotiation.final_price
             )
             db.session.add(cart_item)
+        reserve(cart.id, {negotiation.product_id: cart_item.quantity})
         
-        db.session.commit()
+        commit_effects()
         
         return jsonify({
             'status': 'success',
@@ -899,6 +923,7 @@ def accept_negotiation(negotiation_id):
 
 @api_bp.route('/negotiate/delivery/<int:order_id>', methods=['POST'])
 @login_required
+@idempotent
 def negotiate_delivery_fee(order_id):
     """Start or continue a delivery fee negotiation"""
     order = Order.query.get_or_404(order_id)
@@ -954,7 +979,7 @@ def negotiate_delivery_fee(order_id):
     else:  # counter
         negotiation.add_counter_offer(counter_fee)
         
-    db.session.commit()
+    commit_effects()
     
     return jsonify({
         'status': 'success',
@@ -974,6 +999,7 @@ def negotiate_delivery_fee(order_id):
 
 @api_bp.route('/negotiate/delivery/<int:negotiation_id>/accept', methods=['POST'])
 @login_required
+@idempotent
 def accept_delivery_negotiation(negotiation_id):
     """Accept a delivery fee counter-offer"""
     negotiation = DeliveryNegotiation.query.get_or_404(negotiation_id)
@@ -995,7 +1021,7 @@ def accept_delivery_negotiation(negotiation_id):
         negotiation.accept_offer(negotiation.counter_fee)
         # Update order with negotiated delivery fee
         negotiation.order.delivery_fee = negotiation.counter_fee
-        db.session.commit()
+        commit_effects()
         
         return jsonify({
             'status': 'success',
@@ -1016,6 +1042,32 @@ def search_suggestions():
     if not query or len(query) < 2:
         return jsonify([])
     
+    cache_key = suggestions_key(request.args)
+    cached = get_cached(cache_key)
+    if cached is not None:
+        return jsonify(cached)
+    
+    # Answer from the in-memory prefix index; the database is only queried
+    # when the index is unavailable
+    indexed = get_suggestions(query, shop_id=shop_id)
+    if indexed is not None:
+        products, shops = indexed
+        results = [{
+            'name': product['name'],
+            'type': 'product',
+            'url': url_for('shop.view', shop_id=product['shop_id'], highlight=product['id']),
+            'category': product['category'],
+            'price': product['price']
+        } for product in products]
+        results.extend({
+            'name': shop['name'],
+            'type': 'shop',
+            'url': url_for('shop.view', shop_id=shop['id'])
+        } for shop in shops)
+        results = _unique_suggestions(results)
+        set_cached(cache_key, results)
+        return jsonify(results)
+    
     # Base product query
     product_query = Product.query
     
@@ -1026,14 +1078,20 @@ def search_suggestions():
         # Only show products from active shops
         product_query = product_query.filter(Product.shop.has(Shop.is_active == True))
     
-    # Get matching products
-    products = product_query.filter(
-        or_(
-            Product.name.ilike(f'%{query}%'),
-            Product.description.ilike(f'%{query}%'),
-            Product.category.ilike(f'%{query}%')
+    # Get matching products, ranked by the full-text index when available
+    ranked = product_match_query(query)
+    if ranked is not None:
+        product_query = product_query.join(ranked, ranked.c.product_id == Product.id)\
+            .order_by(ranked.c.rank.desc(), Product.id)
+    else:
+        product_query = product_query.filter(
+            or_(
+                Product.name.ilike(f'%{query}%'),
+                Product.description.ilike(f'%{query}%'),
+                Product.category.ilike(f'%{query}%')
+            )
         )
-    ).limit(5).all()
+    products = product_query.limit(5).all()
     
     # Get matching shops if not searching within a specific shop
     shops = []
@@ -1069,15 +1127,19 @@ def search_suggestions():
             'url': url_for('shop.view', shop_id=shop.id)
         })
     
-    # Deduplicate and limit results while preserving order
+    results = _unique_suggestions(results)
+    set_cached(cache_key, results)
+    return jsonify(results)
+
+def _unique_suggestions(results, limit=5):
+    """Deduplicate suggestions by name and limit them while preserving order"""
     seen = set()
     unique_results = []
     for item in results:
         if item['name'] not in seen:
             seen.add(item['name'])
             unique_results.append(item)
-    
-    return jsonify(unique_results[:5])
+    return unique_results[:limit]
 
 @api_bp.route('/calculate-shipping', methods=['POST'])
 @login_required
@@ -1124,4 +1186,116 @@ def calculate_shipping():
         'shipping_fee': base_fee,
         'distance': max_distance,
         'is_negotiable': True
-    })
\ No newline at end of file
+    })
+
+
+def _keyset_response(query, order, serialize, per_page=20, archive=None):
+    """Return a JSON page of query results using cursor pagination.
+
+    archive is an optional (query, order) pair of archived rows merged into
+    the same list.
+    """
+    per_page = min(request.args.get('per_page', per_page, type=int), 100)
+    try:
+        if archive:
+            pagination = keyset_paginate_merged(
+                [(query, order), archive],
+                cursor=request.args.get('cursor'),
+                per_page=per_page,
+                with_total=request.args.get('with_total') == '1'
+            )
+        else:
+            pagination = keyset_paginate(
+                query,
+                order,
+                cursor=request.args.get('cursor'),
+                per_page=per_page,
+                with_total=request.args.get('with_total') == '1'
+            )
+    except InvalidCursor as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    
+    return jsonify({
+        'status': 'success',
+        'items': [serialize(item) for item in pagination.items],
+        'pagination': pagination.to_dict()
+    })
+
+def _order_summary(order):
+    return {
+        'id': order.id,
+        'shop_id': order.shop_id,
+        'customer_id': order.customer_id,
+        'status': order.status,
+        'total_amount': order.total_amount,
+        'payment_method': order.payment_method,
+        'payment_status': order.payment_status,
+        'created_at': order.created_at.isoformat(),
+        'archived': order.is_archived
+    }
+
+@api_bp.route('/orders')
+@login_required
+@customer_required
+def list_orders():
+    """Cursor-paginated order history of the current customer, archived orders included"""
+    query = Order.query.filter_by(customer_id=current_user.id)
+    archived = customer_archive_query(current_user.id)
+    status = request.args.get('status')
+    if status:
+        query = query.filter(Order.status == status)
+        archived = archived.filter(ArchivedOrder.status == status)
+    
+    sort = request.args.get('sort', 'newest')
+    if sort not in ORDER_SORTS:
+        sort = 'newest'
+    return _keyset_response(query, ORDER_SORTS[sort], _order_summary,
+                            archive=(archived, ARCHIVED_ORDER_SORTS[sort]))
+
+@api_bp.route('/shop/orders')
+@login_required
+def list_shop_orders():
+    """Cursor-paginated orders of the current shop owner's shop"""
+    if not current_user.is_shop_owner or not current_user.shop:
+        return jsonify({
+            'status': 'error',
+            'message': 'Shop owner access required'
+        }), 403
+    
+    query = Order.query.filter_by(shop_id=current_user.shop.id)
+    archived = shop_archive_query(current_user.shop.id)
+    status = request.args.get('status')
+    if status:
+        query = query.filter(Order.status == status)
+        archived = archived.filter(ArchivedOrder.status == status)
+    
+    sort = request.args.get('sort', 'newest')
+    if sort not in ORDER_SORTS:
+        sort = 'newest'
+    return _keyset_response(query, ORDER_SORTS[sort], _order_summary,
+                            archive=(archived, ARCHIVED_ORDER_SORTS[sort]))
+
+@api_bp.route('/negotiations')
+@login_required
+def list_negotiations():
+    """Cursor-paginated negotiations of the current user"""
+    query = Negotiation.query.filter(Negotiation.customer_id == current_user.id)
+    status = request.args.get('status')
+    if status:
+        query = query.filter(Negotiation.status == status)
+    
+    order = NEGOTIATION_SORTS.get(request.args.get('sort', 'newest'), NEGOTIATION_SORTS['newest'])
+    return _keyset_response(query, order, lambda negotiation: {
+        'id': negotiation.id,
+        'product_id': negotiation.product_id,
+        'initial_price': negotiation.initial_price,
+        'offered_price': negotiation.offered_price,
+        'counter_price': negotiation.counter_price,
+        'final_price': negotiation.final_price,
+        'status': negotiation.status,
+        'rounds': negotiation.rounds,
+        'created_at': negotiation.created_at.isoformat()
+    })
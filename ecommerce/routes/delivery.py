@@ -4,7 +4,8 @@ from sqlalchemy import func
 from datetime import datetime, timedelta
 from ..models.order import Order
 from ..models.user import User
-from ..utils.notifications import notify_customer_order_status, notify_admin_order_status
+from ..utils.outbox import enqueue, enqueue_order_status
+from ..utils.order_archive import orders_total, recent_orders
 from functools import wraps
 from .. import db
 
@@ -55,10 +56,9 @@ def dashboard():
         available_orders.sort(key=lambda x: x.distance)
     
     # Get completed deliveries
-    completed_deliveries = Order.query.filter_by(
-        delivery_person_id=current_user.id,
-        status='completed'
-    ).order_by(Order.updated_at.desc()).limit(10).all()
+    completed_deliveries = recent_orders(10, 'updated_at',
+                                         delivery_person_id=current_user.id,
+                                         status='completed')
     
     # Get today's stats
     today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
@@ -68,11 +68,10 @@ def dashboard():
         Order.updated_at >= today_start
     ).count()
     
-    # Calculate total earnings
-    total_earnings = db.session.query(func.sum(Order.delivery_fee))\
-        .filter(Order.delivery_person_id == current_user.id,
-                Order.status == 'completed')\
-        .scalar() or 0.0
+    # Calculate total earnings, archived deliveries included
+    total_earnings = orders_total(func.sum, 'delivery_fee',
+                                  delivery_person_id=current_user.id,
+                                  status='completed') or 0.0
     
     return render_template('delivery/dashboard.html',
                          current_delivery=current_delivery,
@@ -111,11 +110,10 @@ def accept_delivery(order_id):
     order.delivery_person_id = current_user.id
     order.status = 'delivering'
     order.estimated_delivery_time = datetime.now() + timedelta(hours=1)  # Default 1 hour estimate
-    db.session.commit()
     
-    # Send notifications
-    notify_customer_order_status(order)
-    notify_admin_order_status(order)
+    # Queue notifications
+    enqueue_order_status(order)
+    db.session.commit()
     
     return jsonify({'status': 'success'})
 
@@ -142,12 +140,10 @@ def update_delivery_status(order_id):
                 current_user.location_lat = data.get('lat')
                 current_user.location_lng = data.get('lng')
                 
+            # Queue notifications
+            enqueue_order_status(order)
             db.session.commit()
             
-            # Send notifications
-            notify_customer_order_status(order)
-            notify_admin_order_status(order)
-            
             return jsonify({
                 'status': 'success',
                 'message': f'Order status updated to {new_status}'
@@ -276,11 +272,10 @@ def confirm_assignment(order_id):
         
     if status == 'accept':
         order.status = 'delivering'
-        db.session.commit()
         
         # Notify customer and admin
-        notify_customer_order_status(order)
-        notify_admin_order_status(order)
+        enqueue_order_status(order)
+        db.session.commit()
         
         flash('Delivery assignment accepted. Please proceed with the delivery.', 'success')
         return redirect(url_for('delivery.order_details', order_id=order.id))
@@ -289,10 +284,10 @@ def confirm_assignment(order_id):
         # Reset delivery person assignment
         order.delivery_person_id = None
         order.status = 'pending'
-        db.session.commit()
         
         # Notify admin
-        notify_admin_order_status(order, change='delivery_rejected')
+        enqueue('admin_order_status', order_id=order.id, change='delivery_rejected')
+        db.session.commit()
         
         flash('Delivery assignment rejected.', 'info')
         return redirect(url_for('delivery.dashboard'))
@@ -1,30 +1,30 @@
-from flask import Blueprint, render_template, session, flash, redirect, url_for, request, current_app, send_from_directory, jsonify
+from functools import partial
+from flask import Blueprint, render_template, flash, redirect, url_for, request, current_app, send_from_directory, jsonify
 from flask_login import login_required, current_user
-from sqlalchemy import func, or_
+from sqlalchemy import or_, case
 from ..models.shop import Shop, Product
-from ..models.order import Order, OrderItem
-from ..models.cart import Cart, CartItem
 from ..routes.auth import customer_required
 from ..routes.api import init_cart, get_or_create_cart
-from ..utils.notifications import notify_shop_owner_new_order, notify_customer_order_status, notify_admin_order_status
-from .. import db
+from ..utils.cart_hydration import hydrate_cart
+from ..utils.order_placement import place_orders
+from ..utils.search_index import product_match_query
+from ..utils.distance import nearby_shops
+from ..utils.pagination import (keyset_paginate, keyset_paginate_ranked, apply_order, InvalidCursor,
+                                pagination_state, restore_pagination, LoadedPagination)
+from ..utils.search_cache import search_key, search_location, get_cached, set_cached, load_in_order
+from ..utils.facets import facet_key, search_facets
+from ..utils.trigram import fuzzy_product_ids, fuzzy_shop_ids
+from ..utils.ranking import match_query, rank_products
+from ..utils.fragments import featured_products_html
 
 main_bp = Blueprint('main', __name__)
 
 @main_bp.route('/')
 def index():
-    # Get active shops
-    featured_shops = Shop.query.filter_by(is_active=True).limit(6).all()
-    
-    # Get featured products - products with high ratings or recent additions
-    featured_products = Product.query.join(Shop)\
-        .filter(Shop.is_active == True)\
-        .order_by(Product.rating.desc(), Product.created_at.desc())\
-        .limit(3).all()  # Limit to 3 products as shown in the static example
-    
+    # Featured products (top rated, then newest) are pre-rendered and cached
+    # until a shop or product change affects them
     return render_template('main/home.html', 
-                         featured_shops=featured_shops,
-                         featured_products=featured_products,
+                         featured_products_html=featured_products_html(current_user.is_authenticated),
                          current_date="May 5, 2025")
 
 @main_bp.route('/about')
@@ -49,9 +49,8 @@ def projects():
 @customer_required
 def checkout():
     cart = get_or_create_cart()
-    if isinstance(cart, dict) and not cart:  # Empty session cart
-        return render_template('main/checkout.html', cart_items=[])
-    elif not isinstance(cart, dict) and not cart.items:  # Empty database cart
+    cart_items, total = hydrate_cart(cart)
+    if not cart_items:
         return render_template('main/checkout.html', cart_items=[])
 
     if request.method == 'POST':
@@ -74,141 +73,32 @@ def checkout():
                 return redirect(url_for('main.checkout'))
 
         try:
-            # Group items by shop
-            shop_orders = {}
-            
-            # Handle database cart
-            if not isinstance(cart, dict):
-                for cart_item in cart.items:
-                    product = cart_item.product
-                    if not product:
-                        continue
-                        
-                    if product.shop_id not in shop_orders:
-                        shop_orders[product.shop_id] = []
-                        
-                    shop_orders[product.shop_id].append({
-                        'product': product,
-                        'quantity': cart_item.quantity,
-                        'price': cart_item.negotiated_price or product.price
-                    })
-            # Handle session cart
-            else:
-                for product_id, item in cart.items():
-                    product = Product.query.get(product_id)
-                    if not product:
-                        continue
-                        
-                    if product.shop_id not in shop_orders:
-                        shop_orders[product.shop_id] = []
-                        
-                    shop_orders[product.shop_id].append({
-                        'product': product,
-                        'quantity': item['quantity'],
-                        'price': item['price']
-                    })
-
-            # Create separate orders for each shop
-            orders = []
-            for shop_id, items in shop_orders.items():
-                order = Order(
-                    customer_id=current_user.id,
-                    shop_id=shop_id,
-                    status='pending',
-                    payment_method=payment_method,
-                    special_instructions=notes
-                )
-
-                # Set delivery address if provided
-                if delivery_address:
-                    order.delivery_address = delivery_address
-                    order.delivery_lat = latitude
-                    order.delivery_lng = longitude
-
-                # Add items to order and calculate total
-                total_amount = 0
-                for item in items:
-                    order_item = OrderItem(
-                        product_id=item['product'].id,
-                        quantity=item['quantity'],
-                        price=item['price'],
-                        shop_id=shop_id
-                    )
-                    order.items.append(order_item)
-                    total_amount += item['quantity'] * item['price']
-                    
-                    # Update product stock
-                    item['product'].stock -= item['quantity']
-
-                order.total_amount = total_amount
-                db.session.add(order)
-                orders.append(order)
-
-            # Clear cart
-            if not isinstance(cart, dict):
-                for item in cart.items:
-                    db.session.delete(item)
-            else:
-                session['cart'] = {}
-
-            db.session.commit()
-
-            # Send notifications
-            for order in orders:
-                notify_shop_owner_new_order(order)
-                notify_customer_order_status(order)
-                notify_admin_order_status(order, {
-                    'old': None,
-                    'new': 'pending',
-                    'action': 'order_created'
-                })
-
-            flash('Orders placed successfully!', 'success')
-            # Redirect to the first order if multiple orders were created
-            return redirect(url_for('user.order_detail', order_id=orders[0].id))
-
+            placement = place_orders(
+                cart,
+                current_user.id,
+                lines=cart_items,
+                payment_method=payment_method,
+                special_instructions=notes,
+                delivery_address=delivery_address,
+                delivery_lat=latitude,
+                delivery_lng=longitude
+            )
         except ValueError as e:
-            db.session.rollback()
+            # Lines that cannot be ordered, or stock taken by a concurrent checkout
             flash(str(e), 'error')
             return redirect(url_for('main.checkout'))
         except Exception as e:
-            db.session.rollback()
             flash('An error occurred while placing your order. Please try again. If the problem persists, contact support.', 'error')
             print(f'Error placing order: {str(e)}')  # Log the actual error
             return redirect(url_for('main.checkout'))
 
-    # GET request - show checkout form
-    cart_items = []
-    total = 0
-    
-    # Handle database cart
-    if not isinstance(cart, dict):
-        for cart_item in cart.items:
-            product = cart_item.product
-            if product:
-                price = cart_item.negotiated_price or product.price
-                subtotal = price * cart_item.quantity
-                cart_items.append({
-                    'product': product,
-                    'quantity': cart_item.quantity,
-                    'price': price,
-                    'subtotal': subtotal
-                })
-                total += subtotal
-    # Handle session cart
-    else:
-        for product_id, item in cart.items():
-            product = Product.query.get(product_id)
-            if product:
-                subtotal = item['quantity'] * item['price']
-                cart_items.append({
-                    'product': product,
-                    'quantity': item['quantity'],
-                    'price': item['price'],
-                    'subtotal': subtotal
-                })
-                total += subtotal
+        flash('Orders placed successfully!', 'success')
+        # Redirect to the first order if multiple orders were created
+        response = redirect(url_for('user.order_detail', order_id=placement.order_ids[0]))
+        response.headers['Server-Timing'] = placement.server_timing()
+        return response
 
+    # GET request - show checkout form
     return render_template('main/checkout.html', cart_items=cart_items, total=total)
 
 @main_bp.route('/cart')
@@ -216,39 +106,7 @@ def checkout():
 @customer_required
 def cart():
     cart = get_or_create_cart()
-    cart_items = []
-    total = 0
-    
-    # Handle database cart
-    if not isinstance(cart, dict):
-        for cart_item in cart.items:
-            product = cart_item.product
-            if product:
-                price = cart_item.negotiated_price or product.price
-                subtotal = price * cart_item.quantity
-                cart_items.append({
-                    'product': product,
-                    'quantity': cart_item.quantity,
-                    'price': price,
-                    'subtotal': subtotal,
-                    'negotiated': cart_item.negotiated_price is not None
-                })
-                total += subtotal
-    # Handle session cart
-    else:
-        for product_id, item in cart.items():
-            product = Product.query.get(product_id)
-            if product:
-                subtotal = item['quantity'] * item['price']
-                cart_items.append({
-                    'product': product,
-                    'quantity': item['quantity'],
-                    'price': item['price'],
-                    'subtotal': subtotal,
-                    'negotiated': False
-                })
-                total += subtotal
-    
+    cart_items, total = hydrate_cart(cart)
     return render_template('main/cart.html', cart_items=cart_items, total=total)
 
 @main_bp.route('/static/images/<path:filename>')
@@ -264,7 +122,7 @@ def search():
     min_price = request.args.get('min_price', type=float)
     max_price = request.args.get('max_price', type=float)
     sort = request.args.get('sort', 'relevance')
-    page = request.args.get('page', 1, type=int)
+    page = request.args.get('page', type=int)
     per_page = 12  # Number of items per page
 
     # Location-based search parameters
@@ -272,48 +130,124 @@ def search():
     lng = request.args.get('lng', type=float)
     distance = request.args.get('distance', 10, type=float)  # Default 10km radius
 
+    shop = None
+    if shop_id:
+        shop = Shop.query.get_or_404(shop_id)
+        search_type = 'products'
+
+    # Popular searches repeat a lot, so the matching ids are cached per
+    # normalized parameter set and only the page itself is loaded here
+    cache_key = search_key(request.args)
+    results = get_cached(cache_key)
+    if results is None:
+        try:
+            results = _search_results(query, search_type, shop_id, category, min_price, max_price,
+                                      sort, page, per_page, *search_location(lat, lng), distance,
+                                      request.args.get('cursor'), request.args.get('shop_cursor'),
+                                      fuzzy=request.args.get('fuzzy') == '1')
+        except InvalidCursor:
+            args = request.args.to_dict()
+            args.pop('cursor', None)
+            args.pop('shop_cursor', None)
+            return redirect(url_for('main.search', **args))
+        set_cached(cache_key, results)
+
+    products_pagination = shops_pagination = None
+    if results['products'] is not None:
+        products_pagination = restore_pagination(
+            results['products'], load_in_order(Product, results['products']['ids']))
+    if results['shops'] is not None:
+        shops_pagination = restore_pagination(
+            results['shops'], load_in_order(Shop, results['shops']['ids']))
+
+    # Attach distances for display
+    shop_distances = results['distances']
+    if shop_distances is not None:
+        if shops_pagination:
+            for shop in shops_pagination.items:
+                shop.distance = shop_distances.get(shop.id)
+        if products_pagination:
+            for product in products_pagination.items:
+                product.distance = shop_distances.get(product.shop_id)
+
+    return render_template('main/search_results.html',
+                         products=products_pagination.items if products_pagination else [],
+                         shops=shops_pagination.items if shops_pagination else [],
+                         products_pagination=products_pagination,
+                         shops_pagination=shops_pagination,
+                         query=query,
+                         search_type=search_type,
+                         current_category=category,
+                         facets=results['facets'],
+                         fuzzy=results['fuzzy'],
+                         min_price=min_price,
+                         max_price=max_price,
+                         current_sort=sort,
+                         shop=shop,
+                         search_lat=lat,
+                         search_lng=lng,
+                         search_distance=distance,
+                         config={'GOOGLE_MAPS_API_KEY': current_app.config['GOOGLE_MAPS_API_KEY']})
+
+def _search_results(query, search_type, shop_id, category, min_price, max_price,
+                    sort, page, per_page, lat, lng, distance, cursor=None, shop_cursor=None,
+                    fuzzy=False):
+    """Run a search and return the page as cacheable ids, totals, distances and facets.
+
+    With fuzzy set, names are matched by trigram similarity instead, which
+    tolerates misspellings. A first page with no exact matches at all is
+    retried that way automatically.
+    """
     # Initialize queries
     product_query = Product.query.filter(Product.shop.has(Shop.is_active == True))
     shop_query = Shop.query.filter_by(is_active=True)
 
     # Apply location filter if coordinates are provided
+    shop_distances = None
     if lat is not None and lng is not None:
-        # Haversine formula for distance calculation in kilometers
-        distance_formula = (
-            6371 * func.acos(
-                func.sin(func.radians(lat)) * 
-                func.sin(func.radians(Shop.location_lat)) +
-                func.cos(func.radians(lat)) * 
-                func.cos(func.radians(Shop.location_lat)) * 
-                func.cos(func.radians(Shop.location_lng) - func.radians(lng))
-            )
-        )
-        
-        shop_query = shop_query.add_columns(
-            distance_formula.label('distance')
-        ).having(distance_formula <= distance)
-        
+        # Geohash-indexed radius search, nearest shops first
+        nearby = nearby_shops(lat, lng, distance, shop_query)
+        shop_distances = dict(nearby)
+        nearby_ids = [shop_id for shop_id, _ in nearby]
+        shop_query = shop_query.filter(Shop.id.in_(nearby_ids))
         if search_type in ['all', 'products']:
-            product_query = product_query.join(Shop).add_columns(
-                distance_formula.label('distance')
-            ).having(distance_formula <= distance)
+            product_query = product_query.filter(Product.shop_id.in_(nearby_ids))
 
     # Apply shop filter if specified
     if shop_id:
-        shop = Shop.query.get_or_404(shop_id)
         product_query = product_query.filter(Product.shop_id == shop_id)
-        search_type = 'products'
 
     # Apply text search filters
-    if query:
+    ranked = relevance = matches = None
+    fuzzy_products = fuzzy_shops = None
+    if query and fuzzy:
+        # Typo-tolerant matching on product/category and shop names, best first
         if search_type in ['all', 'products']:
-            product_query = product_query.filter(
-                or_(
-                    Product.name.ilike(f'%{query}%'),
-                    Product.description.ilike(f'%{query}%'),
-                    Product.category.ilike(f'%{query}%')
-                )
-            )
+            fuzzy_products = fuzzy_product_ids(query)
+            product_query = product_query.filter(Product.id.in_(fuzzy_products))
+        if search_type in ['all', 'shops'] and not shop_id:
+            fuzzy_shops = fuzzy_shop_ids(query)
+            shop_query = shop_query.filter(Shop.id.in_(fuzzy_shops))
+    elif query:
+        if search_type in ['all', 'products']:
+            # Relevance sorts match on the BM25 postings and are ordered by
+            # their scores once every filter is applied; other sorts only need to match
+            matches = match_query(query) if sort == 'relevance' else None
+            if matches is not None:
+                product_query = product_query.filter(Product.id.in_(matches))
+            else:
+                # Use the full-text index when available, ILIKE scan otherwise
+                ranked = product_match_query(query)
+                if ranked is not None:
+                    product_query = product_query.join(ranked, ranked.c.product_id == Product.id)
+                else:
+                    product_query = product_query.filter(
+                        or_(
+                            Product.name.ilike(f'%{query}%'),
+                            Product.description.ilike(f'%{query}%'),
+                            Product.category.ilike(f'%{query}%')
+                        )
+                    )
         
         if search_type in ['all', 'shops'] and not shop_id:
             shop_query = shop_query.filter(
@@ -324,6 +258,17 @@ def search():
                 )
             )
 
+    # Facets count the matches before the category and price filters narrow them
+    facets = None
+    if search_type != 'shops':
+        facets = search_facets(
+            product_query,
+            facet_key(query, shop_id, category, min_price, max_price, lat, lng, distance, fuzzy),
+            category=category,
+            min_price=min_price,
+            max_price=max_price
+        )
+
     # Apply product filters
     if search_type != 'shops':
         if category:
@@ -333,56 +278,91 @@ def search():
             product_query = product_query.filter(Product.price >= min_price)
         if max_price is not None:
             product_query = product_query.filter(Product.price <= max_price)
+
+        if matches is not None:
+            # Scored within the filtered matches, cached per query and filter set
+            relevance = rank_products(
+                query,
+                product_query.with_entities(Product.id).order_by(None),
+                facet_key(query, shop_id, category, min_price, max_price, lat, lng, distance, fuzzy)
+            )
         
-        # Sorting products
-        if sort == 'price_low':
-            product_query = product_query.order_by(Product.price.asc())
-        elif sort == 'price_high':
-            product_query = product_query.order_by(Product.price.desc())
-        elif sort == 'newest':
-            product_query = product_query.order_by(Product.created_at.desc())
-        else:  # relevance
-            if query:
-                from sqlalchemy import text
-                product_query = product_query.order_by(text("(CASE "
-                    "WHEN name LIKE :query THEN 3 "
-                    "WHEN category LIKE :query THEN 2 "
-                    "WHEN description LIKE :query THEN 1 "
-                    "ELSE 0 END) DESC").bindparams(query=f"%{query}%"))
+    # Sorting products; every sort ends on the id so keys are unique for keyset pagination
+    product_order = None
+    if sort == 'price_low':
+        product_order = [(Product.price, 'asc'), (Product.id, 'asc')]
+    elif sort == 'price_high':
+        product_order = [(Product.price, 'desc'), (Product.id, 'desc')]
+    elif sort == 'newest':
+        product_order = [(Product.created_at, 'desc'), (Product.id, 'desc')]
+    elif relevance is not None:
+        pass  # Paged over the ranked ids below
+    elif ranked is not None:  # relevance
+        product_order = [(ranked.c.rank, 'desc'), (Product.id, 'asc')]
+    elif fuzzy_products:
+        product_order = [(_position(Product.id, fuzzy_products), 'asc'), (Product.id, 'asc')]
+    elif query:
+        from sqlalchemy import text
+        product_query = product_query.order_by(text("(CASE "
+            "WHEN name LIKE :query THEN 3 "
+            "WHEN category LIKE :query THEN 2 "
+            "WHEN description LIKE :query THEN 1 "
+            "ELSE 0 END) DESC").bindparams(query=f"%{query}%"))
+    else:
+        product_order = [(Product.id, 'asc')]
 
     # Sort shops by distance if location provided
-    if lat is not None and lng is not None:
-        shop_query = shop_query.order_by('distance')
-
-    # Execute queries with pagination
-    products_pagination = product_query.paginate(page=page, per_page=per_page) if search_type != 'shops' else None
-    shops_pagination = shop_query.paginate(page=page, per_page=per_page) if search_type != 'products' and not shop_id else None
-
-    # Get unique categories for filter options
-    categories = db.session.query(Product.category)\
-                         .distinct()\
-                         .filter(Product.category != None)\
-                         .order_by(Product.category)\
-                         .all()
-    categories = [cat[0] for cat in categories]
-
-    return render_template('main/search_results.html',
-                         products=products_pagination.items if products_pagination else [],
-                         shops=shops_pagination.items if shops_pagination else [],
-                         products_pagination=products_pagination,
-                         shops_pagination=shops_pagination,
-                         query=query,
-                         search_type=search_type,
-                         current_category=category,
-                         categories=categories,
-                         min_price=min_price,
-                         max_price=max_price,
-                         current_sort=sort,
-                         shop=Shop.query.get(shop_id) if shop_id else None,
-                         search_lat=lat,
-                         search_lng=lng,
-                         search_distance=distance,
-                         config={'GOOGLE_MAPS_API_KEY': current_app.config['GOOGLE_MAPS_API_KEY']})
+    shop_order = [(Shop.id, 'asc')]
+    if shop_distances:
+        shop_order.insert(0, (_position(Shop.id, shop_distances), 'asc'))
+    if fuzzy_shops:
+        shop_order.insert(0, (_position(Shop.id, fuzzy_shops), 'asc'))
+
+    # Execute queries with pagination. Explicit page numbers (and the ILIKE
+    # relevance fallback, which has no sort key) use OFFSET, otherwise keyset
+    products_pagination = shops_pagination = None
+    if search_type != 'shops':
+        if relevance is not None and product_order is None:
+            if page:
+                ids = [id for id, _ in relevance[(page - 1) * per_page:page * per_page]]
+                products_pagination = LoadedPagination(page=page, per_page=per_page, error_out=False,
+                                                       items=load_in_order(Product, ids), total=len(relevance))
+            else:
+                products_pagination = keyset_paginate_ranked(relevance, cursor=cursor, per_page=per_page,
+                                                             load=partial(load_in_order, Product),
+                                                             name='relevance')
+        elif page or product_order is None:
+            if product_order:
+                product_query = apply_order(product_query, product_order)
+            products_pagination = product_query.paginate(page=page or 1, per_page=per_page)
+        else:
+            products_pagination = keyset_paginate(product_query, product_order,
+                                                  cursor=cursor,
+                                                  per_page=per_page, with_total=True)
+    if search_type != 'products' and not shop_id:
+        if page:
+            shops_pagination = apply_order(shop_query, shop_order).paginate(page=page, per_page=per_page)
+        else:
+            shops_pagination = keyset_paginate(shop_query, shop_order,
+                                               cursor=shop_cursor,
+                                               per_page=per_page, with_total=True)
+
+    if query and not fuzzy and not (page or cursor or shop_cursor) \
+            and not any(p and p.items for p in (products_pagination, shops_pagination)):
+        return _search_results(query, search_type, shop_id, category, min_price, max_price,
+                               sort, page, per_page, lat, lng, distance, fuzzy=True)
+
+    return {
+        'products': pagination_state(products_pagination) if products_pagination else None,
+        'shops': pagination_state(shops_pagination) if shops_pagination else None,
+        'distances': shop_distances,
+        'facets': facets,
+        'fuzzy': fuzzy
+    }
+
+def _position(column, ids):
+    """Sort expression placing rows in the order of ids"""
+    return case({id: position for position, id in enumerate(ids)}, value=column)
 
 @main_bp.route('/contact', methods=['GET'])
 def contact_page():
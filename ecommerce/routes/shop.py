@@ -1,6 +1,6 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app, abort, json
 from flask_login import login_required, current_user
-from sqlalchemy import func, or_, desc, asc, String
+from sqlalchemy import or_, desc, asc, String
 from functools import wraps
 from werkzeug.utils import secure_filename
 from datetime import datetime
@@ -8,7 +8,13 @@ import os
 from ..models.shop import Shop, Product
 from ..models.user import User
 from ..models.order import Order, OrderItem, OrderNote
-from ..utils.notifications import notify_customer_order_status, notify_admin_order_status, notify_delivery_person_new_order
+from ..utils.outbox import enqueue, enqueue_order_status
+from ..utils.pagination import keyset_paginate, apply_order, InvalidCursor
+from ..utils.order_stats import count_by_status, shop_key
+from ..utils.order_events import order_totals
+from ..utils.order_archive import get_order
+from ..utils.recommendations import recommended_products
+from .user import ORDER_SORTS
 from .. import db
 
 # Define allowed file extensions
@@ -66,11 +72,8 @@ def dashboard():
     ).all()
     active_orders_count = len(active_orders)
     
-    # Calculate total revenue
-    total_revenue = db.session.query(func.sum(Order.total_amount))\
-        .filter(Order.shop_id == shop.id,
-                Order.status == 'completed')\
-        .scalar() or 0.0
+    # Total revenue from the daily counters rather than the orders themselves
+    total_revenue = order_totals('completed', shop_id=shop.id)[1]
     
     # Get recent orders
     recent_orders = Order.query.filter_by(shop_id=shop.id)\
@@ -146,7 +149,7 @@ def orders():
     search_query = request.args.get('q', '').strip()
     status = request.args.get('status', '').strip()
     sort = request.args.get('sort', 'newest')
-    page = request.args.get('page', 1, type=int)
+    page = request.args.get('page', type=int)
     per_page = 10  # Number of orders per page
     
     # Base query
@@ -166,34 +169,27 @@ def orders():
                 )
             )
     
+    # Get counts for the status filter badges before applying the status filter, in one grouped query
+    status_counts = count_by_status(
+        query, cache_key=None if search_query else shop_key(shop.id)
+    )
+    
     # Apply status filter
     if status:
         query = query.filter(Order.status == status)
     
-    # Apply sorting
-    if sort == 'oldest':
-        query = query.order_by(Order.created_at.asc())
-    elif sort == 'highest':
-        query = query.order_by(Order.total_amount.desc())
-    elif sort == 'lowest':
-        query = query.order_by(Order.total_amount.asc())
-    else:  # newest
-        query = query.order_by(Order.created_at.desc())
-    
-    # Execute query with pagination
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    # Paginate results: explicit page numbers use OFFSET, otherwise keyset
+    order = ORDER_SORTS.get(sort, ORDER_SORTS['newest'])
+    if page:
+        pagination = apply_order(query, order).paginate(page=page, per_page=per_page, error_out=False)
+    else:
+        try:
+            pagination = keyset_paginate(query, order, cursor=request.args.get('cursor'),
+                                         per_page=per_page)
+        except InvalidCursor:
+            return redirect(url_for('shop.orders', q=search_query, status=status, sort=sort))
     orders = pagination.items
     
-    # Get counts for different statuses for the status filter badges
-    status_counts = {
-        'all': query.count(),
-        'pending': query.filter(Order.status == 'pending').count(),
-        'confirmed': query.filter(Order.status == 'confirmed').count(),
-        'delivering': query.filter(Order.status == 'delivering').count(),
-        'completed': query.filter(Order.status == 'completed').count(),
-        'cancelled': query.filter(Order.status == 'cancelled').count()
-    }
-    
     return render_template('shop/orders.html', 
                          orders=orders,
                          pagination=pagination,
@@ -206,7 +202,10 @@ def orders():
 @login_required
 @shop_owner_required
 def order_details(order_id):
-    order = Order.query.get_or_404(order_id)
+    # Old finished orders are read from the archive
+    order = get_order(order_id)
+    if order is None:
+        abort(404)
     if order.shop_id != current_user.shop.id:
         flash('Access denied.', 'error')
         return redirect(url_for('shop.orders'))
@@ -236,20 +235,19 @@ def update_order_status(order_id):
     new_status = data.get('status')
     
     try:
+        old_status = order.status
         if order.update_status(new_status):
-            db.session.commit()
-            
-            # Send notifications
-            notify_customer_order_status(order)
-            notify_admin_order_status(order, {
-                'old': order.status,
+            # Queue notifications with the status change
+            enqueue_order_status(order, {
+                'old': old_status,
                 'new': new_status,
                 'action': 'status_update'
             })
             
             if new_status == 'confirmed':
                 # Notify available delivery personnel
-                notify_delivery_person_new_order(order)
+                enqueue('delivery_person_new_order', order_id=order.id)
+            db.session.commit()
             
             return jsonify({
                 'status': 'success',
@@ -634,12 +632,16 @@ def product(shop_id, product_id):
     if product.shop_id != shop_id:
         abort(404)  # Product doesn't belong to this shop
     
-    # Get related products from the same shop and category
-    related_products = Product.query.filter(
-        Product.shop_id == shop_id,
-        Product.category == product.category,
-        Product.id != product_id
-    ).limit(4).all()
+    # Precomputed "customers also bought" list, topped up from the same
+    # shop and category while there is not enough order history
+    related_products = recommended_products(product_id, limit=4)
+    if len(related_products) < 4:
+        related_products += Product.query.filter(
+            Product.shop_id == shop_id,
+            Product.category == product.category,
+            Product.id != product_id,
+            Product.id.notin_([related.id for related in related_products])
+        ).limit(4 - len(related_products)).all()
     
     return render_template('shop/product_details.html',
                          shop=shop,
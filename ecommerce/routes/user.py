@@ -1,19 +1,45 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, session
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, session, abort
 from flask_login import login_required, current_user
 from sqlalchemy import func, or_, and_, desc, asc, cast, String, case
-from ..models.order import Order, OrderItem
+from ..models.order import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
 from ..models.shop import Shop, Product
 from ..models.user import User
 from ..models.cart import CartItem, Cart
 from ..models.negotiation import Negotiation
-from ..utils.notifications import notify_customer_order_status, notify_admin_order_status
 from ..utils.ai.negotiation_bot import process_negotiation
 from datetime import datetime
 from .. import db
+from ..utils.pagination import keyset_paginate, apply_order, InvalidCursor
+from ..utils.inventory import release
+from ..utils.order_stats import count_by_status, customer_key, orders_changed, ALL
+from ..utils.order_events import record_transitions
+from ..utils.order_archive import get_order, customer_archive_query, orders_total, recent_orders
 from ..routes.auth import customer_required
 
 user_bp = Blueprint('user', __name__, url_prefix='/user')
 
+# Sort keys for the order and negotiation lists; the trailing id makes each key unique
+ORDER_SORTS = {
+    'newest': [(Order.created_at, 'desc'), (Order.id, 'desc')],
+    'oldest': [(Order.created_at, 'asc'), (Order.id, 'asc')],
+    'highest': [(Order.total_amount, 'desc'), (Order.id, 'desc')],
+    'lowest': [(Order.total_amount, 'asc'), (Order.id, 'asc')]
+}
+
+ARCHIVED_ORDER_SORTS = {
+    'newest': [(ArchivedOrder.created_at, 'desc'), (ArchivedOrder.id, 'desc')],
+    'oldest': [(ArchivedOrder.created_at, 'asc'), (ArchivedOrder.id, 'asc')],
+    'highest': [(ArchivedOrder.total_amount, 'desc'), (ArchivedOrder.id, 'desc')],
+    'lowest': [(ArchivedOrder.total_amount, 'asc'), (ArchivedOrder.id, 'asc')]
+}
+
+NEGOTIATION_SORTS = {
+    'newest': [(Negotiation.created_at, 'desc'), (Negotiation.id, 'desc')],
+    'oldest': [(Negotiation.created_at, 'asc'), (Negotiation.id, 'asc')],
+    'highest_offer': [(Negotiation.offered_price, 'desc'), (Negotiation.id, 'desc')],
+    'lowest_offer': [(Negotiation.offered_price, 'asc'), (Negotiation.id, 'asc')]
+}
+
 @user_bp.route('/dashboard')
 @login_required
 def dashboard():
@@ -24,9 +50,7 @@ def dashboard():
     ).order_by(Order.created_at.desc()).all()
 
     # Get recent orders
-    recent_orders = Order.query.filter_by(
-        customer_id=current_user.id
-    ).order_by(Order.created_at.desc()).limit(5).all()
+    recent = recent_orders(5, customer_id=current_user.id)
 
     # Get cart items and total
     cart_items = []
@@ -47,13 +71,11 @@ def dashboard():
         Negotiation.status.in_(['pending', 'counter_offer'])
     ).count()
 
-    # Get order statistics
+    # Get order statistics, archived orders included
     order_stats = {
-        'total': Order.query.filter_by(customer_id=current_user.id).count(),
-        'completed': Order.query.filter_by(customer_id=current_user.id, status='completed').count(),
-        'total_spent': db.session.query(func.sum(Order.total_amount))
-            .filter_by(customer_id=current_user.id, status='completed')
-            .scalar() or 0
+        'total': orders_total(func.count, 'id', customer_id=current_user.id),
+        'completed': orders_total(func.count, 'id', customer_id=current_user.id, status='completed'),
+        'total_spent': orders_total(func.sum, 'total_amount', customer_id=current_user.id, status='completed')
     }
 
     # Format cart items for template
@@ -71,7 +93,7 @@ def dashboard():
     return render_template('user/dashboard.html',
                          active_orders=active_orders,
                          active_orders_count=len(active_orders),
-                         recent_orders=recent_orders,
+                         recent_orders=recent,
                          cart_items=formatted_cart_items,
                          cart_total=cart_total,
                          cart_count=len(formatted_cart_items),
@@ -86,7 +108,7 @@ def orders():
     search_query = request.args.get('q', '')
     status = request.args.get('status')
     sort = request.args.get('sort', 'newest')
-    page = request.args.get('page', 1, type=int)
+    page = request.args.get('page', type=int)
     per_page = 10
     
     # Base query
@@ -102,32 +124,25 @@ def orders():
             )
         ).distinct()
     
-    # Get counts for status tabs before applying status filter
-    status_counts = {
-        'all': query.count(),
-        'pending': query.filter(Order.status == 'pending').count(),
-        'confirmed': query.filter(Order.status == 'confirmed').count(),
-        'delivering': query.filter(Order.status == 'delivering').count(),
-        'completed': query.filter(Order.status == 'completed').count(),
-        'cancelled': query.filter(Order.status == 'cancelled').count()
-    }
+    # Get counts for status tabs before applying status filter, in one grouped query
+    status_counts = count_by_status(
+        query, cache_key=None if search_query else customer_key(current_user.id)
+    )
     
     # Apply status filter
     if status:
         query = query.filter_by(status=status)
     
-    # Apply sorting
-    if sort == 'oldest':
-        query = query.order_by(Order.created_at.asc())
-    elif sort == 'highest':
-        query = query.order_by(Order.total_amount.desc())
-    elif sort == 'lowest':
-        query = query.order_by(Order.total_amount.asc())
-    else:  # newest
-        query = query.order_by(Order.created_at.desc())
-    
-    # Paginate results
-    pagination = query.paginate(page=page, per_page=per_page)
+    # Paginate results: explicit page numbers use OFFSET, otherwise keyset
+    order = ORDER_SORTS.get(sort, ORDER_SORTS['newest'])
+    if page:
+        pagination = apply_order(query, order).paginate(page=page, per_page=per_page)
+    else:
+        try:
+            pagination = keyset_paginate(query, order, cursor=request.args.get('cursor'),
+                                         per_page=per_page)
+        except InvalidCursor:
+            return redirect(url_for('user.orders', q=search_query, status=status, sort=sort))
     orders = pagination.items
     
     return render_template('user/orders.html', 
@@ -136,13 +151,61 @@ def orders():
                          status_counts=status_counts,
                          current_status=status,
                          current_sort=sort,
-                         search_query=search_query)
+                         search_query=search_query,
+                         archived=False)
+
+@user_bp.route('/orders/archive')
+@login_required
+@customer_required
+def archived_orders():
+    """Completed and cancelled orders moved to the archive tables"""
+    search_query = request.args.get('q', '')
+    status = request.args.get('status')
+    sort = request.args.get('sort', 'newest')
+    page = request.args.get('page', type=int)
+    per_page = 10
+    
+    query = customer_archive_query(current_user.id)
+    if search_query:
+        query = query.join(ArchivedOrder.shop).join(ArchivedOrder.items).join(ArchivedOrderItem.product).filter(
+            or_(
+                ArchivedOrder.id.cast(String).ilike(f'%{search_query}%'),
+                Shop.name.ilike(f'%{search_query}%'),
+                Product.name.ilike(f'%{search_query}%')
+            )
+        ).distinct()
+    if status:
+        query = query.filter(ArchivedOrder.status == status)
+    
+    status_counts = count_by_status(customer_archive_query(current_user.id), model=ArchivedOrder)
+    
+    order = ARCHIVED_ORDER_SORTS.get(sort, ARCHIVED_ORDER_SORTS['newest'])
+    if page:
+        pagination = apply_order(query, order).paginate(page=page, per_page=per_page)
+    else:
+        try:
+            pagination = keyset_paginate(query, order, cursor=request.args.get('cursor'),
+                                         per_page=per_page)
+        except InvalidCursor:
+            return redirect(url_for('user.archived_orders', q=search_query, status=status, sort=sort))
+    
+    return render_template('user/orders.html',
+                         orders=pagination.items,
+                         pagination=pagination,
+                         status_counts=status_counts,
+                         current_status=status,
+                         current_sort=sort,
+                         search_query=search_query,
+                         archived=True)
 
 @user_bp.route('/order/<int:order_id>')
 @login_required
 @customer_required
 def order_detail(order_id):
-    order = Order.query.get_or_404(order_id)
+    # Old finished orders are read from the archive
+    order = get_order(order_id)
+    if order is None:
+        abort(404)
     if order.customer_id != current_user.id:
         flash('Access denied.', 'error')
         return redirect(url_for('user.orders'))
@@ -223,7 +286,7 @@ def negotiations():
     search_query = request.args.get('q', '').strip()
     status = request.args.get('status')
     sort = request.args.get('sort', 'newest')
-    page = request.args.get('page', 1, type=int)
+    page = request.args.get('page', type=int)
     per_page = 10
     
     # Base query - eager load product and shop to avoid N+1 queries
@@ -246,18 +309,16 @@ def negotiations():
     if status:
         query = query.filter(Negotiation.status == status)
     
-    # Apply sorting
-    if sort == 'oldest':
-        query = query.order_by(Negotiation.created_at.asc())
-    elif sort == 'highest_offer':
-        query = query.order_by(Negotiation.offered_price.desc())
-    elif sort == 'lowest_offer':
-        query = query.order_by(Negotiation.offered_price.asc())
-    else:  # newest
-        query = query.order_by(Negotiation.created_at.desc())
-    
-    # Paginate results
-    pagination = query.paginate(page=page, per_page=per_page)
+    # Paginate results: explicit page numbers use OFFSET, otherwise keyset
+    order = NEGOTIATION_SORTS.get(sort, NEGOTIATION_SORTS['newest'])
+    if page:
+        pagination = apply_order(query, order).paginate(page=page, per_page=per_page)
+    else:
+        try:
+            pagination = keyset_paginate(query, order, cursor=request.args.get('cursor'),
+                                         per_page=per_page)
+        except InvalidCursor:
+            return redirect(url_for('user.negotiations', sort=sort))
     negotiations = pagination.items
     
     return render_template('user/negotiations.html',
@@ -367,13 +428,18 @@ def delete_account():
         cart = Cart.query.filter_by(user_id=current_user.id).first()
         if cart:
             CartItem.query.filter_by(cart_id=cart.id).delete()
+            release(cart.id)
             db.session.delete(cart)
 
         # Delete user's negotiations
         Negotiation.query.filter_by(customer_id=current_user.id).delete()
 
         # Mark user's orders as cancelled
+        cancelled = db.session.query(Order.id, Order.shop_id, Order.status, Order.total_amount)\
+            .filter(Order.customer_id == current_user.id, Order.status != 'cancelled').all()
         Order.query.filter_by(customer_id=current_user.id).update({Order.status: 'cancelled'})
+        record_transitions(cancelled, 'cancelled')
+        orders_changed(db.session, [current_user.id], ALL)
 
         # Delete the user account
         db.session.delete(current_user._get_current_object())
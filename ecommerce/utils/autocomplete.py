@@ -0,0 +1,264 @@
+"""In-memory prefix index backing /api/search/suggestions.
+
+The index is a sorted array of (term, kind, ref_id) keys searched with
+bisect. Every word start of a product name, product category and shop name
+is a key, so "cur" finds "Chicken Curry". It is built once at startup and
+then kept current from Product/Shop mapper events, applied only after the
+surrounding transaction commits.
+
+Each process holds its own copy, so it is also rebuilt from the database
+once it is older than AUTOCOMPLETE_REFRESH_SECONDS to pick up changes
+committed by other workers. That rebuild runs in a background thread, one
+at a time, while requests keep searching the current array; only a cold
+index is built on the request path.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+from threading import Lock, RLock
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from .. import db
+from ..models.shop import Shop, Product
+from .search_index import tokenize
+
+PENDING_KEY = 'autocomplete_pending'
+DEFAULT_REFRESH_SECONDS = 300
+
+# Columns that affect what the index returns; other updates are ignored
+INDEXED_ATTRS = {
+    'shop': ('name', 'is_active'),
+    'product': ('name', 'category', 'price', 'shop_id')
+}
+
+
+def _terms(*values):
+    """Every word-start suffix of the given values, e.g. 'a b c' -> 'a b c', 'b c', 'c'"""
+    terms = set()
+    for value in values:
+        words = tokenize(value)
+        for i in range(len(words)):
+            terms.add(' '.join(words[i:]))
+    return terms
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._lock = RLock()
+        self._keys = []
+        self._entries = {}
+        self._shop_active = {}
+        self.built_at = None
+
+    @property
+    def ready(self):
+        return self.built_at is not None
+
+    def is_stale(self, max_age):
+        return not self.ready or time.monotonic() - self.built_at > max_age
+
+    def build(self):
+        """Rebuild the whole index from the database"""
+        shops = db.session.query(Shop.id, Shop.name, Shop.is_active).all()
+        products = db.session.query(
+            Product.id, Product.name, Product.category, Product.price, Product.shop_id
+        ).all()
+
+        keys = []
+        entries = {}
+        shop_active = {}
+        for shop in shops:
+            entry = self._shop_entry(shop)
+            entries[('shop', shop.id)] = entry
+            shop_active[shop.id] = bool(shop.is_active)
+            keys.extend((term, 'shop', shop.id) for term in entry['terms'])
+        for product in products:
+            entry = self._product_entry(product)
+            entries[('product', product.id)] = entry
+            keys.extend((term, 'product', product.id) for term in entry['terms'])
+        keys.sort()
+
+        with self._lock:
+            self._keys = keys
+            self._entries = entries
+            self._shop_active = shop_active
+            self.built_at = time.monotonic()
+
+    @staticmethod
+    def _shop_entry(shop):
+        return {
+            'id': shop.id,
+            'name': shop.name,
+            'shop_id': shop.id,
+            'terms': _terms(shop.name)
+        }
+
+    @staticmethod
+    def _product_entry(product):
+        return {
+            'id': product.id,
+            'name': product.name,
+            'shop_id': product.shop_id,
+            'category': product.category,
+            'price': float(product.price),
+            'terms': _terms(product.name, product.category)
+        }
+
+    def _remove(self, kind, ref_id):
+        entry = self._entries.pop((kind, ref_id), None)
+        if not entry:
+            return
+        for term in entry['terms']:
+            key = (term, kind, ref_id)
+            i = bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                del self._keys[i]
+
+    def _add(self, kind, entry):
+        self._entries[(kind, entry['id'])] = entry
+        for term in entry['terms']:
+            insort(self._keys, (term, kind, entry['id']))
+
+    def upsert(self, kind, entry, is_active=None):
+        with self._lock:
+            self._remove(kind, entry['id'])
+            self._add(kind, entry)
+            if kind == 'shop':
+                self._shop_active[entry['id']] = bool(is_active)
+
+    def remove(self, kind, ref_id):
+        with self._lock:
+            self._remove(kind, ref_id)
+            if kind == 'shop':
+                self._shop_active.pop(ref_id, None)
+
+    def search(self, query, shop_id=None, product_limit=5, shop_limit=3):
+        """Return (products, shops) whose terms start with query.
+
+        Products of inactive shops are skipped unless the search is scoped
+        to a single shop, matching the database query it replaces.
+        """
+        prefix = ' '.join(tokenize(query))
+        products, shops = [], []
+        if not prefix:
+            return products, shops
+        if shop_id:
+            shop_limit = 0
+
+        seen = set()
+        with self._lock:
+            i = bisect_left(self._keys, (prefix,))
+            while i < len(self._keys):
+                term, kind, ref_id = self._keys[i]
+                i += 1
+                if not term.startswith(prefix):
+                    break
+                if (kind, ref_id) in seen:
+                    continue
+                seen.add((kind, ref_id))
+                entry = self._entries[(kind, ref_id)]
+
+                if kind == 'product' and len(products) < product_limit:
+                    if shop_id:
+                        if entry['shop_id'] != shop_id:
+                            continue
+                    elif not self._shop_active.get(entry['shop_id']):
+                        continue
+                    products.append(entry)
+                elif kind == 'shop' and len(shops) < shop_limit:
+                    if self._shop_active.get(ref_id):
+                        shops.append(entry)
+
+                if len(products) >= product_limit and len(shops) >= shop_limit:
+                    break
+        return products, shops
+
+
+suggestion_index = PrefixIndex()
+# Held while the index is being rebuilt, so only one rebuild runs at a time
+_build_lock = Lock()
+
+
+def _rebuild(app):
+    try:
+        with app.app_context():
+            suggestion_index.build()
+    except Exception as e:
+        app.logger.error(f'Error rebuilding suggestion index: {str(e)}')
+    finally:
+        _build_lock.release()
+
+
+def get_suggestions(query, shop_id=None):
+    """Answer from the in-memory index, building it when cold and refreshing it when stale.
+
+    Returns None when the index could not be built so the caller can fall
+    back to querying the database.
+    """
+    max_age = current_app.config.get('AUTOCOMPLETE_REFRESH_SECONDS', DEFAULT_REFRESH_SECONDS)
+    if not suggestion_index.ready:
+        with _build_lock:
+            if not suggestion_index.ready:
+                try:
+                    suggestion_index.build()
+                except Exception as e:
+                    current_app.logger.error(f'Error building suggestion index: {str(e)}')
+                    return None
+    elif suggestion_index.is_stale(max_age) and _build_lock.acquire(blocking=False):
+        # Later requests keep using the current array until the rebuild swaps it
+        app = current_app._get_current_object()
+        threading.Thread(target=_rebuild, args=(app,), name='suggestion-index-rebuild', daemon=True).start()
+    return suggestion_index.search(query, shop_id=shop_id)
+
+
+def _queue(target, action):
+    """Snapshot a flushed change; it is applied once the transaction commits"""
+    session = object_session(target)
+    if session is None:
+        return
+    if isinstance(target, Shop):
+        kind, entry, is_active = 'shop', PrefixIndex._shop_entry(target), target.is_active
+    else:
+        kind, entry, is_active = 'product', PrefixIndex._product_entry(target), None
+    session.info.setdefault(PENDING_KEY, []).append((action, kind, entry, is_active))
+
+
+def on_insert(mapper, connection, target):
+    _queue(target, 'upsert')
+
+
+def on_update(mapper, connection, target):
+    kind = 'shop' if isinstance(target, Shop) else 'product'
+    state = db.inspect(target)
+    if any(state.attrs[key].history.has_changes() for key in INDEXED_ATTRS[kind]):
+        _queue(target, 'upsert')
+
+
+def on_delete(mapper, connection, target):
+    _queue(target, 'delete')
+
+
+def apply_pending(session):
+    """Fold the changes of a committed transaction into the index"""
+    pending = session.info.pop(PENDING_KEY, None)
+    if not pending or not suggestion_index.ready:
+        return
+    for action, kind, entry, is_active in pending:
+        if action == 'delete':
+            suggestion_index.remove(kind, entry['id'])
+        else:
+            suggestion_index.upsert(kind, entry, is_active)
+
+
+def discard_pending(session, *args):
+    session.info.pop(PENDING_KEY, None)
+
+
+for model in (Shop, Product):
+    event.listen(model, 'after_insert', on_insert)
+    event.listen(model, 'after_update', on_update)
+    event.listen(model, 'after_delete', on_delete)
+
+event.listen(Session, 'after_commit', apply_pending)
+event.listen(Session, 'after_soft_rollback', discard_pending)
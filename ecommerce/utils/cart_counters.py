@@ -0,0 +1,124 @@
+"""Denormalized item count and total on each Cart.
+
+``Cart.item_count`` (sum of quantities) and ``Cart.total_amount`` are
+recomputed inside the flush that changes a cart's items, and for every cart
+holding a product whose price changed, so they commit or roll back together
+with the change and the cart badge is a single row read.
+
+Bulk ``query.delete()`` calls bypass the ORM events; callers follow them
+with refresh_cart_counters(). reconcile_cart_counters() finds and repairs
+carts whose stored counters have drifted anyway.
+"""
+from sqlalchemy import event, func, select, update
+from sqlalchemy.orm import Session
+from .. import db
+from ..models.cart import Cart, CartItem
+from ..models.shop import Product
+
+DIRTY_KEY = 'cart_counters_dirty'
+PRICE_KEY = 'cart_counters_repriced'
+
+
+def _count_expr():
+    return select(func.coalesce(func.sum(CartItem.quantity), 0))\
+        .where(CartItem.cart_id == Cart.id)\
+        .scalar_subquery()
+
+
+def _total_expr():
+    price = func.coalesce(CartItem.negotiated_price, Product.price)
+    return select(func.coalesce(func.sum(CartItem.quantity * price), 0.0))\
+        .join(Product, Product.id == CartItem.product_id)\
+        .where(CartItem.cart_id == Cart.id)\
+        .scalar_subquery()
+
+
+def _recompute(conn, condition):
+    conn.execute(
+        update(Cart.__table__)
+        .where(condition)
+        .values(item_count=_count_expr(), total_amount=_total_expr())
+    )
+
+
+def _expire(session, cart_ids=None):
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, Cart) and (cart_ids is None or obj.id in cart_ids):
+            session.expire(obj, ['item_count', 'total_amount'])
+
+
+def refresh_cart_counters(cart_id):
+    """Recompute one cart's counters in the current transaction"""
+    _recompute(db.session.connection(), Cart.id == cart_id)
+    _expire(db.session, {cart_id})
+
+
+def reconcile_cart_counters(fix=True):
+    """Return ids of carts whose stored counters disagree with their items.
+
+    With fix=True the stale carts are recomputed; the caller commits.
+    """
+    count, total = _count_expr(), _total_expr()
+    stale = db.session.execute(
+        select(Cart.id).where(
+            (Cart.item_count != count) | (func.abs(Cart.total_amount - total) > 0.005)
+        ).order_by(Cart.id)
+    ).scalars().all()
+    if fix and stale:
+        _recompute(db.session.connection(), Cart.id.in_(stale))
+        _expire(db.session, set(stale))
+    return stale
+
+
+def _mark_cart(session, target):
+    if session is not None and target.cart_id is not None:
+        session.info.setdefault(DIRTY_KEY, set()).add(target.cart_id)
+
+
+def _on_item_change(mapper, connection, target):
+    _mark_cart(db.inspect(target).session, target)
+
+
+def _on_item_update(mapper, connection, target):
+    state = db.inspect(target)
+    if any(state.attrs[key].history.has_changes() for key in ('quantity', 'negotiated_price', 'cart_id')):
+        _mark_cart(state.session, target)
+        # An item moved between carts also changes the cart it left
+        for cart_id in state.attrs.cart_id.history.deleted:
+            if cart_id is not None:
+                state.session.info.setdefault(DIRTY_KEY, set()).add(cart_id)
+
+
+def _on_product_update(mapper, connection, target):
+    state = db.inspect(target)
+    if state.session is not None and state.attrs.price.history.has_changes():
+        state.session.info.setdefault(PRICE_KEY, set()).add(target.id)
+
+
+def _apply_after_flush(session, flush_context):
+    cart_ids = session.info.pop(DIRTY_KEY, None)
+    product_ids = session.info.pop(PRICE_KEY, None)
+    if not cart_ids and not product_ids:
+        return
+    conn = session.connection()
+    if cart_ids:
+        _recompute(conn, Cart.id.in_(cart_ids))
+    if product_ids:
+        _recompute(conn, Cart.id.in_(
+            select(CartItem.cart_id).where(CartItem.product_id.in_(product_ids))
+        ))
+    _expire(session, None if product_ids else cart_ids)
+
+
+def _discard_after_rollback(session, previous_transaction):
+    session.info.pop(DIRTY_KEY, None)
+    session.info.pop(PRICE_KEY, None)
+
+
+event.listen(CartItem, 'after_insert', _on_item_change)
+event.listen(CartItem, 'after_delete', _on_item_change)
+event.listen(CartItem, 'after_update', _on_item_update)
+event.listen(Product, 'after_update', _on_product_update)
+
+event.listen(Session, 'after_flush_postexec', _apply_after_flush)
+event.listen(Session, 'after_soft_rollback', _discard_after_rollback)
@@ -0,0 +1,70 @@
+"""Load everything needed to display a cart in one query.
+
+Both cart flavours (a database Cart for signed-in customers, the session
+dict otherwise) are turned into the same list of CartLine tuples, with each
+product's shop eagerly loaded alongside it, so rendering a cart no longer
+costs a query per line.
+"""
+from collections import namedtuple
+from sqlalchemy.orm import contains_eager
+from ..models.cart import CartItem
+from ..models.shop import Product
+
+CartLine = namedtuple('CartLine', 'product quantity price negotiated subtotal')
+
+
+def _line(product, quantity, negotiated_price):
+    price = negotiated_price or product.price
+    return CartLine(product, quantity, price, negotiated_price is not None, price * quantity)
+
+
+def hydrate_cart(cart):
+    """Return (lines, total) for a database Cart or a session cart dict.
+
+    Lines whose product no longer exists are skipped. Session carts are
+    priced at the current product price unless a negotiated price was
+    agreed, the same as database carts.
+    """
+    if isinstance(cart, dict):
+        entries = {int(product_id): item for product_id, item in cart.items()}
+        products = {}
+        if entries:
+            products = {
+                product.id: product
+                for product in Product.query.outerjoin(Product.shop)
+                .options(contains_eager(Product.shop))
+                .filter(Product.id.in_(entries))
+            }
+        lines = [
+            _line(products[product_id], item['quantity'], item.get('negotiated_price'))
+            for product_id, item in entries.items() if product_id in products
+        ]
+    else:
+        cart_items = CartItem.query.join(CartItem.product).outerjoin(Product.shop)\
+            .options(contains_eager(CartItem.product).contains_eager(Product.shop))\
+            .filter(CartItem.cart_id == cart.id)\
+            .order_by(CartItem.id)\
+            .all()
+        lines = [_line(item.product, item.quantity, item.negotiated_price) for item in cart_items]
+    return lines, sum(line.subtotal for line in lines)
+
+
+def line_to_dict(line):
+    """Serialize a CartLine for the cart API"""
+    product = line.product
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': float(line.price),
+        'original_price': float(product.price),
+        'quantity': line.quantity,
+        'total': float(line.subtotal),
+        'subtotal': float(line.subtotal),
+        'image_url': product.image_url,
+        'shop_name': product.shop.name if product.shop else None,
+        'shop_id': product.shop_id,
+        'stock': product.stock,
+        'description': product.description,
+        'is_negotiable': product.is_negotiable(),
+        'negotiated': line.negotiated
+    }
@@ -1,4 +1,6 @@
 from math import radians, sin, cos, sqrt, atan2
+from sqlalchemy import and_, or_
+from .geohash import bounding_box, covering_prefixes
 
 def calculate_distance(lat1, lon1, lat2, lon2):
     """
@@ -36,4 +38,36 @@ def estimate_travel_time(distance, transport_mode='car'):
     
     speed = speeds.get(transport_mode, speeds['car'])
     time_hours = distance / speed
-    return round(time_hours * 60)  # Convert to minutes
\ No newline at end of file
+    return round(time_hours * 60)  # Convert to minutes
+
+def nearby_shops(lat, lng, radius_km, query=None):
+    """
+    Return [(shop_id, distance_km)] for shops within radius_km, nearest first.
+
+    Candidates are pre-filtered in SQL with geohash prefix ranges and the
+    bounding box, both served by indexes, so only nearby rows are read.
+    The exact haversine distance is then computed for those candidates only.
+    """
+    from ..models.shop import Shop
+
+    south, west, north, east = bounding_box(lat, lng, radius_km)
+    cells = [
+        and_(Shop.geohash >= prefix, Shop.geohash < prefix + '{')  # '{' sorts right after 'z'
+        for prefix in covering_prefixes(south, west, north, east)
+    ]
+
+    if query is None:
+        query = Shop.query
+    candidates = query.with_entities(Shop.id, Shop.location_lat, Shop.location_lng).filter(
+        or_(*cells),
+        Shop.location_lat.between(south, north),
+        Shop.location_lng.between(west, east)
+    ).all()
+
+    results = []
+    for shop_id, shop_lat, shop_lng in candidates:
+        distance = calculate_distance(lat, lng, shop_lat, shop_lng)
+        if distance <= radius_km:
+            results.append((shop_id, distance))
+    results.sort(key=lambda item: (item[1], item[0]))
+    return results
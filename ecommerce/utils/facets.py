@@ -0,0 +1,123 @@
+"""Search facets computed in a single grouped query.
+
+The facet query groups the matching products by (category, price bucket,
+shop) plus a flag for whether the row passes the price filter, and the
+counts for each facet are rolled up from those few rows in Python. Each
+facet ignores its own filter, so the sidebar can still offer the other
+categories and price ranges while one of them is selected.
+"""
+from flask import current_app
+from sqlalchemy import and_, case, func, literal
+from ..models.shop import Shop, Product
+from .cache import TTLCache
+
+# Upper bounds of the price buckets in ৳; the last bucket is open ended
+DEFAULT_PRICE_BUCKETS = (100, 250, 500, 1000, 2500, 5000)
+# Smallest price step; a bucket's link filters up to its bound minus this,
+# since buckets exclude their upper bound and max_price includes it
+PRICE_STEP = 0.01
+DEFAULT_TTL = 30
+MAX_SHOPS = 10
+
+_facet_cache = TTLCache(ttl=DEFAULT_TTL, maxsize=512)
+
+
+def price_buckets():
+    return tuple(current_app.config.get('SEARCH_PRICE_BUCKETS', DEFAULT_PRICE_BUCKETS))
+
+
+def facet_key(query='', shop_id=None, category=None, min_price=None, max_price=None,
+              lat=None, lng=None, distance=None, fuzzy=False):
+    """Normalize the search filters into a cache key"""
+    location = None
+    if lat is not None and lng is not None:
+        location = (round(lat, 3), round(lng, 3), distance)
+    return (
+        ' '.join((query or '').lower().split()),
+        shop_id,
+        category or None,
+        min_price,
+        max_price,
+        location,
+        fuzzy,
+        price_buckets()
+    )
+
+
+def search_facets(product_query, key, category=None, min_price=None, max_price=None):
+    """Return facet counts for product_query, cached per normalized filter set.
+
+    product_query must carry every search filter except category and price,
+    which are passed separately so each facet can leave its own filter out.
+    """
+    facets = _facet_cache.get(key)
+    if facets is None:
+        facets = _compute_facets(product_query, category, min_price, max_price)
+        _facet_cache.set(key, facets)
+    return facets
+
+
+def clear_facet_cache():
+    _facet_cache.clear()
+
+
+def _compute_facets(product_query, category, min_price, max_price):
+    bounds = price_buckets()
+    bucket = case(
+        *[(Product.price < upper, index) for index, upper in enumerate(bounds)],
+        else_=len(bounds)
+    ).label('bucket')
+
+    price_filters = []
+    if min_price is not None:
+        price_filters.append(Product.price >= min_price)
+    if max_price is not None:
+        price_filters.append(Product.price <= max_price)
+
+    group_by = [Product.category, bucket, Product.shop_id]
+    if price_filters:
+        in_price = case((and_(*price_filters), 1), else_=0).label('in_price')
+        group_by.append(in_price)
+    else:
+        in_price = literal(1).label('in_price')
+
+    rows = product_query.order_by(None)\
+        .with_entities(Product.category, bucket, Product.shop_id, in_price, func.count(Product.id))\
+        .group_by(*group_by)\
+        .all()
+
+    categories = {}
+    bucket_counts = [0] * (len(bounds) + 1)
+    shop_counts = {}
+    total = 0
+    for row_category, row_bucket, row_shop_id, row_in_price, count in rows:
+        in_category = not category or row_category == category
+        if row_in_price and row_category is not None:
+            categories[row_category] = categories.get(row_category, 0) + count
+        if in_category:
+            bucket_counts[row_bucket] += count
+        if in_category and row_in_price:
+            shop_counts[row_shop_id] = shop_counts.get(row_shop_id, 0) + count
+            total += count
+
+    top_shops = sorted(shop_counts.items(), key=lambda item: (-item[1], item[0]))[:MAX_SHOPS]
+    names = {}
+    if top_shops:
+        names = dict(Shop.query.with_entities(Shop.id, Shop.name)
+                     .filter(Shop.id.in_([shop_id for shop_id, _ in top_shops])))
+
+    lowers = (0,) + bounds
+    uppers = bounds + (None,)
+    return {
+        'total': total,
+        'categories': sorted(categories.items(), key=lambda item: (-item[1], item[0])),
+        'price_buckets': [
+            {'min': lowers[i], 'max': uppers[i], 'count': count,
+             'max_price': round(uppers[i] - PRICE_STEP, 2) if uppers[i] is not None else None}
+            for i, count in enumerate(bucket_counts) if count
+        ],
+        'shops': [
+            {'id': shop_id, 'name': names.get(shop_id), 'count': count}
+            for shop_id, count in top_shops
+        ]
+    }
@@ -0,0 +1,94 @@
+"""Pre-rendered HTML fragments for the homepage.
+
+The featured products section is rendered once per variant (signed in or
+not, since the buttons differ) and kept until a committed Shop or Product
+change could alter it, so the homepage is served without touching the
+database. Changes committed by other workers are picked up once the cached
+copy expires after DEFAULT_TTL seconds.
+"""
+from flask import render_template
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .. import db
+from ..models.shop import Shop, Product
+from .cache import TTLCache
+
+DIRTY_KEY = 'homepage_fragments_dirty'
+FEATURED_PRODUCTS_LIMIT = 3
+DEFAULT_TTL = 300
+
+# Product columns shown in the featured section or used to pick it
+FEATURED_ATTRS = ('name', 'price', 'stock', 'image_url', 'category', 'shop_id')
+RANKING_ATTRS = ('rating', 'rating_count', 'created_at')
+
+_fragments = TTLCache(ttl=DEFAULT_TTL, maxsize=16)
+# Ids of the products in the cached section, so unrelated edits keep it
+_featured_ids = set()
+
+
+def _render_featured_products():
+    products = Product.query.join(Shop)\
+        .filter(Shop.is_active == True)\
+        .order_by(Product.rating.desc(), Product.created_at.desc())\
+        .limit(FEATURED_PRODUCTS_LIMIT).all()
+    _featured_ids.update(product.id for product in products)
+    return Markup(render_template('main/_featured_products.html', featured_products=products))
+
+
+def featured_products_html(authenticated):
+    """Return the featured products section for signed-in or anonymous visitors"""
+    return _fragments.get_or_set(('featured_products', bool(authenticated)), _render_featured_products)
+
+
+def invalidate_fragments():
+    _fragments.clear()
+    _featured_ids.clear()
+
+
+def _mark_dirty(target):
+    session = db.inspect(target).session
+    if session is not None:
+        session.info[DIRTY_KEY] = True
+
+
+def products_changed(session, product_ids):
+    """Invalidate on commit if a bulk UPDATE touched a featured product"""
+    if _featured_ids.intersection(product_ids):
+        session.info[DIRTY_KEY] = True
+
+
+def _on_change(mapper, connection, target):
+    _mark_dirty(target)
+
+
+def _on_shop_update(mapper, connection, target):
+    if db.inspect(target).attrs.is_active.history.has_changes():
+        _mark_dirty(target)
+
+
+def _on_product_update(mapper, connection, target):
+    state = db.inspect(target)
+    changed = lambda attrs: any(state.attrs[key].history.has_changes() for key in attrs)
+    # A rating change can promote any product; other edits only matter when shown
+    if changed(RANKING_ATTRS) or (target.id in _featured_ids and changed(FEATURED_ATTRS)):
+        _mark_dirty(target)
+
+
+def _invalidate_after_commit(session):
+    if session.info.pop(DIRTY_KEY, False):
+        invalidate_fragments()
+
+
+def _discard_after_rollback(session, previous_transaction):
+    session.info.pop(DIRTY_KEY, None)
+
+
+for model in (Shop, Product):
+    event.listen(model, 'after_insert', _on_change)
+    event.listen(model, 'after_delete', _on_change)
+event.listen(Shop, 'after_update', _on_shop_update)
+event.listen(Product, 'after_update', _on_product_update)
+
+event.listen(Session, 'after_commit', _invalidate_after_commit)
+event.listen(Session, 'after_soft_rollback', _discard_after_rollback)
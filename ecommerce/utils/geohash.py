@@ -0,0 +1,84 @@
+"""Geohash helpers for the shop location index.
+
+A geohash interleaves longitude and latitude bits into a base32 string, so
+points that share a prefix lie in the same grid cell. Storing it in an
+indexed column turns "shops near here" into a handful of prefix range scans.
+"""
+from math import cos, radians
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION = 9  # ~5m cells, plenty for shop locations
+KM_PER_DEGREE = 111.32
+MAX_COVER_CELLS = 16
+
+
+def encode_geohash(lat, lng, precision=PRECISION):
+    """Encode a coordinate as a geohash string"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_range[0] + lng_range[1]) / 2
+            if lng >= mid:
+                bits = (bits << 1) | 1
+                lng_range[0] = mid
+            else:
+                bits <<= 1
+                lng_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """Return (height, width) in degrees of a cell at the given precision"""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def bounding_box(lat, lng, radius_km):
+    """Return (south, west, north, east) enclosing a circle of radius_km"""
+    dlat = radius_km / KM_PER_DEGREE
+    dlng = radius_km / (KM_PER_DEGREE * max(cos(radians(lat)), 0.01))
+    return (
+        max(lat - dlat, -90.0),
+        max(lng - dlng, -180.0),
+        min(lat + dlat, 90.0),
+        min(lng + dlng, 180.0)
+    )
+
+
+def covering_prefixes(south, west, north, east, max_cells=MAX_COVER_CELLS):
+    """Return geohash prefixes of the finest grid covering the box with at most max_cells cells"""
+    for precision in range(PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = range(int((south + 90) // height), int((north + 90) // height) + 1)
+        cols = range(int((west + 180) // width), int((east + 180) // width) + 1)
+        if len(rows) * len(cols) <= max_cells or precision == 1:
+            break
+
+    prefixes = set()
+    for row in rows:
+        for col in cols:
+            center_lat = min(-90 + (row + 0.5) * height, 90.0)
+            center_lng = min(-180 + (col + 0.5) * width, 180.0)
+            prefixes.add(encode_geohash(center_lat, center_lng, precision))
+    return sorted(prefixes)
@@ -0,0 +1,185 @@
+"""Idempotency-Key support for endpoints that must not run twice.
+
+A client that may retry a request sends the same ``Idempotency-Key``
+header with every attempt. The first attempt claims the key for the
+current user; once it succeeds its response is stored and later attempts
+with that key get the stored response back, marked with an
+``Idempotent-Replayed`` header, without running the view again. Reusing a
+key for a different request answers 422, and keys whose first attempt
+failed without committing are freed so the client can retry.
+
+The view commits its effects with commit_effects(), which marks the key as
+committed in the same transaction, so whether its writes happened is
+never in doubt. Other commits the view makes on the way (creating the
+user's cart, say) leave the key unmarked. A key that is still
+being processed answers 409, and so does a committed key whose response
+was lost, e.g. because the process died before storing it: neither is
+ever run again. Keys are kept for IDEMPOTENCY_TTL seconds and then
+deleted by purge_expired_keys(), which the background reaper runs.
+"""
+import hashlib
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import current_app, jsonify, request
+from flask_login import current_user
+from sqlalchemy import delete, event, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .. import db
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 128
+DEFAULT_TTL = 24 * 3600
+CLAIMED_KEY = 'idempotency_claim'
+PENDING_KEY = 'idempotency_commit'
+
+idempotency_key = db.Table(
+    'idempotency_key',
+    db.Column('user_id', db.Integer, primary_key=True),
+    db.Column('key', db.String(MAX_KEY_LENGTH), primary_key=True),
+    db.Column('request_hash', db.String(64), nullable=False),
+    db.Column('status_code', db.Integer),  # Null while the first attempt is running
+    db.Column('committed_at', db.DateTime),  # Set by the commit of the first attempt's writes
+    db.Column('content_type', db.String(100)),
+    db.Column('body', db.LargeBinary),
+    db.Column('created_at', db.DateTime, nullable=False),
+    db.Column('expires_at', db.DateTime, nullable=False, index=True)
+)
+
+
+def _request_hash():
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.path.encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _error(message, code):
+    return jsonify({
+        'status': 'error',
+        'message': message
+    }), code
+
+
+def _key_filter(user_id, key):
+    return (idempotency_key.c.user_id == user_id, idempotency_key.c.key == key)
+
+
+def _claim(user_id, key, request_hash):
+    """Insert the in-progress row, returning the existing row if the key is taken"""
+    now = datetime.utcnow()
+    ttl = timedelta(seconds=current_app.config.get('IDEMPOTENCY_TTL', DEFAULT_TTL))
+    where = _key_filter(user_id, key)
+    try:
+        with db.engine.begin() as conn:
+            # Only expired keys are claimed again; an unfinished attempt may still commit
+            conn.execute(delete(idempotency_key).where(*where, idempotency_key.c.expires_at <= now))
+            conn.execute(insert(idempotency_key).values(
+                user_id=user_id, key=key, request_hash=request_hash, created_at=now, expires_at=now + ttl
+            ))
+        return None
+    except IntegrityError:
+        with db.engine.connect() as conn:
+            return conn.execute(select(idempotency_key).where(*where)).first()
+
+
+def _mark_committed(session):
+    # Runs inside the view's transaction, so the mark commits exactly with its writes
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending is not None:
+        session.connection().execute(
+            update(idempotency_key)
+            .where(*_key_filter(*pending), idempotency_key.c.committed_at == None)
+            .values(committed_at=datetime.utcnow())
+        )
+
+
+event.listen(Session, 'before_commit', _mark_committed)
+
+
+def commit_effects():
+    """Commit the session, marking the request's Idempotency-Key as committed with it.
+
+    Use for the commit that carries the request's effects; a no-op mark
+    for requests without a key.
+    """
+    session = db.session()
+    claim = session.info.get(CLAIMED_KEY)
+    if claim is not None:
+        session.info[PENDING_KEY] = claim
+    try:
+        session.commit()
+    finally:
+        session.info.pop(PENDING_KEY, None)
+
+
+def _store(user_id, key, response):
+    with db.engine.begin() as conn:
+        conn.execute(
+            update(idempotency_key)
+            .where(*_key_filter(user_id, key))
+            .values(status_code=response.status_code, content_type=response.content_type,
+                    body=response.get_data())
+        )
+
+
+def _release(user_id, key):
+    """Free the key unless the attempt's writes were committed"""
+    with db.engine.begin() as conn:
+        return conn.execute(delete(idempotency_key).where(
+            *_key_filter(user_id, key), idempotency_key.c.committed_at == None
+        )).rowcount
+
+
+def purge_expired_keys():
+    """Delete expired keys, returning how many were removed"""
+    with db.engine.begin() as conn:
+        return conn.execute(
+            delete(idempotency_key).where(idempotency_key.c.expires_at <= datetime.utcnow())
+        ).rowcount
+
+
+def idempotent(view):
+    """Replay the stored response for requests repeating an Idempotency-Key.
+
+    Apply below login_required; requests without the header run as usual.
+    The view must commit its effects with commit_effects().
+    """
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return _error(f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters', 400)
+
+        user_id = current_user.id
+        request_hash = _request_hash()
+        existing = _claim(user_id, key, request_hash)
+        if existing is not None:
+            if existing.request_hash != request_hash:
+                return _error(f'{HEADER} was already used for a different request', 422)
+            if existing.status_code is None:
+                if existing.committed_at is not None:
+                    return _error('A request with this key was already processed', 409)
+                return _error('A request with this key is still being processed', 409)
+            replay = current_app.response_class(existing.body, status=existing.status_code,
+                                                content_type=existing.content_type)
+            replay.headers['Idempotent-Replayed'] = 'true'
+            return replay
+
+        session = db.session()
+        session.info[CLAIMED_KEY] = (user_id, key)
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except Exception:
+            session.info.pop(CLAIMED_KEY, None)
+            _release(user_id, key)
+            raise
+        session.info.pop(CLAIMED_KEY, None)
+        # A failed attempt that still committed keeps its key, with the response to replay
+        if 200 <= response.status_code < 300 or not _release(user_id, key):
+            _store(user_id, key, response)
+        return response
+    return decorated_function
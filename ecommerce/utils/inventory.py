@@ -0,0 +1,179 @@
+"""Time-bounded stock reservations for cart lines.
+
+Adding a product to a cart reserves the line's quantity for
+RESERVATION_TTL seconds instead of decrementing ``Product.stock``. The
+stock a customer can still add is the product's stock minus the unexpired
+reservations of other carts; expired reservations simply stop counting and
+are deleted in bulk by release_expired(), which the reservation reaper
+thread runs every RESERVATION_REAP_INTERVAL seconds. Checkout decrements
+the stock for real and drops the cart's reservations in the same
+transaction, taking it with conditional UPDATEs (decrement_stock) so
+concurrent checkouts cannot sell the same unit twice, nor units other
+carts still hold reservations for.
+"""
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import case, delete, func, insert, select, update
+from .. import db
+from ..models.shop import Product
+from .fragments import products_changed
+
+DEFAULT_TTL = 15 * 60
+DEFAULT_REAP_INTERVAL = 60
+
+stock_reservation = db.Table(
+    'stock_reservation',
+    db.Column('cart_id', db.Integer, db.ForeignKey('cart.id'), primary_key=True),
+    db.Column('product_id', db.Integer, db.ForeignKey('product.id'), primary_key=True),
+    db.Column('quantity', db.Integer, nullable=False),
+    db.Column('expires_at', db.DateTime, nullable=False, index=True),
+    db.Index('ix_stock_reservation_product_expires', 'product_id', 'expires_at')
+)
+
+
+class InsufficientStock(ValueError):
+    """Raised when a product no longer has the stock a checkout asked for"""
+
+    def __init__(self, product_id, name=None):
+        super().__init__(f'Not enough stock for {name or f"product {product_id}"}')
+        self.product_id = product_id
+
+
+def _ttl():
+    return timedelta(seconds=current_app.config.get('RESERVATION_TTL', DEFAULT_TTL))
+
+
+def reserved_stock(product_ids, exclude_cart_id=None):
+    """Subquery of (product_id, quantity) unexpired reservations for product_ids"""
+    reserved = select(
+        stock_reservation.c.product_id,
+        func.sum(stock_reservation.c.quantity).label('quantity')
+    ).where(
+        stock_reservation.c.product_id.in_(product_ids),
+        stock_reservation.c.expires_at > datetime.utcnow()
+    )
+    if exclude_cart_id is not None:
+        reserved = reserved.where(stock_reservation.c.cart_id != exclude_cart_id)
+    return reserved.group_by(stock_reservation.c.product_id).subquery()
+
+
+def available_stock(product_ids, exclude_cart_id=None):
+    """Return {product_id: stock not reserved by other carts} for product_ids.
+
+    Reservations held by exclude_cart_id are not subtracted, so a cart can
+    always keep what it already reserved.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+    reserved = reserved_stock(product_ids, exclude_cart_id)
+    rows = db.session.execute(
+        select(Product.id, Product.stock - func.coalesce(reserved.c.quantity, 0))
+        .outerjoin(reserved, reserved.c.product_id == Product.id)
+        .where(Product.id.in_(product_ids))
+    )
+    return {product_id: max(available, 0) for product_id, available in rows}
+
+
+def reserve(cart_id, quantities):
+    """Set the cart's reservations to {product_id: quantity}, renewing their expiry.
+
+    A quantity of 0 releases the product. Runs in the current transaction;
+    the caller checks availability first and commits.
+    """
+    if not quantities:
+        return
+    db.session.execute(
+        delete(stock_reservation).where(
+            stock_reservation.c.cart_id == cart_id,
+            stock_reservation.c.product_id.in_(list(quantities))
+        )
+    )
+    expires_at = datetime.utcnow() + _ttl()
+    rows = [
+        {'cart_id': cart_id, 'product_id': product_id, 'quantity': quantity, 'expires_at': expires_at}
+        for product_id, quantity in quantities.items() if quantity > 0
+    ]
+    if rows:
+        db.session.execute(insert(stock_reservation), rows)
+
+
+def release(cart_id, product_ids=None):
+    """Drop the cart's reservations, or only those for product_ids"""
+    statement = delete(stock_reservation).where(stock_reservation.c.cart_id == cart_id)
+    if product_ids is not None:
+        statement = statement.where(stock_reservation.c.product_id.in_(list(product_ids)))
+    db.session.execute(statement)
+
+
+def decrement_stock(quantities, exclude_cart_id=None):
+    """Take {product_id: quantity} out of stock in the current transaction.
+
+    All products are decremented by one UPDATE whose WHERE clause only
+    matches rows that still have enough stock once the unexpired
+    reservations of other carts than exclude_cart_id are set aside, so of two
+    racing checkouts only one can take the last units and neither takes
+    units promised to another cart. Raises InsufficientStock if any
+    product falls short; the caller must roll back the whole transaction.
+    """
+    if not quantities:
+        return
+    table = Product.__table__
+    needed = case(quantities, value=table.c.id)
+    reserved_by_others = select(func.coalesce(func.sum(stock_reservation.c.quantity), 0)).where(
+        stock_reservation.c.product_id == table.c.id,
+        stock_reservation.c.expires_at > datetime.utcnow()
+    )
+    if exclude_cart_id is not None:
+        reserved_by_others = reserved_by_others.where(stock_reservation.c.cart_id != exclude_cart_id)
+    statement = update(table)\
+        .where(table.c.id.in_(list(quantities)),
+               table.c.stock - reserved_by_others.scalar_subquery() >= needed)\
+        .values(stock=table.c.stock - needed)
+
+    if db.engine.dialect.update_returning:
+        updated = set(db.session.execute(statement.returning(table.c.id)).scalars())
+        short = sorted(set(quantities) - updated)
+        if short:
+            product = db.session.get(Product, short[0])
+            raise InsufficientStock(short[0], product.name if product else None)
+    elif db.session.execute(statement).rowcount != len(quantities):
+        raise InsufficientStock(None, 'one of the products')
+
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, Product) and obj.id in quantities:
+            db.session.expire(obj, ['stock'])
+    products_changed(db.session, quantities)
+
+
+def release_expired():
+    """Delete every expired reservation in one statement, returning how many"""
+    with db.engine.begin() as conn:
+        return conn.execute(
+            delete(stock_reservation).where(stock_reservation.c.expires_at <= datetime.utcnow())
+        ).rowcount
+
+
+def start_reservation_reaper(app, tasks=()):
+    """Run release_expired() in a daemon thread; set the returned event to stop it.
+
+    tasks are further maintenance callables (e.g. purging other expired
+    rows) run on the same schedule; each returns how many rows it handled.
+    """
+    interval = app.config.get('RESERVATION_REAP_INTERVAL', DEFAULT_REAP_INTERVAL)
+    stop = threading.Event()
+
+    def reap():
+        while not stop.wait(interval):
+            with app.app_context():
+                for task in (release_expired,) + tuple(tasks):
+                    try:
+                        handled = task()
+                        if handled:
+                            app.logger.info(f'{task.__name__} handled {handled} rows')
+                    except Exception as e:
+                        app.logger.error(f'Error in {task.__name__}: {str(e)}')
+
+    threading.Thread(target=reap, name='reservation-reaper', daemon=True).start()
+    return stop
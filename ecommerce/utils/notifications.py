@@ -4,6 +4,8 @@ from datetime import datetime, timedelta
 from threading import Thread
 from .. import mail, db
 from ..models.user import User
+from ..models.order import Order
+from .distance import calculate_distance
 
 def send_async_email(app, msg):
     with app.app_context():
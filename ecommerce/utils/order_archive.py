@@ -0,0 +1,133 @@
+"""Archive tier for finished orders.
+
+Completed and cancelled orders whose last update is older than
+ORDER_ARCHIVE_AFTER_DAYS are moved, with their items and notes, from
+``order``/``order_item`` into ``order_archive``/``order_item_archive``, so
+the hot tables the dashboards query only hold recent and open orders.
+archive_orders() moves them in batches of ORDER_ARCHIVE_BATCH_SIZE, each
+batch in its own transaction, copying rows with INSERT ... SELECT and
+keeping the original ids; archive_orders.py runs it from cron.
+
+Orders still referenced by delivery negotiations stay in the hot tables.
+Archived orders are read through get_order() and customer_archive_query(),
+and history figures that span both tiers through orders_total() and
+recent_orders(); their status events and daily counters
+(utils.order_events) are untouched.
+"""
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, exists, insert, select, update
+from .. import db
+from ..models.negotiation import DeliveryNegotiation
+from ..models.order import Order, OrderItem, OrderNote, ArchivedOrder, ArchivedOrderItem
+from .order_stats import clear_order_stats
+
+TERMINAL_STATUSES = ('completed', 'cancelled')
+DEFAULT_AFTER_DAYS = 90
+DEFAULT_BATCH_SIZE = 500
+
+_ORDER_COLUMNS = [column.name for column in Order.__table__.columns]
+_ITEM_COLUMNS = [column.name for column in OrderItem.__table__.columns]
+
+
+def _archivable_ids(conn, cutoff, limit):
+    orders = Order.__table__
+    negotiations = DeliveryNegotiation.__table__
+    return conn.execute(
+        select(orders.c.id)
+        .where(orders.c.status.in_(TERMINAL_STATUSES),
+               orders.c.updated_at < cutoff,
+               ~exists().where(negotiations.c.order_id == orders.c.id))
+        .order_by(orders.c.id)
+        .limit(limit)
+    ).scalars().all()
+
+
+def _archive_batch(conn, order_ids, now):
+    orders, items, notes = Order.__table__, OrderItem.__table__, OrderNote.__table__
+    conn.execute(insert(ArchivedOrder.__table__).from_select(
+        _ORDER_COLUMNS + ['archived_at'],
+        select(*[orders.c[name] for name in _ORDER_COLUMNS], db.literal(now, db.DateTime))
+        .where(orders.c.id.in_(order_ids))
+    ))
+    conn.execute(insert(ArchivedOrderItem.__table__).from_select(
+        _ITEM_COLUMNS,
+        select(*[items.c[name] for name in _ITEM_COLUMNS]).where(items.c.order_id.in_(order_ids))
+    ))
+
+    order_notes = {}
+    for note in conn.execute(select(notes).where(notes.c.order_id.in_(order_ids)).order_by(notes.c.id)):
+        order_notes.setdefault(note.order_id, []).append({
+            'user_id': note.user_id,
+            'content': note.content,
+            'created_at': note.created_at.isoformat() if note.created_at else None
+        })
+    for order_id, entries in order_notes.items():
+        conn.execute(update(ArchivedOrder.__table__)
+                     .where(ArchivedOrder.__table__.c.id == order_id)
+                     .values(notes=entries))
+
+    conn.execute(delete(notes).where(notes.c.order_id.in_(order_ids)))
+    conn.execute(delete(items).where(items.c.order_id.in_(order_ids)))
+    conn.execute(delete(orders).where(orders.c.id.in_(order_ids)))
+
+
+def archive_orders(older_than_days=None, batch_size=None, max_batches=None):
+    """Move finished orders older than older_than_days to the archive, returning how many"""
+    if older_than_days is None:
+        older_than_days = current_app.config.get('ORDER_ARCHIVE_AFTER_DAYS', DEFAULT_AFTER_DAYS)
+    batch_size = batch_size or current_app.config.get('ORDER_ARCHIVE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+
+    archived = batches = 0
+    while max_batches is None or batches < max_batches:
+        with db.engine.begin() as conn:
+            order_ids = _archivable_ids(conn, cutoff, batch_size)
+            if order_ids:
+                _archive_batch(conn, order_ids, datetime.utcnow())
+        if not order_ids:
+            break
+        archived += len(order_ids)
+        batches += 1
+        # The tab counts no longer include the moved orders
+        clear_order_stats()
+        if len(order_ids) < batch_size:
+            break
+    return archived
+
+
+def get_order(order_id):
+    """Return the order from the hot table or the archive, or None"""
+    return db.session.get(Order, order_id) or db.session.get(ArchivedOrder, order_id)
+
+
+def customer_archive_query(customer_id):
+    """Query of the customer's archived orders"""
+    return ArchivedOrder.query.filter(ArchivedOrder.customer_id == customer_id)
+
+
+def shop_archive_query(shop_id):
+    """Query of the shop's archived orders"""
+    return ArchivedOrder.query.filter(ArchivedOrder.shop_id == shop_id)
+
+
+def orders_total(aggregate, column, **filters):
+    """Return aggregate(column) over hot and archived orders matching filters.
+
+    filters are column=value pairs, e.g.
+    orders_total(func.sum, 'total_amount', customer_id=1, status='completed').
+    """
+    return sum(
+        db.session.query(aggregate(getattr(model, column))).filter_by(**filters).scalar() or 0
+        for model in (Order, ArchivedOrder)
+    )
+
+
+def recent_orders(limit, column='created_at', **filters):
+    """Return the limit newest orders by column from both tiers, newest first"""
+    orders = []
+    for model in (Order, ArchivedOrder):
+        orders.extend(model.query.filter_by(**filters)
+                      .order_by(getattr(model, column).desc(), model.id.desc()).limit(limit))
+    orders.sort(key=lambda order: (getattr(order, column), order.id), reverse=True)
+    return orders[:limit]
@@ -0,0 +1,289 @@
+"""Append-only order status history and per-shop daily counters.
+
+Every status an order enters is recorded as a row in
+``order_status_event`` (order, shop, from, to, actor, amount, time) in the
+same transaction as the change. ORM writes are picked up by attribute and
+mapper events, so update_status(), assign_delivery_person() and the routes
+that set ``order.status`` directly are all covered, with one row per
+assignment even when several happen before a flush. Bulk writes that
+bypass the ORM (insert_orders() and bulk UPDATEs) call
+record_transitions() themselves.
+
+fold_order_events() folds new events into ``shop_daily_order_counts``, one
+row per (shop, day, status) holding the net number of orders that entered
+that status that day and their total amount: an order leaving a status is
+subtracted on the day it leaves, so an order completed, reopened and
+completed again counts once. A cursor row remembers the last folded
+event, so each run only reads events it has not seen; the background
+reaper runs it on its schedule. order_totals() reads the counters plus the
+few events not folded yet, so dashboards get exact figures without
+scanning orders. ensure_order_events() seeds the log from the current
+orders when it is first created.
+
+Event ids are handed out when a row is written, not when it commits, so
+a transaction can commit id N after another has committed N+1. A fold
+only advances through consecutive ids and stops at the first missing one
+until it appears. A gap is given up on (taken to be a rolled-back write)
+only once the event after it is ORDER_EVENT_GAP_TIMEOUT seconds old, far
+longer than any transaction that writes orders.
+"""
+from datetime import datetime, timedelta
+from flask import current_app, has_request_context
+from flask_login import current_user
+from sqlalchemy import case, event, func, insert, null, or_, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.base import NEVER_SET, NO_VALUE
+from .. import db
+from ..models.order import Order
+
+CURSOR_NAME = 'shop_daily_order_counts'
+ACTOR_KEY = 'order_event_actor'
+TRANSITIONS_KEY = 'order_status_transitions'
+DEFAULT_FOLD_BATCH = 5000
+DEFAULT_GAP_TIMEOUT = 3600
+
+order_status_event = db.Table(
+    'order_status_event',
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('order_id', db.Integer, nullable=False),
+    db.Column('shop_id', db.Integer, nullable=False),
+    db.Column('from_status', db.String(20)),  # Null when the order is created
+    db.Column('to_status', db.String(20), nullable=False),
+    db.Column('actor_id', db.Integer),  # Null for system and background changes
+    db.Column('amount', db.Float, nullable=False, default=0.0),  # Order total at the time
+    db.Column('created_at', db.DateTime, nullable=False),
+    db.Index('ix_order_status_event_order', 'order_id', 'id')
+)
+
+shop_daily_order_counts = db.Table(
+    'shop_daily_order_counts',
+    db.Column('shop_id', db.Integer, primary_key=True),
+    db.Column('day', db.Date, primary_key=True),
+    db.Column('status', db.String(20), primary_key=True),
+    db.Column('orders', db.Integer, nullable=False, default=0),
+    db.Column('amount', db.Float, nullable=False, default=0.0)
+)
+
+order_event_cursor = db.Table(
+    'order_event_cursor',
+    db.Column('name', db.String(50), primary_key=True),
+    db.Column('last_event_id', db.Integer, nullable=False, default=0)
+)
+
+
+def _actor_id():
+    if has_request_context() and current_user.is_authenticated:
+        return current_user.id
+    return None
+
+
+def _event(order_id, shop_id, from_status, to_status, amount, actor_id, now):
+    return {
+        'order_id': order_id,
+        'shop_id': shop_id,
+        'from_status': from_status,
+        'to_status': to_status,
+        'actor_id': actor_id,
+        'amount': amount or 0.0,
+        'created_at': now
+    }
+
+
+def record_transitions(rows, to_status):
+    """Log a bulk status write in the current transaction.
+
+    rows are (order_id, shop_id, from_status, amount) tuples read before
+    the write; use None as from_status for newly inserted orders.
+    """
+    now = datetime.utcnow()
+    actor_id = _actor_id()
+    events = [
+        _event(order_id, shop_id, from_status, to_status, amount, actor_id, now)
+        for order_id, shop_id, from_status, amount in rows if from_status != to_status
+    ]
+    if events:
+        db.session.execute(insert(order_status_event), events)
+
+
+def order_history(order_id):
+    """Return the order's status events, oldest first"""
+    return db.session.execute(
+        select(order_status_event)
+        .where(order_status_event.c.order_id == order_id)
+        .order_by(order_status_event.c.id)
+    ).all()
+
+
+def _remember_actor(session, flush_context, instances):
+    # Resolved before the flush starts, as loading the user may need a query
+    if any(isinstance(obj, Order) for obj in list(session.new) + list(session.dirty)):
+        session.info[ACTOR_KEY] = _actor_id()
+
+
+def _track_status(target, value, oldvalue, initiator):
+    # Remember each assignment, so several transitions in one flush each get a row
+    if oldvalue in (NO_VALUE, NEVER_SET):
+        oldvalue = None
+    if value != oldvalue:
+        db.inspect(target).info.setdefault(TRANSITIONS_KEY, []).append((oldvalue, value))
+    return value
+
+
+def _write_transitions(connection, target):
+    state = db.inspect(target)
+    transitions = state.info.pop(TRANSITIONS_KEY, None)
+    if not transitions:
+        return
+    actor_id = state.session.info.get(ACTOR_KEY) if state.session is not None else None
+    now = datetime.utcnow()
+    connection.execute(insert(order_status_event), [
+        _event(target.id, target.shop_id, from_status, to_status, target.total_amount, actor_id, now)
+        for from_status, to_status in transitions
+    ])
+
+
+def _on_write(mapper, connection, target):
+    _write_transitions(connection, target)
+
+
+def _forget_transitions(session, previous_transaction):
+    # Unflushed assignments are reverted by the rollback
+    for obj in list(session.identity_map.values()) + list(session.new):
+        if isinstance(obj, Order):
+            db.inspect(obj).info.pop(TRANSITIONS_KEY, None)
+
+
+event.listen(Session, 'before_flush', _remember_actor)
+event.listen(Session, 'after_soft_rollback', _forget_transitions)
+# active_history loads the previous status even if it was expired, for from_status
+event.listen(Order.status, 'set', _track_status, active_history=True, retval=True)
+event.listen(Order, 'after_insert', _on_write)
+event.listen(Order, 'after_update', _on_write)
+
+
+def _last_folded(conn):
+    last = conn.execute(
+        select(order_event_cursor.c.last_event_id).where(order_event_cursor.c.name == CURSOR_NAME)
+    ).scalar()
+    if last is None:
+        conn.execute(insert(order_event_cursor).values(name=CURSOR_NAME, last_event_id=0))
+        last = 0
+    return last
+
+
+class _Raced(Exception):
+    pass
+
+
+def fold_order_events(limit=None):
+    """Fold unfolded events into shop_daily_order_counts, returning how many"""
+    limit = limit or current_app.config.get('ORDER_EVENT_FOLD_BATCH', DEFAULT_FOLD_BATCH)
+    gap_timeout = current_app.config.get('ORDER_EVENT_GAP_TIMEOUT', DEFAULT_GAP_TIMEOUT)
+    abandoned = datetime.utcnow() - timedelta(seconds=gap_timeout)
+    try:
+        with db.engine.begin() as conn:
+            last = _last_folded(conn)
+            events = conn.execute(
+                select(order_status_event.c.id, order_status_event.c.shop_id,
+                       order_status_event.c.from_status, order_status_event.c.to_status,
+                       order_status_event.c.amount, order_status_event.c.created_at)
+                .where(order_status_event.c.id > last)
+                .order_by(order_status_event.c.id)
+                .limit(limit)
+            ).all()
+            # Stop at the first missing id, which may belong to a transaction
+            # that has not committed yet; the cursor must not pass it
+            previous = last
+            for i, row in enumerate(events):
+                if row.id != previous + 1 and row.created_at > abandoned:
+                    events = events[:i]
+                    break
+                previous = row.id
+            if not events:
+                return 0
+
+            # Another worker folding the same events makes this UPDATE match nothing
+            claimed = conn.execute(
+                update(order_event_cursor)
+                .where(order_event_cursor.c.name == CURSOR_NAME, order_event_cursor.c.last_event_id == last)
+                .values(last_event_id=events[-1].id)
+            ).rowcount
+            if claimed != 1:
+                raise _Raced()
+
+            counts = {}
+            for row in events:
+                day = row.created_at.date()
+                # The order enters to_status and leaves from_status
+                for status, sign in ((row.to_status, 1), (row.from_status, -1)):
+                    if status is None:
+                        continue
+                    orders, amount = counts.get((row.shop_id, day, status), (0, 0.0))
+                    counts[(row.shop_id, day, status)] = (orders + sign, amount + sign * (row.amount or 0.0))
+
+            table = shop_daily_order_counts
+            for (shop_id, day, status), (orders, amount) in counts.items():
+                where = (table.c.shop_id == shop_id, table.c.day == day, table.c.status == status)
+                updated = conn.execute(
+                    update(table).where(*where)
+                    .values(orders=table.c.orders + orders, amount=table.c.amount + amount)
+                ).rowcount
+                if not updated:
+                    conn.execute(insert(table).values(shop_id=shop_id, day=day, status=status,
+                                                      orders=orders, amount=amount))
+            return len(events)
+    except _Raced:
+        return 0
+
+
+def order_totals(status, shop_id=None, day_from=None, day_to=None):
+    """Return net (orders, amount) for orders entering status, optionally per shop and day range.
+
+    Orders that left status again are subtracted on the day they left.
+    day_from and day_to are inclusive dates (UTC).
+    """
+    counts = shop_daily_order_counts
+    events = order_status_event
+    last = db.session.execute(
+        select(order_event_cursor.c.last_event_id).where(order_event_cursor.c.name == CURSOR_NAME)
+    ).scalar() or 0
+
+    folded = select(func.coalesce(func.sum(counts.c.orders), 0), func.coalesce(func.sum(counts.c.amount), 0.0))\
+        .where(counts.c.status == status)
+    # +1 for each unfolded event entering status, -1 for each leaving it
+    sign = case((events.c.to_status == status, 1), else_=-1)
+    pending = select(func.coalesce(func.sum(sign), 0), func.coalesce(func.sum(sign * events.c.amount), 0.0))\
+        .where(events.c.id > last, or_(events.c.to_status == status, events.c.from_status == status))
+    if shop_id is not None:
+        folded = folded.where(counts.c.shop_id == shop_id)
+        pending = pending.where(events.c.shop_id == shop_id)
+    if day_from is not None:
+        folded = folded.where(counts.c.day >= day_from)
+        pending = pending.where(events.c.created_at >= datetime.combine(day_from, datetime.min.time()))
+    if day_to is not None:
+        folded = folded.where(counts.c.day <= day_to)
+        pending = pending.where(
+            events.c.created_at < datetime.combine(day_to + timedelta(days=1), datetime.min.time())
+        )
+
+    folded_orders, folded_amount = db.session.execute(folded).one()
+    pending_orders, pending_amount = db.session.execute(pending).one()
+    return folded_orders + pending_orders, float(folded_amount) + float(pending_amount)
+
+
+def ensure_order_events():
+    """Seed the event log from the current orders when it is first created"""
+    try:
+        with db.engine.begin() as conn:
+            if conn.execute(select(order_status_event.c.id).limit(1)).first() is not None:
+                return
+            orders = Order.__table__
+            conn.execute(insert(order_status_event).from_select(
+                ['order_id', 'shop_id', 'from_status', 'to_status', 'amount', 'created_at'],
+                select(orders.c.id, orders.c.shop_id, null(), orders.c.status,
+                       func.coalesce(orders.c.total_amount, 0.0),
+                       func.coalesce(orders.c.updated_at, orders.c.created_at, func.now()))
+            ))
+    except OperationalError as e:
+        current_app.logger.warning(f'Order event log unavailable: {str(e)}')
@@ -0,0 +1,200 @@
+"""Order placement for checkout.
+
+A checkout creates one order per shop in the cart. place_orders() is the
+single engine behind both the checkout page and the checkout API, run in
+four timed stages:
+
+* validate - load every cart product with its shop in one query and check
+  all lines at once, reporting every line that cannot be ordered;
+* reserve - take the stock with one conditional UPDATE (decrement_stock);
+* write - insert the orders and items in bulk and clear the cart;
+* notify - queue the order notifications in the notification outbox.
+
+The transaction is then committed (timed as ``commit``). The stage
+timings come back with the order ids, ready for a Server-Timing header.
+
+Adding Order and OrderItem objects to the session makes the unit of work
+flush them row by row, so the cost of placing a large multi-shop cart grew
+with its size. insert_orders() instead writes every order with one
+INSERT ... RETURNING and every item with one executemany INSERT, in the
+caller's transaction.
+"""
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from flask import session
+from sqlalchemy import insert
+from .. import db
+from ..models.cart import CartItem
+from ..models.order import Order, OrderItem
+from .cart_counters import refresh_cart_counters
+from .cart_hydration import hydrate_cart
+from .idempotency import commit_effects
+from .inventory import available_stock, decrement_stock, release
+from .order_events import record_transitions
+from .order_stats import orders_changed
+from .outbox import enqueue
+
+
+class CheckoutError(ValueError):
+    """Raised when a cart cannot be ordered; problems lists every failing line"""
+
+    def __init__(self, problems):
+        super().__init__('; '.join(problems))
+        self.problems = problems
+
+
+class Placement:
+    """The orders created by a checkout and how long each stage took"""
+
+    def __init__(self, order_ids, timings):
+        self.order_ids = order_ids
+        self.timings = timings  # stage -> milliseconds, in stage order
+
+    def server_timing(self):
+        """Format the stage timings as a Server-Timing header value"""
+        return ', '.join(f'{stage};dur={duration:.1f}' for stage, duration in self.timings.items())
+
+
+def insert_orders(customer_id, shop_lines, **fields):
+    """Insert one pending order per shop and return the new order ids.
+
+    shop_lines maps shop_id to a list of (product_id, quantity, price)
+    tuples; fields are column values shared by every order, such as the
+    delivery address and payment method. Each order's total_amount is the
+    sum of its lines. The ids come back in the order of shop_lines.
+    """
+    if not shop_lines:
+        return []
+    now = datetime.utcnow()
+    order_rows = [
+        {
+            **fields,
+            'customer_id': customer_id,
+            'shop_id': shop_id,
+            'status': 'pending',
+            'total_amount': sum(quantity * price for _, quantity, price in lines),
+            'created_at': now,
+            'updated_at': now
+        }
+        for shop_id, lines in shop_lines.items()
+    ]
+    orders = Order.__table__
+    if db.engine.dialect.insert_executemany_returning:
+        # Each order in a checkout is for a different shop, so shop_id identifies the returned rows
+        order_ids = dict(db.session.execute(
+            insert(orders).returning(orders.c.shop_id, orders.c.id),
+            order_rows
+        ).all())
+    else:
+        order_ids = {
+            row['shop_id']: db.session.execute(insert(orders), row).inserted_primary_key[0]
+            for row in order_rows
+        }
+
+    item_rows = [
+        {'order_id': order_ids[shop_id], 'product_id': product_id, 'quantity': quantity, 'price': price}
+        for shop_id, lines in shop_lines.items()
+        for product_id, quantity, price in lines
+    ]
+    db.session.execute(insert(OrderItem.__table__), item_rows)
+    orders_changed(db.session, [customer_id], shop_lines)
+    record_transitions(
+        [(order_ids[row['shop_id']], row['shop_id'], None, row['total_amount']) for row in order_rows],
+        'pending'
+    )
+    return [order_ids[shop_id] for shop_id in shop_lines]
+
+
+def load_orders(order_ids):
+    """Return the orders for order_ids with one query, in the same order"""
+    orders = {order.id: order for order in Order.query.filter(Order.id.in_(order_ids))}
+    return [orders[order_id] for order_id in order_ids]
+
+
+@contextmanager
+def _timed(timings, stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = (time.perf_counter() - started) * 1000
+
+
+def _validate(cart, lines):
+    """Return ({shop_id: [(product_id, quantity, price)]}, {product_id: quantity}) or raise CheckoutError"""
+    if lines is None:
+        lines, _ = hydrate_cart(cart)
+    if not lines:
+        raise CheckoutError(['Cart is empty'])
+
+    quantities = {}
+    for line in lines:
+        quantities[line.product.id] = quantities.get(line.product.id, 0) + line.quantity
+    # A database cart may use the stock it has reserved itself
+    available = available_stock(quantities, exclude_cart_id=None if isinstance(cart, dict) else cart.id)
+
+    problems = []
+    shop_lines = {}
+    for line in lines:
+        product = line.product
+        if line.quantity <= 0:
+            problems.append(f'Invalid quantity for {product.name}')
+        elif product.shop is None:
+            problems.append(f'{product.name} is no longer available')
+        elif available.get(product.id, 0) < quantities[product.id]:
+            problems.append(f'Not enough stock for {product.name}')
+        else:
+            shop_lines.setdefault(product.shop_id, []).append((product.id, line.quantity, line.price))
+    if problems:
+        raise CheckoutError(problems)
+    return shop_lines, quantities
+
+
+def _clear_cart(cart):
+    if isinstance(cart, dict):
+        return  # Emptied once the orders are committed
+    CartItem.query.filter_by(cart_id=cart.id).delete(synchronize_session=False)
+    refresh_cart_counters(cart.id)
+    # The stock is now decremented for real
+    release(cart.id)
+
+
+def place_orders(cart, customer_id, lines=None, **fields):
+    """Place one order per shop for cart (a database Cart or a session cart dict).
+
+    lines are the cart's CartLines when the caller has already hydrated
+    it; fields are column values shared by every order, as for
+    insert_orders().
+    Commits on success and returns a Placement. Raises CheckoutError if any
+    line cannot be ordered and InsufficientStock if a concurrent checkout
+    took the stock first; the transaction is rolled back on any error.
+    """
+    timings = {}
+    try:
+        with _timed(timings, 'validate'):
+            shop_lines, quantities = _validate(cart, lines)
+        with _timed(timings, 'reserve'):
+            decrement_stock(quantities, exclude_cart_id=None if isinstance(cart, dict) else cart.id)
+        with _timed(timings, 'write'):
+            order_ids = insert_orders(customer_id, shop_lines, **fields)
+            _clear_cart(cart)
+        with _timed(timings, 'notify'):
+            # Sent by the outbox once this transaction commits
+            for order_id in order_ids:
+                enqueue('shop_owner_new_order', order_id=order_id)
+                enqueue('customer_order_status', order_id=order_id)
+                enqueue('admin_order_status', order_id=order_id, change={
+                    'old': None,
+                    'new': 'pending',
+                    'action': 'order_created'
+                })
+        with _timed(timings, 'commit'):
+            commit_effects()
+    except Exception:
+        db.session.rollback()
+        raise
+    if isinstance(cart, dict):
+        cart.clear()
+        session.modified = True
+    return Placement(order_ids, timings)
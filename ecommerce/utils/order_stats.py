@@ -0,0 +1,109 @@
+"""Order counts per status for the order list tabs.
+
+count_by_status() answers every tab badge with one ``GROUP BY status`` over
+the filtered order query instead of a COUNT per status. Unsearched counts
+for a customer or shop can be cached under customer_key()/shop_key(); the
+entries are dropped after any committed change to an order's status, and
+expire after ORDER_STATS_CACHE_TTL seconds so changes committed by other
+workers are picked up.
+"""
+from flask import current_app
+from sqlalchemy import distinct, event, func
+from sqlalchemy.orm import Session
+from .. import db
+from ..models.order import Order
+from .cache import TTLCache
+
+STATUSES = ('pending', 'confirmed', 'delivering', 'completed', 'cancelled')
+DIRTY_KEY = 'order_stats_dirty'
+DEFAULT_TTL = 300
+# Stands for "every cached entry" when the affected orders are not known
+ALL = object()
+
+_stats_cache = TTLCache(ttl=DEFAULT_TTL, maxsize=1024)
+
+
+def customer_key(customer_id):
+    return ('customer', customer_id)
+
+
+def shop_key(shop_id):
+    return ('shop', shop_id)
+
+
+def _count(query, model=Order):
+    # Search joins can repeat an order, so count distinct ids
+    rows = query.order_by(None).with_entities(model.status, func.count(distinct(model.id)))\
+        .group_by(model.status).all()
+    counts = dict.fromkeys(STATUSES, 0)
+    counts.update(rows)
+    counts['all'] = sum(count for _, count in rows)
+    return {status: counts[status] for status in ('all',) + STATUSES}
+
+
+def count_by_status(query, cache_key=None, model=Order):
+    """Return {'all': n, status: n, ...} for an order query without a status filter.
+
+    Pass cache_key (customer_key() or shop_key()) only when query is the
+    plain list of that customer's or shop's orders. model is ArchivedOrder
+    for a query of the archive, which is never cached.
+    """
+    if cache_key is None or model is not Order or not current_app.config.get('ORDER_STATS_CACHE', True):
+        return _count(query, model)
+    _stats_cache.ttl = current_app.config.get('ORDER_STATS_CACHE_TTL', DEFAULT_TTL)
+    counts = _stats_cache.get(cache_key)
+    if counts is None:
+        counts = _count(query)
+        _stats_cache.set(cache_key, counts)
+    return dict(counts)
+
+
+def clear_order_stats():
+    _stats_cache.clear()
+
+
+def orders_changed(session, customer_ids=(), shop_ids=()):
+    """Invalidate on commit after a bulk write to orders; pass shop_ids=ALL if unknown"""
+    dirty = session.info.setdefault(DIRTY_KEY, set())
+    dirty.update(customer_key(customer_id) for customer_id in customer_ids)
+    if shop_ids is ALL:
+        dirty.add(ALL)
+    else:
+        dirty.update(shop_key(shop_id) for shop_id in shop_ids)
+
+
+def _on_change(mapper, connection, target):
+    session = db.inspect(target).session
+    if session is not None:
+        orders_changed(session, [target.customer_id], [target.shop_id])
+
+
+def _on_update(mapper, connection, target):
+    state = db.inspect(target)
+    if any(state.attrs[key].history.has_changes() for key in ('status', 'customer_id', 'shop_id')):
+        session = state.session
+        if session is not None:
+            history = lambda key: [value for value in state.attrs[key].history.sum() if value is not None]
+            orders_changed(session, history('customer_id'), history('shop_id'))
+
+
+def _invalidate_after_commit(session):
+    dirty = session.info.pop(DIRTY_KEY, None)
+    if not dirty:
+        return
+    if ALL in dirty:
+        clear_order_stats()
+        return
+    for key in dirty:
+        _stats_cache.delete(key)
+
+
+def _discard_after_rollback(session, previous_transaction):
+    session.info.pop(DIRTY_KEY, None)
+
+
+event.listen(Order, 'after_insert', _on_change)
+event.listen(Order, 'after_update', _on_update)
+event.listen(Order, 'after_delete', _on_change)
+event.listen(Session, 'after_commit', _invalidate_after_commit)
+event.listen(Session, 'after_soft_rollback', _discard_after_rollback)
@@ -0,0 +1,186 @@
+"""Transactional outbox for order notifications.
+
+Routes no longer send mail inline. enqueue() adds a row to
+``notification_outbox`` in the same transaction as the state change it
+announces, so a notification is queued exactly when that change commits.
+drain_outbox() sends due rows through the functions in utils.notifications
+on a small thread pool. A failed send is retried with exponential backoff
+and marked failed after OUTBOX_MAX_ATTEMPTS tries.
+
+Rows are claimed by pushing next_attempt_at forward by LEASE_SECONDS
+before sending, so several workers can drain the same table and a worker
+that dies mid-send only delays the row until its lease runs out. The web
+server drains the outbox from a daemon thread started by
+start_background_workers(); outbox_worker.py runs the same loop as a
+separate process. purge_outbox(), run by the background reaper, deletes
+sent rows after OUTBOX_SENT_RETENTION and failed ones after
+OUTBOX_FAILED_RETENTION seconds.
+
+Emails link back to the site with external URLs, so each row remembers
+the host of the request that queued it and is sent inside a request
+context for that host (OUTBOX_BASE_URL when queued outside a request).
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app, has_request_context, request
+from sqlalchemy import and_, delete, insert, or_, select, update
+from .. import db
+from ..models.order import Order
+from ..models.user import User
+from . import notifications
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_WORKERS = 4
+DEFAULT_POLL_INTERVAL = 5
+BASE_DELAY = 30
+MAX_DELAY = 3600
+LEASE_SECONDS = 300
+DEFAULT_SENT_RETENTION = 24 * 3600
+DEFAULT_FAILED_RETENTION = 30 * 24 * 3600
+
+notification_outbox = db.Table(
+    'notification_outbox',
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('kind', db.String(50), nullable=False),
+    db.Column('payload', db.JSON, nullable=False),
+    db.Column('status', db.String(20), nullable=False, default='pending'),  # pending, sent, failed
+    db.Column('attempts', db.Integer, nullable=False, default=0),
+    db.Column('next_attempt_at', db.DateTime, nullable=False),
+    db.Column('last_error', db.Text),
+    db.Column('created_at', db.DateTime, nullable=False),
+    db.Column('sent_at', db.DateTime),
+    db.Index('ix_notification_outbox_due', 'status', 'next_attempt_at')
+)
+
+
+def _order(payload):
+    return db.session.get(Order, payload['order_id'])
+
+
+# kind -> sender taking the stored payload
+SENDERS = {
+    'shop_owner_new_order': lambda payload: notifications.notify_shop_owner_new_order(_order(payload)),
+    'customer_order_status': lambda payload: notifications.notify_customer_order_status(_order(payload)),
+    'admin_order_status': lambda payload: notifications.notify_admin_order_status(
+        _order(payload), payload.get('change')),
+    'delivery_person_new_order': lambda payload: notifications.notify_delivery_person_new_order(_order(payload)),
+    'delivery_assignment': lambda payload: notifications.notify_delivery_assignment(
+        _order(payload), db.session.get(User, payload['delivery_person_id'])),
+    'all_delivery_persons': lambda payload: notifications.notify_all_delivery_persons(payload['message']),
+}
+
+
+def enqueue(kind, **payload):
+    """Queue a notification in the current transaction; it is sent after commit.
+
+    payload holds JSON values such as order_id, delivery_person_id, change
+    or message, depending on the kind.
+    """
+    if kind not in SENDERS:
+        raise ValueError(f'Unknown notification {kind!r}')
+    if has_request_context():
+        payload['base_url'] = request.host_url
+    now = datetime.utcnow()
+    db.session.execute(insert(notification_outbox).values(
+        kind=kind, payload=payload, status='pending', attempts=0, next_attempt_at=now, created_at=now
+    ))
+
+
+def enqueue_order_status(order, change=None):
+    """Queue the customer and admin notifications for an order status change"""
+    enqueue('customer_order_status', order_id=order.id)
+    enqueue('admin_order_status', order_id=order.id, change=change)
+
+
+def _backoff(attempts):
+    return timedelta(seconds=min(BASE_DELAY * 2 ** (attempts - 1), MAX_DELAY))
+
+
+def _claim(conn, row, now):
+    """Lease a due row for this worker; False if another worker took it first"""
+    return conn.execute(
+        update(notification_outbox)
+        .where(notification_outbox.c.id == row.id,
+               notification_outbox.c.status == 'pending',
+               notification_outbox.c.next_attempt_at == row.next_attempt_at)
+        .values(attempts=notification_outbox.c.attempts + 1,
+                next_attempt_at=now + timedelta(seconds=LEASE_SECONDS))
+    ).rowcount == 1
+
+
+def _send(app, row, max_attempts):
+    attempts = row.attempts + 1
+    base_url = row.payload.get('base_url') or app.config.get('OUTBOX_BASE_URL')
+    with app.test_request_context(base_url=base_url):
+        try:
+            SENDERS[row.kind](row.payload)
+            values = {'status': 'sent', 'sent_at': datetime.utcnow(), 'last_error': None}
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f'Sending {row.kind} notification {row.id} failed: {str(e)}')
+            values = {'last_error': str(e)}
+            if attempts >= max_attempts:
+                values['status'] = 'failed'
+            else:
+                values['next_attempt_at'] = datetime.utcnow() + _backoff(attempts)
+        finally:
+            db.session.remove()
+        with db.engine.begin() as conn:
+            conn.execute(update(notification_outbox)
+                         .where(notification_outbox.c.id == row.id)
+                         .values(**values))
+    return values.get('status') == 'sent'
+
+
+def drain_outbox(app, limit=None, workers=None):
+    """Send up to limit due notifications, returning how many were sent"""
+    limit = limit or app.config.get('OUTBOX_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    workers = workers or app.config.get('OUTBOX_WORKERS', DEFAULT_WORKERS)
+    max_attempts = app.config.get('OUTBOX_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+    now = datetime.utcnow()
+    with app.app_context(), db.engine.begin() as conn:
+        due = conn.execute(
+            select(notification_outbox)
+            .where(notification_outbox.c.status == 'pending',
+                   notification_outbox.c.next_attempt_at <= now)
+            .order_by(notification_outbox.c.id)
+            .limit(limit)
+        ).all()
+        claimed = [row for row in due if _claim(conn, row, now)]
+    if not claimed:
+        return 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(lambda row: _send(app, row, max_attempts), claimed))
+
+
+def purge_outbox():
+    """Delete sent and failed rows past their retention, returning how many were removed"""
+    config = current_app.config
+    now = datetime.utcnow()
+    sent_before = now - timedelta(seconds=config.get('OUTBOX_SENT_RETENTION', DEFAULT_SENT_RETENTION))
+    failed_before = now - timedelta(seconds=config.get('OUTBOX_FAILED_RETENTION', DEFAULT_FAILED_RETENTION))
+    with db.engine.begin() as conn:
+        return conn.execute(delete(notification_outbox).where(or_(
+            and_(notification_outbox.c.status == 'sent', notification_outbox.c.sent_at <= sent_before),
+            and_(notification_outbox.c.status == 'failed', notification_outbox.c.created_at <= failed_before)
+        ))).rowcount
+
+
+def start_outbox_worker(app):
+    """Drain the outbox from a daemon thread; set the returned event to stop it"""
+    interval = app.config.get('OUTBOX_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)
+    stop = threading.Event()
+
+    def work():
+        while not stop.wait(interval):
+            try:
+                # Keep going while full batches come back
+                while drain_outbox(app) >= app.config.get('OUTBOX_BATCH_SIZE', DEFAULT_BATCH_SIZE):
+                    pass
+            except Exception as e:
+                app.logger.error(f'Error draining notification outbox: {str(e)}')
+
+    threading.Thread(target=work, name='outbox-worker', daemon=True).start()
+    return stop
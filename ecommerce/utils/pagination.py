@@ -0,0 +1,267 @@
+"""Keyset (cursor) pagination.
+
+OFFSET pagination reads and discards every row before the requested page
+and needs a separate COUNT, so it gets slower the deeper you go. Keyset
+pagination instead remembers the sort key of the last row shown, encoded in
+an opaque cursor, and asks for rows that sort after it, which an index on
+the sort columns answers directly.
+
+The sort order is a list of (column, 'asc'|'desc') pairs whose last column
+must be unique (normally the primary key) so every row has a distinct key.
+keyset_paginate_merged() pages through several queries with parallel sort
+orders (e.g. the hot and archived order tables) as if they were one, and
+keyset_paginate_ranked() through a list already ranked in Python.
+"""
+import base64
+import bisect
+import functools
+import hashlib
+import json
+from datetime import datetime
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import and_, or_
+from .cache import TTLCache
+
+# Exact totals are optional; when requested they are cached briefly
+_count_cache = TTLCache(ttl=60, maxsize=512)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def apply_order(query, order):
+    """Apply a [(column, direction)] sort order to query"""
+    return query.order_by(*[
+        column.desc() if direction == 'desc' else column.asc()
+        for column, direction in order
+    ])
+
+
+def _order_signature(order):
+    names = ','.join(f'{column}:{direction}' for column, direction in order)
+    return hashlib.sha1(names.encode()).hexdigest()[:8]
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(order, values, direction='next'):
+    payload = {
+        's': _order_signature(order),
+        'd': direction,
+        'k': [_encode_value(value) for value in values]
+    }
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(order, cursor):
+    """Return (values, direction) from a cursor produced for the same sort order"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        values = [_decode_value(value) for value in payload['k']]
+        direction = payload['d']
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor('Malformed pagination cursor')
+    if payload.get('s') != _order_signature(order) or len(values) != len(order):
+        raise InvalidCursor('Pagination cursor does not match the current sort order')
+    if direction not in ('next', 'prev'):
+        raise InvalidCursor('Malformed pagination cursor')
+    return values, direction
+
+
+def _after(order, values, reverse=False):
+    """Filter selecting rows that sort strictly after values (before when reverse)"""
+    clauses = []
+    for i, (column, direction) in enumerate(order):
+        ascending = (direction != 'desc') != reverse
+        comparison = column > values[i] if ascending else column < values[i]
+        clauses.append(and_(*[order[j][0] == values[j] for j in range(i)], comparison))
+    return or_(*clauses)
+
+
+def clear_count_cache():
+    _count_cache.clear()
+
+
+def _count(query):
+    statement = query.statement.compile()
+    key = (str(statement), repr(sorted(statement.params.items())))
+    return _count_cache.get_or_set(key, query.order_by(None).count)
+
+
+class KeysetPagination:
+    """A page of keyset-paginated results.
+
+    Offers has_next/has_prev like Flask-SQLAlchemy's Pagination, plus the
+    cursors for the neighbouring pages. total is None unless requested.
+    """
+
+    cursor_mode = True
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def to_dict(self):
+        return {
+            'next_cursor': self.next_cursor,
+            'prev_cursor': self.prev_cursor,
+            'per_page': self.per_page,
+            'total': self.total
+        }
+
+
+def _fetch(query, order, values, reverse, limit):
+    """Return up to limit (item, key) pairs after values, in walking order"""
+    if values is not None:
+        query = query.filter(_after(order, values, reverse=reverse))
+    key_columns = [column for column, _ in order]
+    query = apply_order(
+        query,
+        [(column, ('asc' if sort == 'desc' else 'desc') if reverse else sort) for column, sort in order]
+    ).add_columns(*[column.label(f'_keyset_{i}') for i, column in enumerate(key_columns)])
+    return [(row[0], tuple(row[1:])) for row in query.limit(limit).all()]
+
+
+def _page(order, rows, per_page, cursor, reverse, total):
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if reverse:
+        rows.reverse()
+
+    items = [item for item, _ in rows]
+    keys = [key for _, key in rows]
+
+    next_cursor = prev_cursor = None
+    if rows:
+        # Going forward there is a next page if we fetched an extra row; going
+        # backward we came from a later page, so there always is one
+        if has_more or reverse:
+            next_cursor = encode_cursor(order, keys[-1], 'next')
+        if cursor and (has_more or not reverse):
+            prev_cursor = encode_cursor(order, keys[0], 'prev')
+    return KeysetPagination(items, per_page, next_cursor, prev_cursor, total)
+
+
+def keyset_paginate(query, order, cursor=None, per_page=20, with_total=False):
+    """Return a KeysetPagination for query sorted by order.
+
+    query must select a single entity. Raises InvalidCursor for a cursor
+    that cannot be decoded or was issued for a different sort order.
+    """
+    values, direction = decode_cursor(order, cursor) if cursor else (None, 'next')
+    reverse = direction == 'prev'
+    rows = _fetch(query, order, values, reverse, per_page + 1)
+    total = _count(query) if with_total else None
+    return _page(order, rows, per_page, cursor, reverse, total)
+
+
+def keyset_paginate_merged(parts, cursor=None, per_page=20, with_total=False):
+    """Like keyset_paginate() over several (query, order) parts merged into one list.
+
+    The orders must sort by the same kind of columns in the same directions;
+    cursors are issued for the first part's order and apply to every part.
+    """
+    order = parts[0][1]
+    values, direction = decode_cursor(order, cursor) if cursor else (None, 'next')
+    reverse = direction == 'prev'
+    rows = []
+    for query, part_order in parts:
+        rows.extend(_fetch(query, part_order, values, reverse, per_page + 1))
+
+    def compare(a, b):
+        for x, y, (_, sort) in zip(a[1], b[1], order):
+            if x != y:
+                less = x < y if (sort != 'desc') != reverse else x > y
+                return -1 if less else 1
+        return 0
+
+    rows.sort(key=functools.cmp_to_key(compare))
+    total = sum(_count(query) for query, _ in parts) if with_total else None
+    return _page(order, rows[:per_page + 1], per_page, cursor, reverse, total)
+
+
+def keyset_paginate_ranked(ranked, cursor=None, per_page=20, load=list, name='score'):
+    """Return a KeysetPagination over [(id, score)] sorted by score descending, then id.
+
+    Cursors carry the (score, id) of the edge row rather than a position.
+    When the list is recomputed, e.g. after a write shifted every score, a
+    page continues from that row if it is still listed and from its old
+    score otherwise. load turns a page of ids into the items.
+    """
+    order = [(name, 'desc'), ('id', 'asc')]
+    values, direction = decode_cursor(order, cursor) if cursor else (None, 'next')
+    reverse = direction == 'prev'
+    if values is None:
+        rows = ranked[:per_page + 1]
+    else:
+        positions = {id: i for i, (id, _) in enumerate(ranked)}
+        edge = positions.get(values[1])
+        if edge is None:
+            keys = [(-score, id) for id, score in ranked]
+            key = (-values[0], values[1])
+            edge = bisect.bisect_left(keys, key) if reverse else bisect.bisect_right(keys, key) - 1
+        if reverse:
+            rows = ranked[max(edge - per_page - 1, 0):edge][::-1]
+        else:
+            rows = ranked[edge + 1:edge + per_page + 2]
+
+    pagination = _page(order, [(id, (score, id)) for id, score in rows], per_page, cursor, reverse, len(ranked))
+    pagination.items = load(pagination.items)
+    return pagination
+
+
+class LoadedPagination(Pagination):
+    """Page-number pagination over items that were already loaded"""
+
+    def _query_items(self):
+        return self._query_args['items']
+
+    def _query_count(self):
+        return self._query_args['total']
+
+
+def pagination_state(pagination):
+    """Reduce a pagination to plain data (item ids plus page info) for caching"""
+    state = {
+        'ids': [item.id for item in pagination.items],
+        'per_page': pagination.per_page,
+        'total': pagination.total
+    }
+    if getattr(pagination, 'cursor_mode', False):
+        state.update(next_cursor=pagination.next_cursor, prev_cursor=pagination.prev_cursor)
+    else:
+        state['page'] = pagination.page
+    return state
+
+
+def restore_pagination(state, items):
+    """Rebuild a pagination from pagination_state() and the loaded items"""
+    if 'page' in state:
+        return LoadedPagination(page=state['page'], per_page=state['per_page'],
+                                error_out=False, items=items, total=state['total'])
+    return KeysetPagination(items, state['per_page'], state['next_cursor'],
+                            state['prev_cursor'], state['total'])
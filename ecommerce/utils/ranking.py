@@ -0,0 +1,274 @@
+"""BM25 relevance ranking for product search.
+
+Product name, category and description are tokenized into a
+``product_term`` inverted index of (term, product_id, field, tf) postings,
+and the token count of every field is stored per product in
+``product_doc_stats``. Both are written from mapper events inside the same
+flush as the product row.
+
+A query is scored with BM25F: each field's term frequency is normalized by
+that field's length relative to the corpus average and weighted (name >
+category > description) before saturation. The text score is then scaled
+by a smoothed star rating so well reviewed products edge ahead of
+otherwise equal matches. Every query token must match, the last one as a
+prefix, like the full-text index.
+
+match_query() selects every product matching the query straight from the
+postings, so search filters and totals see all matches. rank_products()
+scores the matches that survive the caller's filters, reading the postings
+for the query's terms once, and caches the ranked ids per query and filter
+set; search pages walk that list with keyset_paginate_ranked() instead of
+scoring again. The last token only expands as a prefix from
+MIN_PREFIX_LENGTH characters, so one or two typed letters do not pull in
+the postings of half the vocabulary.
+
+The postings repeat what the full-text index (utils.search_index) holds,
+and are kept rather than derived from it: BM25F needs term frequencies
+and lengths per field, which neither the FTS5 table nor the Postgres
+tsvector index exposes in a form both dialects share. Both indexes are
+written by mapper events in the product's own flush, so they commit or
+roll back together, and each is rebuilt at startup if its row count no
+longer matches the product table.
+"""
+from math import log
+from flask import current_app
+from sqlalchemy import and_, case, event, func, or_, select
+from sqlalchemy.exc import OperationalError
+from .. import db
+from ..models.shop import Product
+from .cache import TTLCache
+from .search_index import tokenize
+
+FIELDS = ('name', 'category', 'description')
+FIELD_WEIGHTS = (3.0, 1.5, 1.0)
+K1 = 1.2
+B = 0.75
+
+# Bayesian prior for ratings: products with few reviews are pulled towards it
+RATING_PRIOR = 3.0
+RATING_PRIOR_COUNT = 5
+DEFAULT_RATING_WEIGHT = 0.3
+MIN_PREFIX_LENGTH = 3
+
+product_term = db.Table(
+    'product_term',
+    db.Column('term', db.String(64), primary_key=True),
+    db.Column('product_id', db.Integer, primary_key=True),
+    db.Column('field', db.SmallInteger, primary_key=True),
+    db.Column('tf', db.Integer, nullable=False),
+    db.Index('ix_product_term_product', 'product_id')
+)
+
+product_doc_stats = db.Table(
+    'product_doc_stats',
+    db.Column('product_id', db.Integer, primary_key=True),
+    db.Column('name_len', db.Integer, nullable=False, default=0),
+    db.Column('category_len', db.Integer, nullable=False, default=0),
+    db.Column('description_len', db.Integer, nullable=False, default=0)
+)
+
+_ranking_cache = TTLCache(ttl=300, maxsize=256)
+_corpus_cache = TTLCache(ttl=60, maxsize=1)
+
+
+def _document(product_id, values):
+    """Return (postings, stats) rows for a product's field values"""
+    postings = []
+    stats = {'product_id': product_id}
+    for field, value in enumerate(values):
+        tokens = [token[:64] for token in tokenize(value)]
+        stats[f'{FIELDS[field]}_len'] = len(tokens)
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        postings.extend(
+            {'term': term, 'product_id': product_id, 'field': field, 'tf': tf}
+            for term, tf in counts.items()
+        )
+    return postings, stats
+
+
+def _index(connection, product_id, values):
+    postings, stats = _document(product_id, values)
+    if postings:
+        connection.execute(product_term.insert(), postings)
+    connection.execute(product_doc_stats.insert(), stats)
+
+
+def _unindex(connection, product_id):
+    connection.execute(product_term.delete().where(product_term.c.product_id == product_id))
+    connection.execute(product_doc_stats.delete().where(product_doc_stats.c.product_id == product_id))
+
+
+def _values(product):
+    return [getattr(product, field) for field in FIELDS]
+
+
+def rebuild_ranking_index():
+    """Repopulate the postings and document stats from the product table"""
+    with db.engine.begin() as conn:
+        conn.execute(product_term.delete())
+        conn.execute(product_doc_stats.delete())
+        all_postings, all_stats = [], []
+        for row in conn.execute(select(Product.id, *[getattr(Product, field) for field in FIELDS])):
+            postings, stats = _document(row[0], row[1:])
+            all_postings.extend(postings)
+            all_stats.append(stats)
+        if all_postings:
+            conn.execute(product_term.insert(), all_postings)
+        if all_stats:
+            conn.execute(product_doc_stats.insert(), all_stats)
+    clear_ranking_cache()
+
+
+def ensure_ranking_index():
+    """Backfill the index at startup when it does not cover every product"""
+    try:
+        with db.engine.connect() as conn:
+            indexed = conn.execute(select(func.count()).select_from(product_doc_stats)).scalar()
+            products = conn.execute(select(func.count()).select_from(Product)).scalar()
+        if indexed != products:
+            rebuild_ranking_index()
+    except OperationalError as e:
+        current_app.logger.warning(f'Ranking index unavailable: {str(e)}')
+
+
+def clear_ranking_cache():
+    _ranking_cache.clear()
+    _corpus_cache.clear()
+
+
+def _corpus_stats():
+    """Return (document count, average length per field over products that fill it)"""
+    def load():
+        row = db.session.execute(select(
+            func.count(),
+            *[func.avg(func.nullif(product_doc_stats.c[f'{field}_len'], 0)) for field in FIELDS]
+        )).one()
+        return row[0], [float(avg or 0) or 1.0 for avg in row[1:]]
+    return _corpus_cache.get_or_set('corpus', load)
+
+
+def _term_filter(token, prefix):
+    if prefix and len(token) >= MIN_PREFIX_LENGTH:
+        # Range scan on the primary key instead of LIKE so the index is used
+        return and_(product_term.c.term >= token, product_term.c.term < token + '\uffff')
+    return product_term.c.term == token
+
+
+def _term_filters(tokens):
+    return [_term_filter(token, i == len(tokens) - 1) for i, token in enumerate(tokens)]
+
+
+def _matches_term(term, tokens, i):
+    token = tokens[i]
+    if i == len(tokens) - 1 and len(token) >= MIN_PREFIX_LENGTH:
+        return term.startswith(token)
+    return term == token
+
+
+def _doc_freq(tokens, filters):
+    """Number of products containing each token, over the whole catalog"""
+    return list(db.session.execute(select(*[
+        func.count(func.distinct(case((term_filter, product_term.c.product_id))))
+        for term_filter in filters
+    ]).where(or_(*filters))).one())
+
+
+def _score(tokens, candidates=None):
+    doc_count, avg_lengths = _corpus_stats()
+    if not doc_count:
+        return []
+
+    # One pass over the postings of every query term, limited to the candidates
+    filters = _term_filters(tokens)
+    query = select(product_term.c.term, product_term.c.product_id, product_term.c.field, product_term.c.tf,
+                   *[product_doc_stats.c[f'{field}_len'] for field in FIELDS],
+                   Product.rating, Product.rating_count)\
+        .join(product_doc_stats, product_doc_stats.c.product_id == product_term.c.product_id)\
+        .join(Product, Product.id == product_term.c.product_id)\
+        .where(or_(*filters))
+    if candidates is not None:
+        query = query.where(product_term.c.product_id.in_(candidates))
+    rows = db.session.execute(query).all()
+
+    # weighted[product_id][token index] = length-normalized, weighted term frequency
+    weighted = {}
+    ratings = {}
+    for term, product_id, field, tf, *rest in rows:
+        lengths, (rating, rating_count) = rest[:len(FIELDS)], rest[len(FIELDS):]
+        norm = (1 - B) + B * lengths[field] / avg_lengths[field]
+        for i in range(len(tokens)):
+            if _matches_term(term, tokens, i):
+                doc = weighted.setdefault(product_id, [0.0] * len(tokens))
+                doc[i] += FIELD_WEIGHTS[field] * tf / norm
+        ratings[product_id] = (rating or 0.0, rating_count or 0)
+    if not weighted:
+        return []
+
+    # Rarity is judged over the catalog, not the filtered candidates
+    doc_freq = _doc_freq(tokens, filters)
+    idf = [log(1 + (doc_count - df + 0.5) / (df + 0.5)) for df in doc_freq]
+
+    rating_weight = current_app.config.get('SEARCH_RATING_WEIGHT', DEFAULT_RATING_WEIGHT)
+    scores = []
+    for product_id, doc in weighted.items():
+        if not all(doc):
+            continue
+        text_score = sum(idf[i] * tf * (K1 + 1) / (tf + K1) for i, tf in enumerate(doc))
+        rating, rating_count = ratings[product_id]
+        smoothed = (rating * rating_count + RATING_PRIOR * RATING_PRIOR_COUNT) / \
+            (rating_count + RATING_PRIOR_COUNT)
+        scores.append((product_id, text_score * (1 - rating_weight + rating_weight * smoothed / 5)))
+    scores.sort(key=lambda item: (-item[1], item[0]))
+    return scores
+
+
+def _tokens(query):
+    return tuple(token[:64] for token in tokenize(query))
+
+
+def match_query(query):
+    """Return a select of the ids of products matching every token of query, or None without tokens"""
+    tokens = _tokens(query)
+    if not tokens:
+        return None
+    filters = _term_filters(tokens)
+    return select(product_term.c.product_id)\
+        .where(or_(*filters))\
+        .group_by(product_term.c.product_id)\
+        .having(and_(*[func.max(case((term_filter, 1), else_=0)) == 1 for term_filter in filters]))
+
+
+def rank_products(query, candidates=None, key=None):
+    """Return [(product_id, score)] for the products matching every token of query, best first.
+
+    candidates optionally restricts scoring to a select of product ids;
+    key must then identify the filters behind it for caching.
+    """
+    tokens = _tokens(query)
+    if not tokens:
+        return []
+    if candidates is not None and key is None:
+        return _score(tokens, candidates)
+    return _ranking_cache.get_or_set((tokens, key), lambda: _score(tokens, candidates))
+
+
+def on_product_insert(mapper, connection, target):
+    _index(connection, target.id, _values(target))
+
+
+def on_product_update(mapper, connection, target):
+    state = db.inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in FIELDS):
+        _unindex(connection, target.id)
+        _index(connection, target.id, _values(target))
+
+
+def on_product_delete(mapper, connection, target):
+    _unindex(connection, target.id)
+
+
+event.listen(Product, 'after_insert', on_product_insert)
+event.listen(Product, 'after_update', on_product_update)
+event.listen(Product, 'after_delete', on_product_delete)
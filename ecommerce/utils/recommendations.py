@@ -0,0 +1,164 @@
+"""Precomputed "customers also bought" recommendations.
+
+A batch job folds completed orders into a sparse item-item co-occurrence
+matrix stored as ``product_cooccurrence`` rows (product_id, other_id,
+count): every pair of distinct products in the same order adds one to
+both (a, b) and (b, a). The top neighbours of each product are then kept
+in ``product_recommendation`` keyed by (product_id, rank), so the product
+page reads them with a single primary key range lookup.
+
+Orders that have been counted are recorded in ``recommendation_order``.
+A refresh only reads completed orders missing from it, from the hot and the
+archived order tables alike, and only re-ranks the products those orders
+touched, so it can run as often as needed.
+
+The matrix is accumulated in plain dicts; NumPy/SciPy are not
+dependencies of this project and the per-batch matrices are tiny.
+"""
+from collections import Counter, defaultdict
+from sqlalchemy import and_, bindparam, delete, insert, select, union_all, update
+from .. import db
+from ..models.order import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+from ..models.shop import Shop, Product
+
+DEFAULT_TOP_K = 10
+DEFAULT_BATCH_SIZE = 1000
+
+product_cooccurrence = db.Table(
+    'product_cooccurrence',
+    db.Column('product_id', db.Integer, primary_key=True),
+    db.Column('other_id', db.Integer, primary_key=True),
+    db.Column('count', db.Integer, nullable=False)
+)
+
+product_recommendation = db.Table(
+    'product_recommendation',
+    db.Column('product_id', db.Integer, primary_key=True),
+    db.Column('rank', db.Integer, primary_key=True),
+    db.Column('recommended_id', db.Integer, nullable=False),
+    db.Column('score', db.Integer, nullable=False)
+)
+
+recommendation_order = db.Table(
+    'recommendation_order',
+    db.Column('order_id', db.Integer, primary_key=True)
+)
+
+
+def _pending_orders(conn, limit):
+    # Archived orders keep their ids, so an order is counted once whichever tier holds it
+    hot, archived = Order.__table__, ArchivedOrder.__table__
+    completed = union_all(
+        select(hot.c.id).where(hot.c.status == 'completed'),
+        select(archived.c.id).where(archived.c.status == 'completed')
+    ).subquery()
+    return [row[0] for row in conn.execute(
+        select(completed.c.id)
+        .outerjoin(recommendation_order, recommendation_order.c.order_id == completed.c.id)
+        .where(recommendation_order.c.order_id == None)
+        .order_by(completed.c.id)
+        .limit(limit)
+    )]
+
+
+def _cooccurrences(conn, order_ids):
+    """Return a sparse {(a, b): count} matrix of products bought together in order_ids"""
+    baskets = defaultdict(set)
+    for items in (OrderItem.__table__, ArchivedOrderItem.__table__):
+        for order_id, product_id in conn.execute(
+                select(items.c.order_id, items.c.product_id).where(items.c.order_id.in_(order_ids))):
+            baskets[order_id].add(product_id)
+
+    counts = Counter()
+    for basket in baskets.values():
+        for a in basket:
+            for b in basket:
+                if a != b:
+                    counts[(a, b)] += 1
+    return counts
+
+
+def _merge(conn, counts):
+    """Add counts to the stored matrix"""
+    products = {a for a, _ in counts}
+    existing = {
+        (row.product_id, row.other_id)
+        for row in conn.execute(
+            select(product_cooccurrence.c.product_id, product_cooccurrence.c.other_id)
+            .where(product_cooccurrence.c.product_id.in_(products)))
+    }
+    updates = [{'a': a, 'b': b, 'delta': count} for (a, b), count in counts.items() if (a, b) in existing]
+    inserts = [{'product_id': a, 'other_id': b, 'count': count}
+               for (a, b), count in counts.items() if (a, b) not in existing]
+    if updates:
+        conn.execute(
+            update(product_cooccurrence)
+            .where(and_(product_cooccurrence.c.product_id == bindparam('a'),
+                        product_cooccurrence.c.other_id == bindparam('b')))
+            .values(count=product_cooccurrence.c.count + bindparam('delta')),
+            updates
+        )
+    if inserts:
+        conn.execute(insert(product_cooccurrence), inserts)
+    return products
+
+
+def _rerank(conn, products, top_k):
+    """Rebuild the top_k neighbour lists of products from the stored matrix"""
+    if not products:
+        return
+    neighbours = defaultdict(list)
+    for product_id, other_id, count in conn.execute(
+            select(product_cooccurrence.c.product_id, product_cooccurrence.c.other_id,
+                   product_cooccurrence.c.count)
+            .where(product_cooccurrence.c.product_id.in_(products))):
+        neighbours[product_id].append((count, other_id))
+
+    conn.execute(delete(product_recommendation).where(product_recommendation.c.product_id.in_(products)))
+    rows = []
+    for product_id, candidates in neighbours.items():
+        candidates.sort(key=lambda item: (-item[0], item[1]))
+        rows.extend(
+            {'product_id': product_id, 'rank': rank, 'recommended_id': other_id, 'score': count}
+            for rank, (count, other_id) in enumerate(candidates[:top_k])
+        )
+    if rows:
+        conn.execute(insert(product_recommendation), rows)
+
+
+def refresh_recommendations(top_k=DEFAULT_TOP_K, batch_size=DEFAULT_BATCH_SIZE):
+    """Fold newly completed orders into the recommendations.
+
+    Each batch is applied in its own transaction. Returns the number of
+    orders processed.
+    """
+    processed = 0
+    while True:
+        with db.engine.begin() as conn:
+            order_ids = _pending_orders(conn, batch_size)
+            if not order_ids:
+                return processed
+            touched = _merge(conn, _cooccurrences(conn, order_ids))
+            _rerank(conn, touched, top_k)
+            conn.execute(insert(recommendation_order), [{'order_id': order_id} for order_id in order_ids])
+        processed += len(order_ids)
+
+
+def rebuild_recommendations(top_k=DEFAULT_TOP_K, batch_size=DEFAULT_BATCH_SIZE):
+    """Discard everything and recount all completed orders"""
+    with db.engine.begin() as conn:
+        conn.execute(delete(product_recommendation))
+        conn.execute(delete(product_cooccurrence))
+        conn.execute(delete(recommendation_order))
+    return refresh_recommendations(top_k=top_k, batch_size=batch_size)
+
+
+def recommended_products(product_id, limit=4):
+    """Return products most often bought together with product_id, from active shops"""
+    return Product.query\
+        .join(product_recommendation, product_recommendation.c.recommended_id == Product.id)\
+        .filter(product_recommendation.c.product_id == product_id,
+                Product.shop.has(Shop.is_active == True))\
+        .order_by(product_recommendation.c.rank)\
+        .limit(limit)\
+        .all()
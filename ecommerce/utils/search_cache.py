@@ -0,0 +1,129 @@
+"""Result cache for /search and /api/search/suggestions.
+
+Entries are keyed by the normalized search parameters and hold only the
+matching ids and pagination totals, never ORM objects, so a hit costs one
+primary key lookup to hydrate the page. The whole cache is dropped after
+any committed Product or Shop change that could alter a result; changes
+committed by other workers are picked up once entries are older than
+SEARCH_CACHE_TTL.
+"""
+import time
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .. import db
+from ..models.shop import Shop, Product
+from .cache import LRUCache
+from .facets import clear_facet_cache
+from .ranking import clear_ranking_cache
+
+DIRTY_KEY = 'search_cache_dirty'
+DEFAULT_TTL = 300
+DEFAULT_MAXSIZE = 2048
+
+# Columns that affect which results match or how they are ordered
+SEARCHED_ATTRS = {
+    Shop: ('name', 'description', 'address', 'is_active', 'location_lat', 'location_lng'),
+    Product: ('name', 'description', 'category', 'price', 'shop_id', 'created_at',
+              'rating', 'rating_count')
+}
+
+search_cache = LRUCache(maxsize=DEFAULT_MAXSIZE)
+
+
+def _normalize_text(value):
+    return ' '.join((value or '').lower().split())
+
+
+def search_location(lat, lng):
+    """Round a search location (to ~100m) so nearby searches share cache entries"""
+    if lat is None or lng is None:
+        return None, None
+    return round(lat, 3), round(lng, 3)
+
+
+def search_key(args):
+    """Build a cache key from the /search request arguments"""
+    lat, lng = search_location(args.get('lat', type=float), args.get('lng', type=float))
+    location = None
+    if lat is not None:
+        location = (lat, lng, args.get('distance', 10, type=float))
+    return (
+        'search',
+        _normalize_text(args.get('q')),
+        args.get('type', 'all'),
+        args.get('shop_id', type=int),
+        args.get('category') or None,
+        args.get('min_price', type=float),
+        args.get('max_price', type=float),
+        args.get('sort', 'relevance'),
+        args.get('page', type=int),
+        args.get('cursor') or None,
+        args.get('shop_cursor') or None,
+        args.get('fuzzy') == '1',
+        location
+    )
+
+
+def suggestions_key(args):
+    """Build a cache key from the /api/search/suggestions request arguments"""
+    return ('suggest', _normalize_text(args.get('q')), args.get('shop_id', type=int))
+
+
+def get_cached(key):
+    entry = search_cache.get(key)
+    if entry is None:
+        return None
+    stored_at, value = entry
+    if time.monotonic() - stored_at > current_app.config.get('SEARCH_CACHE_TTL', DEFAULT_TTL):
+        search_cache.delete(key)
+        return None
+    return value
+
+
+def set_cached(key, value):
+    search_cache.set(key, (time.monotonic(), value))
+
+
+def load_in_order(model, ids):
+    """Load model instances by primary key, preserving the order of ids"""
+    if not ids:
+        return []
+    found = {obj.id: obj for obj in model.query.filter(model.id.in_(ids))}
+    return [found[id] for id in ids if id in found]
+
+
+def invalidate():
+    search_cache.clear()
+    clear_facet_cache()
+    clear_ranking_cache()
+
+
+def _mark_dirty(mapper, connection, target):
+    session = db.inspect(target).session
+    if session is not None:
+        session.info[DIRTY_KEY] = True
+
+
+def _mark_dirty_on_update(mapper, connection, target):
+    state = db.inspect(target)
+    if any(state.attrs[key].history.has_changes() for key in SEARCHED_ATTRS[type(target)]):
+        _mark_dirty(mapper, connection, target)
+
+
+def _invalidate_after_commit(session):
+    if session.info.pop(DIRTY_KEY, False):
+        invalidate()
+
+
+def _discard_after_rollback(session, previous_transaction):
+    session.info.pop(DIRTY_KEY, None)
+
+
+for model in (Shop, Product):
+    event.listen(model, 'after_insert', _mark_dirty)
+    event.listen(model, 'after_update', _mark_dirty_on_update)
+    event.listen(model, 'after_delete', _mark_dirty)
+
+event.listen(Session, 'after_commit', _invalidate_after_commit)
+event.listen(Session, 'after_soft_rollback', _discard_after_rollback)
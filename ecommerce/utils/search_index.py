@@ -0,0 +1,193 @@
+"""Full-text search index for products.
+
+SQLite deployments keep a ``product_fts`` FTS5 table whose rowid is the
+product id. It is filled from Product insert/update/delete mapper events so
+it commits or rolls back together with the product row itself.
+
+Postgres deployments use a GIN expression index over a weighted tsvector of
+the same columns; the database keeps that index up to date on its own.
+"""
+import re
+from flask import current_app, has_app_context
+from sqlalchemy import DDL, event, func, literal_column, select, text
+from sqlalchemy.exc import OperationalError
+from .. import db
+from ..models.shop import Product
+
+FTS_TABLE = 'product_fts'
+
+# Column weights used for ranking: name > category > description
+NAME_WEIGHT = 10.0
+CATEGORY_WEIGHT = 5.0
+DESCRIPTION_WEIGHT = 1.0
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+PG_SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(product.name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(product.category, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(product.description, '')), 'C')"
+)
+
+SQLITE_CREATE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+    "USING fts5(name, category, description, tokenize='unicode61 remove_diacritics 2')"
+)
+SQLITE_DROP = f"DROP TABLE IF EXISTS {FTS_TABLE}"
+SQLITE_REBUILD = (
+    f"INSERT INTO {FTS_TABLE}(rowid, name, category, description) "
+    "SELECT id, name, coalesce(category, ''), coalesce(description, '') FROM product"
+)
+PG_CREATE = (
+    "CREATE INDEX IF NOT EXISTS ix_product_search_vector "
+    f"ON product USING gin (({PG_SEARCH_VECTOR}))"
+)
+
+# Create/drop the index structures together with the product table so that
+# create_all()/drop_all() (fresh installs and tests) keep them consistent
+event.listen(Product.__table__, 'after_create', DDL(SQLITE_CREATE).execute_if(dialect='sqlite'))
+event.listen(Product.__table__, 'before_drop', DDL(SQLITE_DROP).execute_if(dialect='sqlite'))
+event.listen(Product.__table__, 'after_create', DDL(PG_CREATE).execute_if(dialect='postgresql'))
+
+
+def tokenize(value):
+    """Split text into lowercase search tokens"""
+    return TOKEN_RE.findall((value or '').lower())
+
+
+def ensure_search_index():
+    """Create the search index if it is missing and backfill it when it is out of sync.
+
+    Called once at startup. Returns the backend in use ('fts5', 'tsvector')
+    or None when the database has no full-text support, in which case the
+    search routes fall back to ILIKE matching.
+    """
+    backend = None
+    try:
+        with db.engine.begin() as conn:
+            dialect = conn.dialect.name
+            if dialect == 'sqlite':
+                conn.execute(text(SQLITE_CREATE))
+                indexed = conn.execute(text(f'SELECT count(*) FROM {FTS_TABLE}')).scalar()
+                products = conn.execute(text('SELECT count(*) FROM product')).scalar()
+                if indexed != products:
+                    conn.execute(text(f'DELETE FROM {FTS_TABLE}'))
+                    conn.execute(text(SQLITE_REBUILD))
+                backend = 'fts5'
+            elif dialect == 'postgresql':
+                conn.execute(text(PG_CREATE))
+                backend = 'tsvector'
+    except OperationalError as e:
+        current_app.logger.warning(f'Full-text search index unavailable: {str(e)}')
+        backend = None
+
+    current_app.extensions['search_index'] = backend
+    return backend
+
+
+def rebuild_search_index():
+    """Drop and repopulate the SQLite index from the product table"""
+    with db.engine.begin() as conn:
+        if conn.dialect.name == 'sqlite':
+            conn.execute(text(f'DELETE FROM {FTS_TABLE}'))
+            conn.execute(text(SQLITE_REBUILD))
+
+
+def _backend():
+    return current_app.extensions.get('search_index')
+
+
+def product_match_query(query):
+    """Return a selectable of (product_id, rank) for products matching query.
+
+    Every token must match, the last one as a prefix so partially typed words
+    still find results. Higher rank means more relevant. Returns None when
+    there is no usable index or no searchable tokens, so callers can fall
+    back to ILIKE filtering.
+    """
+    tokens = tokenize(query)
+    backend = _backend()
+    if not tokens or backend is None:
+        return None
+
+    if backend == 'fts5':
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        return text(
+            f"SELECT rowid AS product_id, "
+            f"-bm25({FTS_TABLE}, {NAME_WEIGHT}, {CATEGORY_WEIGHT}, {DESCRIPTION_WEIGHT}) AS rank "
+            f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match"
+        ).bindparams(match=match).columns(
+            product_id=db.Integer,
+            rank=db.Float
+        ).subquery('search_rank')
+
+    vector = literal_column(f'({PG_SEARCH_VECTOR})')
+    ts_query = func.to_tsquery('simple', ' & '.join(f'{token}:*' for token in tokens))
+    return select(
+        Product.id.label('product_id'),
+        func.ts_rank(vector, ts_query).label('rank')
+    ).where(vector.op('@@')(ts_query)).subquery('search_rank')
+
+
+def search_product_ids(query, limit=20, offset=0):
+    """Return ids of products matching query, most relevant first"""
+    ranked = product_match_query(query)
+    if ranked is None:
+        return []
+    rows = db.session.execute(
+        select(ranked.c.product_id)
+        .order_by(ranked.c.rank.desc(), ranked.c.product_id)
+        .limit(limit)
+        .offset(offset)
+    )
+    return [row.product_id for row in rows]
+
+
+def _sync_enabled(connection):
+    if connection.dialect.name != 'sqlite':
+        return False
+    return not has_app_context() or _backend() == 'fts5'
+
+
+def _index_product(connection, target):
+    connection.execute(
+        text(f'INSERT INTO {FTS_TABLE}(rowid, name, category, description) '
+             'VALUES (:id, :name, :category, :description)'),
+        {
+            'id': target.id,
+            'name': target.name or '',
+            'category': target.category or '',
+            'description': target.description or ''
+        }
+    )
+
+
+def _unindex_product(connection, target):
+    connection.execute(text(f'DELETE FROM {FTS_TABLE} WHERE rowid = :id'), {'id': target.id})
+
+
+def on_product_insert(mapper, connection, target):
+    """Add a newly inserted product to the index"""
+    if _sync_enabled(connection):
+        _index_product(connection, target)
+
+
+def on_product_update(mapper, connection, target):
+    """Re-index a product when one of its searchable columns changed"""
+    if not _sync_enabled(connection):
+        return
+    state = db.inspect(target)
+    if any(state.attrs[key].history.has_changes() for key in ('name', 'category', 'description')):
+        _unindex_product(connection, target)
+        _index_product(connection, target)
+
+
+def on_product_delete(mapper, connection, target):
+    """Remove a deleted product from the index"""
+    if _sync_enabled(connection):
+        _unindex_product(connection, target)
+
+
+event.listen(Product, 'after_insert', on_product_insert)
+event.listen(Product, 'after_update', on_product_update)
+event.listen(Product, 'after_delete', on_product_delete)
@@ -0,0 +1,243 @@
+"""Sparse-fieldset serializers for API responses.
+
+Model.to_dict() always builds every field, nesting the full to_dict() of
+each related object, and every relationship it touches is a lazy load.
+The serializers here produce the same shapes but only for the fields a
+client asks for, e.g. ``?fields=id,status,total_amount,items.product.name``:
+
+* a field list is parsed into a tree and compiled once per schema into a
+  flat plan of (key, getter) pairs, cached by the fields string, so
+  dumping a row builds one dict per object and nothing for fields nobody
+  asked for;
+* the same plan lists the relationships it will follow, as loader options
+  (joinedload for many-to-one, selectinload for collections) to pass to
+  the query, so the rows come back with one query per collection level
+  instead of a lazy load per object.
+
+Naming a relationship without sub-fields (``customer``) returns its
+default fields, which are those of to_dict(); omitting ``fields`` returns
+the full to_dict() shape.
+"""
+from datetime import datetime
+from sqlalchemy.orm import joinedload, selectinload
+from ..models.order import Order, OrderItem
+from ..models.shop import Shop, Product
+from ..models.user import User
+from .cache import LRUCache
+
+MAX_FIELDS_LENGTH = 1000
+
+
+class InvalidFields(ValueError):
+    """Raised for a fields parameter naming fields the schema does not have"""
+
+
+def _isoformat(attr):
+    def get(obj):
+        value = getattr(obj, attr)
+        return value.isoformat() if isinstance(value, datetime) else value
+    return get
+
+
+def _attr(attr):
+    return lambda obj: getattr(obj, attr)
+
+
+class Field:
+    """A value computed from the object; loads lists relationships it reads"""
+
+    def __init__(self, get, loads=()):
+        self.get = get
+        self.loads = loads
+
+
+class Related:
+    """A relationship serialized with another schema"""
+
+    def __init__(self, attr, schema, many=False):
+        self.attr = attr
+        self.schema = schema  # Name of the related Schema, resolved lazily
+        self.many = many
+
+
+class Schema:
+    registry = {}
+
+    def __init__(self, name, model, fields):
+        self.name = name
+        self.model = model
+        self.fields = fields  # key -> Field or Related, in to_dict() order
+        self._plans = LRUCache(maxsize=256)
+        Schema.registry[name] = self
+
+    def plan(self, fields=None):
+        """Return the compiled Plan for a fields parameter (None for all fields)"""
+        key = fields or ''
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = Plan(self, parse_fields(fields))
+            self._plans.set(key, plan)
+        return plan
+
+
+def parse_fields(fields):
+    """Parse 'a,b.c,b.d' into {'a': {}, 'b': {'c': {}, 'd': {}}}; None when not given"""
+    if not fields:
+        return None
+    if len(fields) > MAX_FIELDS_LENGTH:
+        raise InvalidFields('fields is too long')
+    tree = {}
+    for path in fields.split(','):
+        path = path.strip()
+        if not path:
+            continue
+        node = tree
+        for part in path.split('.'):
+            if not part:
+                raise InvalidFields(f'Invalid field {path!r}')
+            node = node.setdefault(part, {})
+    return tree or None
+
+
+class Plan:
+    """Getters and loader options for one schema and field tree"""
+
+    def __init__(self, schema, tree):
+        self.schema = schema
+        self._getters, self._loads = self._compile(schema, tree, ())
+
+    @classmethod
+    def _compile(cls, schema, tree, prefix):
+        # loads holds (attribute name, many, related schema, nested loads)
+        getters, loads = [], []
+        for key in (tree if tree is not None else schema.fields):
+            path = '.'.join(prefix + (key,))
+            spec = schema.fields.get(key)
+            if spec is None:
+                raise InvalidFields(f'Unknown field {path!r}')
+            subtree = tree.get(key) if tree is not None else None
+            if isinstance(spec, Related):
+                related = Schema.registry[spec.schema]
+                sub_getters, sub_loads = cls._compile(related, subtree or None, prefix + (key,))
+                getters.append((key, cls._related_getter(spec, sub_getters)))
+                loads.append((spec.attr, spec.many, related, sub_loads))
+            else:
+                if subtree:
+                    raise InvalidFields(f'Field {path!r} has no sub-fields')
+                getters.append((key, spec.get))
+                loads.extend((attr, False, None, []) for attr in spec.loads)
+        return getters, loads
+
+    @staticmethod
+    def _related_getter(spec, getters):
+        attr = spec.attr
+        if spec.many:
+            def get(obj):
+                return [{key: getter(item) for key, getter in getters} for item in getattr(obj, attr)]
+        else:
+            def get(obj):
+                value = getattr(obj, attr)
+                if value is None:
+                    return None
+                return {key: getter(value) for key, getter in getters}
+        return get
+
+    def load_options(self):
+        """Loader options eager loading every relationship the plan reads"""
+        return list(self._options(self.schema.model, self._loads, None))
+
+    @classmethod
+    def _options(cls, model, loads, parent):
+        seen = set()
+        for attr, many, related, sub_loads in loads:
+            if attr in seen:
+                continue
+            seen.add(attr)
+            # Collections get one IN query per level; many-to-one rows are joined
+            loader = selectinload if many else joinedload
+            attribute = getattr(model, attr)
+            option = loader(attribute) if parent is None else getattr(parent, loader.__name__)(attribute)
+            yield option
+            if sub_loads:
+                yield from cls._options(related.model, sub_loads, option)
+
+    def dump(self, obj):
+        return {key: getter(obj) for key, getter in self._getters}
+
+    def dump_many(self, objs):
+        getters = self._getters
+        return [{key: getter(obj) for key, getter in getters} for obj in objs]
+
+
+USER = Schema('user', User, {
+    'id': Field(_attr('id')),
+    'username': Field(_attr('username')),
+    'email': Field(_attr('email')),
+    'role': Field(_attr('role')),
+    'phone': Field(_attr('phone')),
+    'location': Field(lambda user: {'lat': user.location_lat, 'lng': user.location_lng, 'address': user.address}),
+    'created_at': Field(_isoformat('created_at')),
+    'updated_at': Field(_isoformat('updated_at'))
+})
+
+SHOP = Schema('shop', Shop, {
+    'id': Field(_attr('id')),
+    'name': Field(_attr('name')),
+    'description': Field(_attr('description')),
+    'about': Field(_attr('about')),
+    'owner_id': Field(_attr('owner_id')),
+    'location': Field(lambda shop: {'lat': shop.location_lat, 'lng': shop.location_lng, 'address': shop.address}),
+    'contact': Field(lambda shop: {'phone': shop.phone, 'email': shop.email, 'website': shop.website,
+                                   'business_hours': shop.business_hours}),
+    'created_at': Field(_isoformat('created_at')),
+    'is_active': Field(_attr('is_active'))
+})
+
+PRODUCT = Schema('product', Product, {
+    'id': Field(_attr('id')),
+    'name': Field(_attr('name')),
+    'description': Field(_attr('description')),
+    'price': Field(_attr('price')),
+    'stock': Field(_attr('stock')),
+    'shop_id': Field(_attr('shop_id')),
+    'shop_name': Field(lambda product: product.shop.name, loads=('shop',)),
+    'image_url': Field(_attr('image_url')),
+    'category': Field(_attr('category')),
+    'rating': Field(_attr('rating')),
+    'rating_count': Field(_attr('rating_count')),
+    'is_negotiable': Field(lambda product: product.is_negotiable()),
+    'min_price': Field(lambda product: product.min_price if product.is_negotiable() else None),
+    'max_discount': Field(lambda product: product.max_discount_percentage if product.is_negotiable() else None),
+    'continue_iteration': Field(_attr('continue_iteration')),
+    'created_at': Field(_isoformat('created_at'))
+})
+
+ORDER_ITEM = Schema('order_item', OrderItem, {
+    'id': Field(_attr('id')),
+    'product': Related('product', 'product'),
+    'quantity': Field(_attr('quantity')),
+    'price': Field(_attr('price')),
+    'negotiated_price': Field(_attr('negotiated_price')),
+    'subtotal': Field(_attr('subtotal'))
+})
+
+ORDER = Schema('order', Order, {
+    'id': Field(_attr('id')),
+    'customer': Related('customer', 'user'),
+    'shop': Related('shop', 'shop'),
+    'delivery_person': Related('delivery_person', 'user'),
+    'status': Field(_attr('status')),
+    'total_amount': Field(_attr('total_amount')),
+    'delivery_address': Field(_attr('delivery_address')),
+    'delivery_location': Field(lambda order: {'lat': order.delivery_lat, 'lng': order.delivery_lng}
+                               if order.delivery_lat and order.delivery_lng else None),
+    'created_at': Field(_isoformat('created_at')),
+    'updated_at': Field(_isoformat('updated_at')),
+    'estimated_delivery_time': Field(_isoformat('estimated_delivery_time')),
+    'special_instructions': Field(_attr('special_instructions')),
+    'payment_method': Field(_attr('payment_method')),
+    'payment_status': Field(_attr('payment_status')),
+    'payment_details': Field(_attr('payment_details')),
+    'payment_transaction_id': Field(_attr('payment_transaction_id')),
+    'items': Related('items', 'order_item', many=True)
+})
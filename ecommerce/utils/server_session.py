@@ -0,0 +1,299 @@
+"""Server-side storage for the Flask session.
+
+With the default cookie backend the whole session, including an anonymous
+visitor's cart, is serialized into the signed cookie and sent back on every
+request. Setting SESSION_BACKEND to ``sqlalchemy`` (a ``server_session``
+table in the application database) or ``dbm`` (a file at
+SESSION_DBM_PATH) keeps the data on the server and puts only a signed,
+opaque session id in the cookie.
+
+The server-side backends are opt-in: they cost a store read on every
+request that carries a session cookie, which the cookie backend avoids
+(cached pages such as the homepage are served without touching the
+database), so deployments whose carts stay small can keep cookies.
+
+Records expire SESSION_TTL seconds after they were last written; reads
+ignore expired records and writes purge them every PURGE_INTERVAL saves.
+A record is a small header, the cart map packed as fixed-size binary
+entries, and the rest of the session in Flask's tagged JSON.
+"""
+import dbm
+import fcntl
+import math
+import os
+import secrets
+import struct
+import time
+from contextlib import contextmanager
+from threading import Lock
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+from itsdangerous import BadSignature, Signer
+from sqlalchemy import delete, insert, select, update
+from .. import db
+
+DEFAULT_TTL = 7 * 24 * 3600
+PURGE_INTERVAL = 1000
+CART_KEY = 'cart'
+
+server_session = db.Table(
+    'server_session',
+    db.Column('id', db.String(64), primary_key=True),
+    db.Column('data', db.LargeBinary, nullable=False),
+    db.Column('expires_at', db.Integer, nullable=False, index=True)
+)
+
+# Header: format version, flags, length of the packed cart
+_HEADER = struct.Struct('<BBI')
+# Cart entry: product id, quantity, price, negotiated price (NaN for none)
+_CART_ENTRY = struct.Struct('<IIdd')
+_VERSION = 1
+_HAS_CART = 1
+_MAX_UINT32 = 2 ** 32 - 1
+_serializer = TaggedJSONSerializer()
+
+
+def _packable(cart):
+    if not isinstance(cart, dict):
+        return False
+    for product_id, item in cart.items():
+        if not (isinstance(product_id, str) and product_id.isdigit() and isinstance(item, dict)):
+            return False
+        if set(item) != {'quantity', 'price', 'negotiated_price'} or not isinstance(item['quantity'], int):
+            return False
+        if not isinstance(item['price'], (int, float)) or \
+                not isinstance(item['negotiated_price'], (int, float, type(None))):
+            return False
+    return True
+
+
+def _pack_cart(cart):
+    # Lines no cart route accepts (a quantity below 1, or an id or quantity
+    # too large for the entry) are dropped rather than failing the response
+    return b''.join(
+        _CART_ENTRY.pack(
+            int(product_id), item['quantity'], float(item['price']),
+            math.nan if item['negotiated_price'] is None else float(item['negotiated_price'])
+        )
+        for product_id, item in cart.items()
+        if int(product_id) <= _MAX_UINT32 and 1 <= item['quantity'] <= _MAX_UINT32
+    )
+
+
+def _unpack_cart(blob):
+    cart = {}
+    for product_id, quantity, price, negotiated_price in _CART_ENTRY.iter_unpack(blob):
+        cart[str(product_id)] = {
+            'quantity': quantity,
+            'price': price,
+            'negotiated_price': None if math.isnan(negotiated_price) else negotiated_price
+        }
+    return cart
+
+
+def encode_session(data):
+    """Serialize a session dict to bytes, packing a well-formed cart map"""
+    data = dict(data)
+    flags, cart_blob = 0, b''
+    if _packable(data.get(CART_KEY)):
+        flags |= _HAS_CART
+        cart_blob = _pack_cart(data.pop(CART_KEY))
+    rest = _serializer.dumps(data).encode('utf-8') if data else b''
+    return _HEADER.pack(_VERSION, flags, len(cart_blob)) + cart_blob + rest
+
+
+def decode_session(blob):
+    version, flags, cart_length = _HEADER.unpack_from(blob)
+    if version != _VERSION:
+        raise ValueError(f'Unknown session record version {version}')
+    offset = _HEADER.size
+    rest = blob[offset + cart_length:]
+    data = _serializer.loads(rest.decode('utf-8')) if rest else {}
+    if flags & _HAS_CART:
+        data[CART_KEY] = _unpack_cart(blob[offset:offset + cart_length])
+    return data
+
+
+class SQLAlchemySessionStore:
+    """Session records in the server_session table"""
+
+    def load(self, sid):
+        with db.engine.connect() as conn:
+            return conn.execute(
+                select(server_session.c.data, server_session.c.expires_at)
+                .where(server_session.c.id == sid, server_session.c.expires_at > int(time.time()))
+            ).first()
+
+    def save(self, sid, data, expires_at):
+        with db.engine.begin() as conn:
+            updated = conn.execute(
+                update(server_session).where(server_session.c.id == sid)
+                .values(data=data, expires_at=expires_at)
+            ).rowcount
+            if not updated:
+                conn.execute(insert(server_session).values(id=sid, data=data, expires_at=expires_at))
+
+    def delete(self, sid):
+        with db.engine.begin() as conn:
+            conn.execute(delete(server_session).where(server_session.c.id == sid))
+
+    def purge_expired(self):
+        with db.engine.begin() as conn:
+            return conn.execute(
+                delete(server_session).where(server_session.c.expires_at <= int(time.time()))
+            ).rowcount
+
+
+class DbmSessionStore:
+    """Session records in a dbm file, each prefixed with its expiry time.
+
+    dbm files do not support concurrent writers, so every access holds an
+    exclusive flock on a lock file next to it (shared by all worker
+    processes) as well as a lock for the threads of this one.
+    """
+
+    _expiry = struct.Struct('<q')
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = Lock()
+
+    @contextmanager
+    def _open(self):
+        with self._lock, open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with dbm.open(self.path, 'c') as store:
+                    yield store
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def load(self, sid):
+        with self._open() as store:
+            record = store.get(sid)
+        if record is None:
+            return None
+        expires_at, = self._expiry.unpack_from(record)
+        if expires_at <= time.time():
+            return None
+        return record[self._expiry.size:], expires_at
+
+    def save(self, sid, data, expires_at):
+        with self._open() as store:
+            store[sid] = self._expiry.pack(expires_at) + data
+
+    def delete(self, sid):
+        with self._open() as store:
+            if sid in store:
+                del store[sid]
+
+    def purge_expired(self):
+        now = time.time()
+        with self._open() as store:
+            expired = [key for key in store.keys() if self._expiry.unpack_from(store[key])[0] <= now]
+            for key in expired:
+                del store[key]
+        return len(expired)
+
+
+class ServerSideSession(SecureCookieSession):
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        super().__init__(initial)
+        self.sid = sid
+        self.expires_at = expires_at
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Keep session data in a store, with only a signed id in the cookie"""
+
+    salt = 'server-session'
+
+    def __init__(self, store, ttl=DEFAULT_TTL):
+        self.store = store
+        self.ttl = ttl
+        self._saves = 0
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt)
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie:
+            return ServerSideSession()
+        try:
+            sid = self._signer(app).unsign(cookie).decode('ascii')
+        except BadSignature:
+            return ServerSideSession()
+        record = self.store.load(sid)
+        if record is None:
+            return ServerSideSession()
+        data, expires_at = record
+        try:
+            return ServerSideSession(decode_session(data), sid=sid, expires_at=expires_at)
+        except (ValueError, struct.error):
+            return ServerSideSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.sid is not None and session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        now = int(time.time())
+        # Unchanged sessions are only rewritten once half their lifetime has passed
+        stale = session.expires_at is not None and session.expires_at - now < self.ttl // 2
+        if not (session.modified or stale or session.sid is None):
+            return
+
+        new_sid = session.sid is None
+        if new_sid:
+            session.sid = secrets.token_urlsafe(32)
+        session.expires_at = now + self.ttl
+        self.store.save(session.sid, encode_session(session), session.expires_at)
+        self._purge_periodically()
+
+        if new_sid or session.permanent:
+            response.set_cookie(
+                name,
+                self._signer(app).sign(session.sid).decode('ascii'),
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+
+    def _purge_periodically(self):
+        self._saves += 1
+        if self._saves % PURGE_INTERVAL == 0:
+            self.store.purge_expired()
+
+
+def init_session_interface(app):
+    """Install the session backend selected by SESSION_BACKEND"""
+    backend = app.config.get('SESSION_BACKEND', 'cookie')
+    if backend == 'cookie':
+        return
+    if backend == 'sqlalchemy':
+        store = SQLAlchemySessionStore()
+    elif backend == 'dbm':
+        path = app.config.get('SESSION_DBM_PATH') or os.path.join(app.instance_path, 'sessions')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        store = DbmSessionStore(path)
+    else:
+        raise ValueError(f'Unknown SESSION_BACKEND {backend!r}')
+    app.session_interface = ServerSideSessionInterface(store, ttl=app.config.get('SESSION_TTL', DEFAULT_TTL))
@@ -0,0 +1,162 @@
+"""Trigram index for typo-tolerant product and shop name search.
+
+Every word of a product name, product category and shop name is split into
+overlapping three-letter grams ("chicken" -> "  c", " ch", "chi", ...,
+"en ") and stored as (trigram, kind, ref_id) postings together with the
+number of distinct trigrams in the indexed text. A misspelt query such as
+"chiken" still shares most of its trigrams with "chicken", so candidates
+are found with one indexed IN lookup on the trigram column and ranked by
+Jaccard similarity computed in the same grouped query.
+
+The postings are written from mapper events inside the flush, so they
+commit or roll back together with the rows they describe. The side table
+is used on every database, including Postgres, so ranking is identical
+everywhere and no extension has to be installed.
+"""
+from flask import current_app
+from sqlalchemy import and_, event, func, select
+from sqlalchemy.exc import OperationalError
+from .. import db
+from ..models.shop import Shop, Product
+from .search_index import tokenize
+
+# Minimum share of the query's trigrams a candidate must contain
+DEFAULT_THRESHOLD = 0.5
+DEFAULT_LIMIT = 50
+
+search_trigram = db.Table(
+    'search_trigram',
+    db.Column('trigram', db.String(3), primary_key=True),
+    db.Column('kind', db.String(10), primary_key=True),
+    db.Column('ref_id', db.Integer, primary_key=True),
+    db.Column('size', db.Integer, nullable=False),
+    db.Index('ix_search_trigram_ref', 'kind', 'ref_id')
+)
+
+# What gets indexed: kind -> (model, attribute)
+INDEXED_FIELDS = {
+    'product': (Product, 'name'),
+    'category': (Product, 'category'),
+    'shop': (Shop, 'name')
+}
+
+
+def trigrams(value):
+    """Return the set of trigrams of every word in value, padded like pg_trgm"""
+    grams = set()
+    for word in tokenize(value):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _postings(kind, ref_id, value):
+    grams = trigrams(value)
+    return [
+        {'trigram': gram, 'kind': kind, 'ref_id': ref_id, 'size': len(grams)}
+        for gram in grams
+    ]
+
+
+def _index(connection, kind, ref_id, value):
+    rows = _postings(kind, ref_id, value)
+    if rows:
+        connection.execute(search_trigram.insert(), rows)
+
+
+def _unindex(connection, kind, ref_id):
+    connection.execute(search_trigram.delete().where(and_(
+        search_trigram.c.kind == kind,
+        search_trigram.c.ref_id == ref_id
+    )))
+
+
+def rebuild_trigram_index():
+    """Repopulate the trigram postings from the product and shop tables"""
+    with db.engine.begin() as conn:
+        conn.execute(search_trigram.delete())
+        for kind, (model, attr) in INDEXED_FIELDS.items():
+            column = getattr(model, attr)
+            rows = []
+            for ref_id, value in conn.execute(select(model.id, column).where(column != None)):
+                rows.extend(_postings(kind, ref_id, value))
+            if rows:
+                conn.execute(search_trigram.insert(), rows)
+
+
+def ensure_trigram_index():
+    """Backfill the postings at startup when the table is empty but the catalog is not"""
+    try:
+        with db.engine.connect() as conn:
+            indexed = conn.execute(select(func.count()).select_from(search_trigram)).scalar()
+            named = conn.execute(select(func.count()).select_from(Product)).scalar() + \
+                conn.execute(select(func.count()).select_from(Shop)).scalar()
+        if named and not indexed:
+            rebuild_trigram_index()
+    except OperationalError as e:
+        current_app.logger.warning(f'Trigram index unavailable: {str(e)}')
+
+
+def fuzzy_matches(query, kinds, limit=DEFAULT_LIMIT, threshold=None):
+    """Return [(kind, ref_id, similarity)] for indexed texts similar to query, best first"""
+    grams = trigrams(query)
+    if not grams:
+        return []
+    if threshold is None:
+        threshold = current_app.config.get('FUZZY_SEARCH_THRESHOLD', DEFAULT_THRESHOLD)
+
+    shared = func.count(search_trigram.c.trigram)
+    size = func.max(search_trigram.c.size)
+    similarity = (shared * 1.0 / (size + len(grams) - shared)).label('similarity')
+    rows = db.session.execute(
+        select(search_trigram.c.kind, search_trigram.c.ref_id, similarity)
+        .where(search_trigram.c.trigram.in_(grams), search_trigram.c.kind.in_(kinds))
+        .group_by(search_trigram.c.kind, search_trigram.c.ref_id)
+        .having(shared >= threshold * len(grams))
+        .order_by(similarity.desc(), search_trigram.c.ref_id)
+        .limit(limit)
+    )
+    return [(row.kind, row.ref_id, row.similarity) for row in rows]
+
+
+def fuzzy_product_ids(query, limit=DEFAULT_LIMIT):
+    """Return ids of products whose name or category resembles query, best first"""
+    best = {}
+    for _, ref_id, similarity in fuzzy_matches(query, ('product', 'category'), limit * 2):
+        best[ref_id] = max(similarity, best.get(ref_id, 0))
+    ranked = sorted(best.items(), key=lambda item: (-item[1], item[0]))
+    return [ref_id for ref_id, _ in ranked[:limit]]
+
+
+def fuzzy_shop_ids(query, limit=DEFAULT_LIMIT):
+    """Return ids of shops whose name resembles query, best first"""
+    return [ref_id for _, ref_id, _ in fuzzy_matches(query, ('shop',), limit)]
+
+
+def _kinds_for(target):
+    return [kind for kind, (model, _) in INDEXED_FIELDS.items() if isinstance(target, model)]
+
+
+def on_insert(mapper, connection, target):
+    for kind in _kinds_for(target):
+        _index(connection, kind, target.id, getattr(target, INDEXED_FIELDS[kind][1]))
+
+
+def on_update(mapper, connection, target):
+    state = db.inspect(target)
+    for kind in _kinds_for(target):
+        attr = INDEXED_FIELDS[kind][1]
+        if state.attrs[attr].history.has_changes():
+            _unindex(connection, kind, target.id)
+            _index(connection, kind, target.id, getattr(target, attr))
+
+
+def on_delete(mapper, connection, target):
+    for kind in _kinds_for(target):
+        _unindex(connection, kind, target.id)
+
+
+for model in (Shop, Product):
+    event.listen(model, 'after_insert', on_insert)
+    event.listen(model, 'after_update', on_update)
+    event.listen(model, 'after_delete', on_delete)
@@ -0,0 +1,39 @@
+"""Add denormalized item_count and total_amount to cart
+
+Revision ID: add_cart_counters
+Revises: add_product_rating_index
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_cart_counters'
+down_revision = 'add_product_rating_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('cart') as batch_op:
+        batch_op.add_column(sa.Column('item_count', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('total_amount', sa.Float(), nullable=False, server_default='0'))
+    op.create_index('ix_cart_user_id', 'cart', ['user_id'])
+    op.execute("""
+        UPDATE cart SET
+            item_count = (SELECT COALESCE(SUM(quantity), 0) FROM cart_item WHERE cart_item.cart_id = cart.id),
+            total_amount = (
+                SELECT COALESCE(SUM(cart_item.quantity * COALESCE(cart_item.negotiated_price, product.price)), 0)
+                FROM cart_item JOIN product ON product.id = cart_item.product_id
+                WHERE cart_item.cart_id = cart.id
+            )
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_cart_user_id', table_name='cart')
+    with op.batch_alter_table('cart') as batch_op:
+        batch_op.drop_column('total_amount')
+        batch_op.drop_column('item_count')
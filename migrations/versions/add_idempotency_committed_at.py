@@ -0,0 +1,24 @@
+"""Add committed_at to idempotency_key, set in the transaction of the keyed request
+
+Revision ID: add_idempotency_committed_at
+Revises: add_order_archive
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_idempotency_committed_at'
+down_revision = 'add_order_archive'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('idempotency_key', sa.Column('committed_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('idempotency_key', 'committed_at')
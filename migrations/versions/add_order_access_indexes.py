@@ -0,0 +1,37 @@
+"""Add composite indexes for order, cart item, negotiation and review lookups
+
+Revision ID: add_order_access_indexes
+Revises: add_notification_outbox
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_order_access_indexes'
+down_revision = 'add_notification_outbox'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_order_customer_status', 'order', ['customer_id', 'status'])
+    op.create_index('ix_order_shop_status_created_at', 'order', ['shop_id', 'status', 'created_at'])
+    op.create_index('ix_order_delivery_status_updated_at', 'order',
+                    ['delivery_person_id', 'status', 'updated_at'])
+    op.create_index('ix_order_item_order_id', 'order_item', ['order_id'])
+    op.create_index('ix_cart_item_cart_product', 'cart_item', ['cart_id', 'product_id'])
+    op.create_index('ix_negotiation_customer_product_status', 'negotiation',
+                    ['customer_id', 'product_id', 'status'])
+    op.create_index('ix_review_product_id', 'review', ['product_id'])
+
+
+def downgrade():
+    op.drop_index('ix_review_product_id', table_name='review')
+    op.drop_index('ix_negotiation_customer_product_status', table_name='negotiation')
+    op.drop_index('ix_cart_item_cart_product', table_name='cart_item')
+    op.drop_index('ix_order_item_order_id', table_name='order_item')
+    op.drop_index('ix_order_delivery_status_updated_at', table_name='order')
+    op.drop_index('ix_order_shop_status_created_at', table_name='order')
+    op.drop_index('ix_order_customer_status', table_name='order')
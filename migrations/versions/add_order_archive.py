@@ -0,0 +1,69 @@
+"""Add order_archive and order_item_archive tables for finished orders
+
+Revision ID: add_order_archive
+Revises: add_order_status_events
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_order_archive'
+down_revision = 'add_order_status_events'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'order_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('customer_id', sa.Integer(), nullable=False),
+        sa.Column('shop_id', sa.Integer(), nullable=False),
+        sa.Column('delivery_person_id', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('total_amount', sa.Float(), nullable=False),
+        sa.Column('delivery_fee', sa.Float(), nullable=False),
+        sa.Column('delivery_address', sa.String(length=200), nullable=True),
+        sa.Column('delivery_lat', sa.Float(), nullable=True),
+        sa.Column('delivery_lng', sa.Float(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('estimated_delivery_time', sa.DateTime(), nullable=True),
+        sa.Column('special_instructions', sa.Text(), nullable=True),
+        sa.Column('payment_method', sa.String(length=20), nullable=False),
+        sa.Column('payment_status', sa.String(length=20), nullable=False),
+        sa.Column('payment_details', sa.JSON(), nullable=True),
+        sa.Column('payment_transaction_id', sa.String(length=100), nullable=True),
+        sa.Column('notes', sa.JSON(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['customer_id'], ['user.id']),
+        sa.ForeignKeyConstraint(['delivery_person_id'], ['user.id']),
+        sa.ForeignKeyConstraint(['shop_id'], ['shop.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_order_archive_customer_created_at', 'order_archive', ['customer_id', 'created_at'])
+    op.create_index('ix_order_archive_shop_created_at', 'order_archive', ['shop_id', 'created_at'])
+    op.create_table(
+        'order_item_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('order_id', sa.Integer(), nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('price', sa.Float(), nullable=False),
+        sa.Column('negotiated_price', sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(['order_id'], ['order_archive.id']),
+        sa.ForeignKeyConstraint(['product_id'], ['product.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_order_item_archive_order_id', 'order_item_archive', ['order_id'])
+
+
+def downgrade():
+    op.drop_index('ix_order_item_archive_order_id', table_name='order_item_archive')
+    op.drop_table('order_item_archive')
+    op.drop_index('ix_order_archive_shop_created_at', table_name='order_archive')
+    op.drop_index('ix_order_archive_customer_created_at', table_name='order_archive')
+    op.drop_table('order_archive')
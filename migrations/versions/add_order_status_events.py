@@ -0,0 +1,54 @@
+"""Add order_status_event log and shop_daily_order_counts counters
+
+Revision ID: add_order_status_events
+Revises: add_order_access_indexes
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_order_status_events'
+down_revision = 'add_order_access_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'order_status_event',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('order_id', sa.Integer(), nullable=False),
+        sa.Column('shop_id', sa.Integer(), nullable=False),
+        sa.Column('from_status', sa.String(length=20), nullable=True),
+        sa.Column('to_status', sa.String(length=20), nullable=False),
+        sa.Column('actor_id', sa.Integer(), nullable=True),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_order_status_event_order', 'order_status_event', ['order_id', 'id'])
+    op.create_table(
+        'shop_daily_order_counts',
+        sa.Column('shop_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('orders', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('shop_id', 'day', 'status')
+    )
+    op.create_table(
+        'order_event_cursor',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('last_event_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('order_event_cursor')
+    op.drop_table('shop_daily_order_counts')
+    op.drop_index('ix_order_status_event_order', table_name='order_status_event')
+    op.drop_table('order_status_event')
@@ -0,0 +1,25 @@
+"""Add order indexes for the admin dashboards and order lists
+
+Revision ID: add_order_status_indexes
+Revises: add_idempotency_committed_at
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_order_status_indexes'
+down_revision = 'add_idempotency_committed_at'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_order_status_created_at', 'order', ['status', 'created_at'])
+    op.create_index('ix_order_created_at', 'order', ['created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_order_created_at', table_name='order')
+    op.drop_index('ix_order_status_created_at', table_name='order')
@@ -0,0 +1,54 @@
+"""Add BM25 postings and document stats tables for product ranking
+
+Revision ID: add_product_ranking_index
+Revises: add_search_trigram
+Create Date: 2026-10-16 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from ecommerce.utils.ranking import _document
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_product_ranking_index'
+down_revision = 'add_search_trigram'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    terms = op.create_table('product_term',
+        sa.Column('term', sa.String(length=64), nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('field', sa.SmallInteger(), nullable=False),
+        sa.Column('tf', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('term', 'product_id', 'field')
+    )
+    op.create_index('ix_product_term_product', 'product_term', ['product_id'])
+    stats = op.create_table('product_doc_stats',
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('name_len', sa.Integer(), nullable=False),
+        sa.Column('category_len', sa.Integer(), nullable=False),
+        sa.Column('description_len', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('product_id')
+    )
+
+    # Backfill existing products
+    conn = op.get_bind()
+    all_postings, all_stats = [], []
+    for product_id, name, category, description in conn.execute(
+            sa.text('SELECT id, name, category, description FROM product')).fetchall():
+        postings, doc_stats = _document(product_id, (name, category, description))
+        all_postings.extend(postings)
+        all_stats.append(doc_stats)
+    if all_postings:
+        op.bulk_insert(terms, all_postings)
+    if all_stats:
+        op.bulk_insert(stats, all_stats)
+
+
+def downgrade():
+    op.drop_table('product_doc_stats')
+    op.drop_index('ix_product_term_product', table_name='product_term')
+    op.drop_table('product_term')
@@ -0,0 +1,23 @@
+"""Add (rating, created_at) index to product
+
+Revision ID: add_product_rating_index
+Revises: add_product_recommendations
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_product_rating_index'
+down_revision = 'add_product_recommendations'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_product_rating_created_at', 'product', ['rating', 'created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_product_rating_created_at', table_name='product')
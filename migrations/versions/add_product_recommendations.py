@@ -0,0 +1,42 @@
+"""Add co-occurrence and recommendation tables
+
+Revision ID: add_product_recommendations
+Revises: add_product_ranking_index
+Create Date: 2026-10-16 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_product_recommendations'
+down_revision = 'add_product_ranking_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('product_cooccurrence',
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('other_id', sa.Integer(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('product_id', 'other_id')
+    )
+    op.create_table('product_recommendation',
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('rank', sa.Integer(), nullable=False),
+        sa.Column('recommended_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('product_id', 'rank')
+    )
+    op.create_table('recommendation_order',
+        sa.Column('order_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('order_id')
+    )
+
+
+def downgrade():
+    op.drop_table('recommendation_order')
+    op.drop_table('product_recommendation')
+    op.drop_table('product_cooccurrence')
@@ -0,0 +1,43 @@
+"""Add full-text search index for products
+
+Revision ID: add_product_search_index
+Revises: add_order_notes
+Create Date: 2026-10-16 09:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_product_search_index'
+down_revision = 'add_order_notes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS product_fts "
+            "USING fts5(name, category, description, tokenize='unicode61 remove_diacritics 2')"
+        )
+        op.execute(
+            "INSERT INTO product_fts(rowid, name, category, description) "
+            "SELECT id, name, coalesce(category, ''), coalesce(description, '') FROM product"
+        )
+    elif dialect == 'postgresql':
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_product_search_vector ON product USING gin (("
+            "setweight(to_tsvector('simple', coalesce(product.name, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(product.category, '')), 'B') || "
+            "setweight(to_tsvector('simple', coalesce(product.description, '')), 'C')))"
+        )
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS product_fts')
+    elif dialect == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_product_search_vector')
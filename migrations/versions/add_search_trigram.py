@@ -0,0 +1,49 @@
+"""Add trigram postings table for fuzzy name search
+
+Revision ID: add_search_trigram
+Revises: add_shop_geohash
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from ecommerce.utils.trigram import trigrams
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_search_trigram'
+down_revision = 'add_shop_geohash'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    table = op.create_table('search_trigram',
+        sa.Column('trigram', sa.String(length=3), nullable=False),
+        sa.Column('kind', sa.String(length=10), nullable=False),
+        sa.Column('ref_id', sa.Integer(), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('trigram', 'kind', 'ref_id')
+    )
+    op.create_index('ix_search_trigram_ref', 'search_trigram', ['kind', 'ref_id'])
+
+    # Backfill postings for existing products and shops
+    conn = op.get_bind()
+    sources = [
+        ('product', 'SELECT id, name FROM product WHERE name IS NOT NULL'),
+        ('category', 'SELECT id, category FROM product WHERE category IS NOT NULL'),
+        ('shop', 'SELECT id, name FROM shop WHERE name IS NOT NULL')
+    ]
+    for kind, query in sources:
+        rows = []
+        for ref_id, value in conn.execute(sa.text(query)).fetchall():
+            grams = trigrams(value)
+            rows.extend({'trigram': gram, 'kind': kind, 'ref_id': ref_id, 'size': len(grams)}
+                        for gram in grams)
+        if rows:
+            op.bulk_insert(table, rows)
+
+
+def downgrade():
+    op.drop_index('ix_search_trigram_ref', table_name='search_trigram')
+    op.drop_table('search_trigram')
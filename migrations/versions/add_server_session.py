@@ -0,0 +1,32 @@
+"""Add server_session table for server-side sessions
+
+Revision ID: add_server_session
+Revises: add_cart_counters
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_server_session'
+down_revision = 'add_cart_counters'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'server_session',
+        sa.Column('id', sa.String(length=64), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('expires_at', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_server_session_expires_at', 'server_session', ['expires_at'])
+
+
+def downgrade():
+    op.drop_index('ix_server_session_expires_at', table_name='server_session')
+    op.drop_table('server_session')
@@ -0,0 +1,39 @@
+"""Add indexed geohash column to shop
+
+Revision ID: add_shop_geohash
+Revises: add_product_search_index
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from ecommerce.utils.geohash import encode_geohash
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_shop_geohash'
+down_revision = 'add_product_search_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('shop', sa.Column('geohash', sa.String(length=12), nullable=True))
+    op.create_index('ix_shop_geohash', 'shop', ['geohash'])
+
+    # Backfill existing shops
+    conn = op.get_bind()
+    shops = conn.execute(sa.text(
+        'SELECT id, location_lat, location_lng FROM shop '
+        'WHERE location_lat IS NOT NULL AND location_lng IS NOT NULL'
+    )).fetchall()
+    for shop_id, lat, lng in shops:
+        conn.execute(
+            sa.text('UPDATE shop SET geohash = :geohash WHERE id = :id'),
+            {'geohash': encode_geohash(lat, lng), 'id': shop_id}
+        )
+
+
+def downgrade():
+    op.drop_index('ix_shop_geohash', table_name='shop')
+    op.drop_column('shop', 'geohash')
@@ -0,0 +1,37 @@
+"""Add stock_reservation table for cart stock holds
+
+Revision ID: add_stock_reservations
+Revises: add_server_session
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_stock_reservations'
+down_revision = 'add_server_session'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'stock_reservation',
+        sa.Column('cart_id', sa.Integer(), nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['cart_id'], ['cart.id']),
+        sa.ForeignKeyConstraint(['product_id'], ['product.id']),
+        sa.PrimaryKeyConstraint('cart_id', 'product_id')
+    )
+    op.create_index('ix_stock_reservation_expires_at', 'stock_reservation', ['expires_at'])
+    op.create_index('ix_stock_reservation_product_expires', 'stock_reservation', ['product_id', 'expires_at'])
+
+
+def downgrade():
+    op.drop_index('ix_stock_reservation_product_expires', table_name='stock_reservation')
+    op.drop_index('ix_stock_reservation_expires_at', table_name='stock_reservation')
+    op.drop_table('stock_reservation')
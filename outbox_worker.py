@@ -0,0 +1,25 @@
+"""Send queued order notifications from the notification outbox.
+
+The web server (run.py) already drains the outbox in a background thread;
+run this as a separate process to take that work off the web workers, or
+where the app is served without run.py. Pass --once
+to send the currently due notifications and exit (e.g. from cron).
+"""
+import sys
+import time
+from ecommerce import create_app
+from ecommerce.utils.outbox import drain_outbox
+
+def main():
+    app = create_app()
+    batch_size = app.config['OUTBOX_BATCH_SIZE']
+    while True:
+        sent = drain_outbox(app)
+        print(f"Sent {sent} notifications")
+        if '--once' in sys.argv:
+            break
+        if sent < batch_size:
+            time.sleep(app.config['OUTBOX_POLL_INTERVAL'])
+
+if __name__ == '__main__':
+    main()
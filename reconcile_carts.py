@@ -0,0 +1,18 @@
+"""Check the denormalized cart counters against the cart items.
+
+Run periodically (e.g. from cron). Pass --check to only report drifted
+carts without repairing them.
+"""
+import sys
+from ecommerce import create_app, db
+from ecommerce.utils.cart_counters import reconcile_cart_counters
+
+def main():
+    app = create_app()
+    with app.app_context():
+        stale = reconcile_cart_counters(fix='--check' not in sys.argv)
+        db.session.commit()
+        print(f"Found {len(stale)} carts with stale counters")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+"""Fold newly completed orders into the "customers also bought" recommendations.
+
+Run periodically (e.g. from cron). Pass --rebuild to recount every
+completed order from scratch.
+"""
+import sys
+from ecommerce import create_app
+from ecommerce.utils.recommendations import refresh_recommendations, rebuild_recommendations
+
+def main():
+    app = create_app()
+    with app.app_context():
+        if '--rebuild' in sys.argv:
+            processed = rebuild_recommendations()
+        else:
+            processed = refresh_recommendations()
+        print(f"Processed {processed} completed orders")
+
+if __name__ == '__main__':
+    main()
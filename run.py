@@ -1,6 +1,7 @@
-from ecommerce import create_app
+from ecommerce import create_app, start_background_workers
 
 app = create_app()
+start_background_workers(app)
 
 # These are required for WSGI servers to find the app
 application = app
@@ -0,0 +1,132 @@
+import threading
+import unittest
+from unittest import mock
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop, Product
+from ecommerce.utils.autocomplete import suggestion_index
+from ecommerce.utils.search_cache import invalidate
+
+class AutocompleteTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        suggestion_index.build()
+        self.client = self.app.test_client()
+
+        self.owner = User(
+            username='testshopowner',
+            email='owner@test.com',
+            role='shop_owner'
+        )
+        self.owner.set_password('password')
+        db.session.add(self.owner)
+        db.session.commit()
+
+        self.shop = Shop(
+            name='Dhaka Kitchen',
+            description='Test shop description',
+            owner_id=self.owner.id
+        )
+        db.session.add(self.shop)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_product(self, name, category=None, shop=None):
+        product = Product(
+            name=name,
+            description='',
+            price=10.00,
+            stock=10,
+            shop_id=(shop or self.shop).id,
+            category=category
+        )
+        db.session.add(product)
+        db.session.commit()
+        return product
+
+    def suggestions(self, query, **params):
+        response = self.client.get('/api/search/suggestions', query_string=dict(q=query, **params))
+        self.assertEqual(response.status_code, 200)
+        return [(item['type'], item['name']) for item in response.get_json()]
+
+    def test_matches_word_starts_and_categories(self):
+        self.add_product('Chicken Curry', 'Food')
+        self.add_product('Beef Curry', 'Food')
+
+        self.assertEqual(self.suggestions('cur'), [('product', 'Chicken Curry'), ('product', 'Beef Curry')])
+        self.assertEqual(self.suggestions('chicken c'), [('product', 'Chicken Curry')])
+        self.assertEqual(self.suggestions('foo'), [('product', 'Chicken Curry'), ('product', 'Beef Curry')])
+        self.assertEqual(self.suggestions('kitch'), [('shop', 'Dhaka Kitchen')])
+
+    def test_rename_and_delete_are_applied(self):
+        product = self.add_product('Mango Juice')
+
+        product.name = 'Orange Juice'
+        db.session.commit()
+        self.assertEqual(self.suggestions('mango'), [])
+        self.assertEqual(self.suggestions('orange'), [('product', 'Orange Juice')])
+
+        db.session.delete(product)
+        db.session.commit()
+        self.assertEqual(self.suggestions('orange'), [])
+
+    def test_rolled_back_changes_are_ignored(self):
+        product = self.add_product('Mango Juice')
+
+        product.name = 'Orange Juice'
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self.suggestions('orange'), [])
+        self.assertEqual(self.suggestions('mango'), [('product', 'Mango Juice')])
+
+    def test_inactive_shop_is_hidden_unless_scoped(self):
+        self.add_product('Mango Juice')
+
+        self.shop.is_active = False
+        db.session.commit()
+        self.assertEqual(self.suggestions('dhaka'), [])
+        self.assertEqual(self.suggestions('mango'), [])
+        self.assertEqual(self.suggestions('mango', shop_id=self.shop.id), [('product', 'Mango Juice')])
+
+        self.shop.is_active = True
+        db.session.commit()
+        self.assertEqual(self.suggestions('mango'), [('product', 'Mango Juice')])
+
+    def test_scoped_to_shop(self):
+        other = Shop(name='Other Shop', description='', owner_id=self.owner.id)
+        db.session.add(other)
+        db.session.commit()
+        self.add_product('Mango Juice')
+        self.add_product('Mango Lassi', shop=other)
+
+        self.assertEqual(self.suggestions('mango', shop_id=other.id), [('product', 'Mango Lassi')])
+
+    def test_stale_index_is_rebuilt_in_the_background(self):
+        # Written around the mapper events, as by another worker process
+        db.session.execute(db.insert(Product).values(name='Mango Juice', description='', price=10.0,
+                                                     stock=10, shop_id=self.shop.id))
+        db.session.commit()
+        suggestion_index.built_at -= 3600
+
+        release = threading.Event()
+        build = suggestion_index.build
+        with mock.patch.object(suggestion_index, 'build', side_effect=lambda: release.wait(5) and build()):
+            self.assertEqual(self.suggestions('mango'), [])  # Served from the current array
+            invalidate()
+            self.assertEqual(self.suggestions('mango'), [])  # No second rebuild is started
+            rebuilds = [thread for thread in threading.enumerate() if thread.name == 'suggestion-index-rebuild']
+            self.assertEqual(len(rebuilds), 1)
+            release.set()
+            rebuilds[0].join()
+        invalidate()
+        self.assertEqual(self.suggestions('mango'), [('product', 'Mango Juice')])
+
+if __name__ == '__main__':
+    unittest.main()
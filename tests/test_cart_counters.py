@@ -0,0 +1,120 @@
+import unittest
+from sqlalchemy import event
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop, Product
+from ecommerce.models.cart import Cart, CartItem
+from ecommerce.utils.cart_counters import reconcile_cart_counters
+
+class CartCountersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.customer = User(
+            username='testcustomer',
+            email='customer@test.com',
+            role='user'
+        )
+        self.customer.set_password('password')
+        self.owner = User(
+            username='testshopowner',
+            email='owner@test.com',
+            role='shop_owner'
+        )
+        self.owner.set_password('password')
+        db.session.add_all([self.customer, self.owner])
+        db.session.commit()
+
+        self.shop = Shop(name='Test Shop', description='', owner_id=self.owner.id)
+        db.session.add(self.shop)
+        db.session.commit()
+
+        self.tea = Product(name='Tea', description='', price=10.0, stock=50, shop_id=self.shop.id)
+        self.milk = Product(name='Milk', description='', price=4.0, stock=50, shop_id=self.shop.id)
+        db.session.add_all([self.tea, self.milk])
+        db.session.commit()
+
+        self.cart = Cart(user_id=self.customer.id)
+        db.session.add(self.cart)
+        db.session.commit()
+
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.customer.id)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def counters(self):
+        cart = db.session.get(Cart, self.cart.id)
+        return cart.item_count, cart.total_amount
+
+    def test_api_changes_keep_counters(self):
+        response = self.client.post('/api/add', json={'product_id': self.tea.id, 'quantity': 2})
+        self.assertEqual(response.get_json()['cart_count'], 2)
+        self.client.post('/api/add', json={'product_id': self.milk.id, 'quantity': 3})
+        self.assertEqual(self.counters(), (5, 32.0))
+
+        response = self.client.post('/api/update', json={'product_id': self.tea.id, 'quantity': 1})
+        self.assertEqual(response.get_json()['cart_total'], 22.0)
+        self.assertEqual(self.counters(), (4, 22.0))
+
+        self.client.post('/api/remove', json={'product_id': self.milk.id})
+        self.assertEqual(self.counters(), (1, 10.0))
+
+        self.client.post('/api/cart/batch-delete', json={'product_ids': [self.tea.id]})
+        self.assertEqual(self.counters(), (0, 0.0))
+
+    def test_count_endpoint_is_one_read(self):
+        db.session.add_all([
+            CartItem(cart_id=self.cart.id, product_id=self.tea.id, quantity=2, negotiated_price=7.5),
+            CartItem(cart_id=self.cart.id, product_id=self.milk.id, quantity=1),
+        ])
+        db.session.commit()
+
+        statements = []
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            response = self.client.get('/api/cart/count')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+        self.assertEqual(response.get_json()['count'], 3)
+        self.assertEqual(response.get_json()['total'], 19.0)
+        cart_reads = [s for s in statements if 'FROM cart' in s]
+        self.assertEqual(len(cart_reads), 1)
+        self.assertNotIn('FROM cart_item', cart_reads[0])
+
+    def test_price_change_and_rollback(self):
+        db.session.add(CartItem(cart_id=self.cart.id, product_id=self.tea.id, quantity=3))
+        db.session.commit()
+
+        self.tea.price = 12.0
+        db.session.commit()
+        self.assertEqual(self.counters(), (3, 36.0))
+
+        db.session.add(CartItem(cart_id=self.cart.id, product_id=self.milk.id, quantity=1))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self.counters(), (3, 36.0))
+
+    def test_reconcile_repairs_drift(self):
+        db.session.add(CartItem(cart_id=self.cart.id, product_id=self.tea.id, quantity=2))
+        db.session.commit()
+        self.assertEqual(reconcile_cart_counters(), [])
+
+        db.session.execute(db.update(Cart).values(item_count=99, total_amount=0))
+        db.session.commit()
+        self.assertEqual(reconcile_cart_counters(), [self.cart.id])
+        db.session.commit()
+        self.assertEqual(self.counters(), (2, 20.0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+from sqlalchemy import event
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop, Product
+from ecommerce.models.cart import Cart, CartItem
+from ecommerce.utils.cart_hydration import hydrate_cart
+
+class CartHydrationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.customer = User(
+            username='testcustomer',
+            email='customer@test.com',
+            role='user'
+        )
+        self.customer.set_password('password')
+        self.owner = User(
+            username='testshopowner',
+            email='owner@test.com',
+            role='shop_owner'
+        )
+        self.owner.set_password('password')
+        db.session.add_all([self.customer, self.owner])
+        db.session.commit()
+
+        self.shops = [Shop(name=f'Shop {i}', description='', owner_id=self.owner.id) for i in range(3)]
+        db.session.add_all(self.shops)
+        db.session.commit()
+
+        self.products = [
+            Product(name=f'Product {i}', description='', price=10.0 + i, stock=20,
+                    shop_id=self.shops[i % 3].id)
+            for i in range(6)
+        ]
+        db.session.add_all(self.products)
+        db.session.commit()
+
+        self.cart = Cart(user_id=self.customer.id)
+        db.session.add(self.cart)
+        db.session.commit()
+
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.count_statement)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self.count_statement)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def count_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def fill_cart(self, count):
+        for product in self.products[:count]:
+            db.session.add(CartItem(cart_id=self.cart.id, product_id=product.id, quantity=2,
+                                    negotiated_price=8.0 if product is self.products[0] else None))
+        db.session.commit()
+
+    def test_database_cart_is_one_query(self):
+        self.fill_cart(6)
+        db.session.expire_all()
+        cart = Cart.query.get(self.cart.id)
+
+        self.statements.clear()
+        lines, total = hydrate_cart(cart)
+        names = [(line.product.name, line.product.shop.name) for line in lines]
+        self.assertEqual(len(self.statements), 1)
+        self.assertEqual(names[0], ('Product 0', 'Shop 0'))
+        self.assertEqual(lines[0].price, 8.0)
+        self.assertTrue(lines[0].negotiated)
+        self.assertEqual(total, 2 * (8.0 + 11 + 12 + 13 + 14 + 15))
+
+    def test_session_cart_is_one_query(self):
+        cart = {str(product.id): {'quantity': 1, 'price': product.price, 'negotiated_price': None}
+                for product in self.products}
+        cart['999'] = {'quantity': 1, 'price': 1.0}
+        db.session.expire_all()
+
+        self.statements.clear()
+        lines, total = hydrate_cart(cart)
+        [line.product.shop.name for line in lines]
+        self.assertEqual(len(self.statements), 1)
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(total, sum(10.0 + i for i in range(6)))
+
+    def test_cart_endpoints_use_constant_queries(self):
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.customer.id)
+
+        counts = []
+        for size in (1, 6):
+            CartItem.query.delete()
+            db.session.commit()
+            self.fill_cart(size)
+            counts.append([])
+            for url in ('/api/cart/items', '/cart', '/checkout'):
+                db.session.expire_all()
+                self.statements.clear()
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200, url)
+                counts[-1].append(len(self.statements))
+
+        self.assertEqual(counts[0], counts[1])
+        data = self.client.get('/api/cart/items').get_json()
+        self.assertEqual(data['count'], 6)
+        self.assertEqual(data['items'][1]['shop_name'], 'Shop 1')
+
+if __name__ == '__main__':
+    unittest.main()
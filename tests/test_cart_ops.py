@@ -0,0 +1,117 @@
+import unittest
+from sqlalchemy import event
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop, Product
+from ecommerce.models.cart import Cart, CartItem
+
+class CartOpsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.customer = User(
+            username='testcustomer',
+            email='customer@test.com',
+            role='user'
+        )
+        self.customer.set_password('password')
+        self.owner = User(
+            username='testshopowner',
+            email='owner@test.com',
+            role='shop_owner'
+        )
+        self.owner.set_password('password')
+        db.session.add_all([self.customer, self.owner])
+        db.session.commit()
+
+        self.shop = Shop(name='Test Shop', description='', owner_id=self.owner.id)
+        db.session.add(self.shop)
+        db.session.commit()
+
+        self.products = [
+            Product(name=f'Product {i}', description='', price=10.0, stock=5, shop_id=self.shop.id)
+            for i in range(4)
+        ]
+        db.session.add_all(self.products)
+        db.session.commit()
+
+        self.cart = Cart(user_id=self.customer.id)
+        db.session.add(self.cart)
+        db.session.commit()
+        db.session.add(CartItem(cart_id=self.cart.id, product_id=self.products[0].id, quantity=2))
+        db.session.add(CartItem(cart_id=self.cart.id, product_id=self.products[1].id, quantity=1))
+        db.session.commit()
+
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.customer.id)
+
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.count_statement)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self.count_statement)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def count_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def cart_quantities(self):
+        return {item.product_id: item.quantity
+                for item in CartItem.query.filter_by(cart_id=self.cart.id)}
+
+    def test_applies_operations_in_order(self):
+        p = [product.id for product in self.products]
+        response = self.client.post('/api/cart/ops', json={'ops': [
+            {'op': 'add', 'product_id': p[0], 'quantity': 2},
+            {'op': 'remove', 'product_id': p[1]},
+            {'op': 'add', 'product_id': p[2], 'quantity': 1},
+            {'op': 'set', 'product_id': p[2], 'quantity': 3},
+        ]})
+        data = response.get_json()
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(data['cart']['count'], 7)
+        self.assertEqual(data['cart']['total'], 70.0)
+        self.assertEqual(self.cart_quantities(), {p[0]: 4, p[2]: 3})
+
+    def test_one_product_read_and_one_commit(self):
+        ops = [{'op': 'set', 'product_id': product.id, 'quantity': 1} for product in self.products]
+        commits = []
+        def count_commit(conn):
+            commits.append(conn)
+        event.listen(db.engine, 'commit', count_commit)
+        self.statements.clear()
+        try:
+            self.client.post('/api/cart/ops', json={'ops': ops})
+        finally:
+            event.remove(db.engine, 'commit', count_commit)
+        product_reads = [s for s in self.statements if s.startswith('SELECT') and 'FROM product' in s]
+        self.assertEqual(len(product_reads), 1)
+        self.assertEqual(len(commits), 1)
+        self.assertEqual(self.cart_quantities(), {product.id: 1 for product in self.products})
+
+    def test_stock_failure_changes_nothing(self):
+        p = [product.id for product in self.products]
+        response = self.client.post('/api/cart/ops', json={'ops': [
+            {'op': 'remove', 'product_id': p[0]},
+            {'op': 'add', 'product_id': p[1], 'quantity': 5},
+        ]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['product_id'], p[1])
+        self.assertEqual(self.cart_quantities(), {p[0]: 2, p[1]: 1})
+
+    def test_rejects_invalid_operations(self):
+        for ops in ([], [{'op': 'explode', 'product_id': 1}], [{'op': 'set', 'product_id': 'x'}]):
+            response = self.client.post('/api/cart/ops', json={'ops': ops})
+            self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/cart/ops', json={'ops': [{'op': 'add', 'product_id': 999}]})
+        self.assertEqual(response.status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
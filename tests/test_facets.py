@@ -0,0 +1,105 @@
+import unittest
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop, Product
+from ecommerce.utils.facets import facet_key, search_facets, clear_facet_cache
+
+class SearchFacetsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        clear_facet_cache()
+        self.client = self.app.test_client()
+
+        self.owner = User(
+            username='testshopowner',
+            email='owner@test.com',
+            role='shop_owner'
+        )
+        self.owner.set_password('password')
+        db.session.add(self.owner)
+        db.session.commit()
+
+        self.shop = Shop(name='Test Shop', description='', owner_id=self.owner.id)
+        self.other_shop = Shop(name='Other Shop', description='', owner_id=self.owner.id)
+        db.session.add_all([self.shop, self.other_shop])
+        db.session.commit()
+
+        for name, category, price, shop in [
+            ('Chicken Curry', 'Food', 80, self.shop),
+            ('Beef Curry', 'Food', 300, self.shop),
+            ('Fish Curry', 'Food', 350, self.other_shop),
+            ('Curry Powder', 'Spices', 120, self.other_shop),
+            ('Curry Leaves', None, 20, self.shop),
+        ]:
+            db.session.add(Product(name=name, description='', price=price, stock=10,
+                                   shop_id=shop.id, category=category))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def facets(self, category=None, min_price=None, max_price=None):
+        return search_facets(
+            Product.query,
+            facet_key('curry', category=category, min_price=min_price, max_price=max_price),
+            category=category,
+            min_price=min_price,
+            max_price=max_price
+        )
+
+    def test_counts(self):
+        facets = self.facets()
+        self.assertEqual(facets['total'], 5)
+        self.assertEqual(facets['categories'], [('Food', 3), ('Spices', 1)])
+        self.assertEqual(facets['price_buckets'], [
+            {'min': 0, 'max': 100, 'count': 2, 'max_price': 99.99},
+            {'min': 100, 'max': 250, 'count': 1, 'max_price': 249.99},
+            {'min': 250, 'max': 500, 'count': 2, 'max_price': 499.99}
+        ])
+        self.assertEqual(facets['shops'], [
+            {'id': self.shop.id, 'name': 'Test Shop', 'count': 3},
+            {'id': self.other_shop.id, 'name': 'Other Shop', 'count': 2}
+        ])
+
+    def test_each_facet_ignores_its_own_filter(self):
+        facets = self.facets(category='Food', min_price=100)
+        self.assertEqual(facets['total'], 2)
+        # Categories respect the price filter only
+        self.assertEqual(facets['categories'], [('Food', 2), ('Spices', 1)])
+        # Price buckets respect the category filter only
+        self.assertEqual([bucket['count'] for bucket in facets['price_buckets']], [1, 2])
+        self.assertEqual([shop['count'] for shop in facets['shops']], [1, 1])
+
+    def test_bucket_links_match_their_counts(self):
+        db.session.add(Product(name='Mutton Curry', description='', price=250, stock=1,
+                               shop_id=self.shop.id, category='Food'))
+        db.session.commit()
+        for bucket in self.facets()['price_buckets']:
+            matching = Product.query.filter(Product.price >= bucket['min'],
+                                            Product.price <= bucket['max_price']).count()
+            self.assertEqual(matching, bucket['count'], bucket)
+
+    def test_cached_per_filter_set(self):
+        first = self.facets()
+        self.assertIs(self.facets(), first)
+        self.assertIsNot(self.facets(category='Food'), first)
+
+    def test_product_change_invalidates(self):
+        self.facets()
+        db.session.add(Product(name='Lamb Curry', description='', price=400, stock=1,
+                               shop_id=self.shop.id, category='Food'))
+        db.session.commit()
+        self.assertEqual(self.facets()['total'], 6)
+
+    def test_search_page_renders_facets(self):
+        response = self.client.get('/search?q=curry&type=products')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Food (3)', response.get_data(as_text=True))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop
+from ecommerce.utils.distance import nearby_shops
+from ecommerce.utils.geohash import encode_geohash, bounding_box, covering_prefixes
+
+class GeoSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.owner = User(
+            username='testshopowner',
+            email='owner@test.com',
+            role='shop_owner'
+        )
+        self.owner.set_password('password')
+        db.session.add(self.owner)
+        db.session.commit()
+
+        # Dhaka: Gulshan, Dhanmondi and Narayanganj
+        self.gulshan = self.add_shop('Gulshan Shop', 23.7925, 90.4078)
+        self.dhanmondi = self.add_shop('Dhanmondi Shop', 23.7461, 90.3742)
+        self.narayanganj = self.add_shop('Narayanganj Shop', 23.6238, 90.5000)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_shop(self, name, lat, lng):
+        shop = Shop(
+            name=name,
+            description='Test shop description',
+            owner_id=self.owner.id,
+            location_lat=lat,
+            location_lng=lng
+        )
+        db.session.add(shop)
+        db.session.commit()
+        return shop
+
+    def test_geohash_follows_location(self):
+        self.assertEqual(self.gulshan.geohash, encode_geohash(23.7925, 90.4078))
+
+        self.gulshan.location_lat = 23.6238
+        self.gulshan.location_lng = 90.5000
+        db.session.commit()
+        self.assertEqual(self.gulshan.geohash, self.narayanganj.geohash)
+
+    def test_covering_prefixes_contain_center(self):
+        box = bounding_box(23.7925, 90.4078, 10)
+        prefixes = covering_prefixes(*box)
+        self.assertTrue(any(self.gulshan.geohash.startswith(prefix) for prefix in prefixes))
+
+    def test_nearby_shops_ordered_by_distance(self):
+        # From Gulshan: Dhanmondi is ~6km away, Narayanganj ~22km
+        results = nearby_shops(23.7925, 90.4078, 10)
+        self.assertEqual([shop_id for shop_id, _ in results], [self.gulshan.id, self.dhanmondi.id])
+        self.assertLess(results[0][1], 0.01)
+        self.assertLess(results[1][1], 10)
+
+        results = nearby_shops(23.7925, 90.4078, 50)
+        self.assertEqual(
+            [shop_id for shop_id, _ in results],
+            [self.gulshan.id, self.dhanmondi.id, self.narayanganj.id]
+        )
+
+    def test_search_route_filters_by_radius(self):
+        response = self.client.get('/search?type=shops&lat=23.7925&lng=90.4078&distance=10')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Dhanmondi Shop', response.data)
+        self.assertNotIn(b'Narayanganj Shop', response.data)
+
+if __name__ == '__main__':
+    unittest.main()
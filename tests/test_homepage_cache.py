@@ -0,0 +1,85 @@
+import unittest
+from sqlalchemy import event
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop, Product
+from ecommerce.utils.fragments import invalidate_fragments
+
+class HomepageCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        invalidate_fragments()
+        self.client = self.app.test_client()
+
+        self.owner = User(
+            username='testshopowner',
+            email='owner@test.com',
+            role='shop_owner'
+        )
+        self.owner.set_password('password')
+        db.session.add(self.owner)
+        db.session.commit()
+
+        self.shop = Shop(name='Test Shop', description='', owner_id=self.owner.id)
+        db.session.add(self.shop)
+        db.session.commit()
+
+        self.products = []
+        for i, rating in enumerate([4.5, 3.0, 5.0, 1.0]):
+            product = Product(name=f'Product {i}', description='', price=10.00, stock=5,
+                              shop_id=self.shop.id)
+            product.rating = rating
+            self.products.append(product)
+        db.session.add_all(self.products)
+        db.session.commit()
+
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.count_statement)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self.count_statement)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def count_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def homepage(self):
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        return response.get_data(as_text=True)
+
+    def test_steady_state_serves_without_queries(self):
+        html = self.homepage()
+        self.assertLess(html.index('Product 2'), html.index('Product 0'))
+        self.assertNotIn('Product 3', html)
+
+        self.statements.clear()
+        self.assertEqual(self.homepage(), html)
+        self.assertEqual(self.statements, [])
+
+    def test_featured_product_change_invalidates(self):
+        self.homepage()
+        self.products[2].name = 'Renamed Product'
+        db.session.commit()
+        self.assertIn('Renamed Product', self.homepage())
+
+        self.products[3].rating = 5.0
+        db.session.commit()
+        self.assertIn('Product 3', self.homepage())
+
+    def test_unrelated_change_keeps_cache(self):
+        self.homepage()
+        self.products[3].stock = 1
+        db.session.commit()
+
+        self.statements.clear()
+        self.homepage()
+        self.assertEqual(self.statements, [])
+
+if __name__ == '__main__':
+    unittest.main()
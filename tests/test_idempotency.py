@@ -0,0 +1,137 @@
+import hashlib
+import unittest
+from datetime import datetime, timedelta
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop, Product
+from ecommerce.models.cart import CartItem
+from ecommerce.models.negotiation import Negotiation
+from ecommerce.utils.idempotency import idempotency_key
+
+class IdempotencyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.customer = User(
+            username='testcustomer',
+            email='customer@test.com',
+            role='user'
+        )
+        self.customer.set_password('password')
+        self.owner = User(
+            username='testshopowner',
+            email='owner@test.com',
+            role='shop_owner'
+        )
+        self.owner.set_password('password')
+        db.session.add_all([self.customer, self.owner])
+        db.session.commit()
+
+        self.shop = Shop(name='Test Shop', description='', owner_id=self.owner.id)
+        db.session.add(self.shop)
+        db.session.commit()
+
+        self.product = Product(name='Lamp', description='', price=100.0, stock=5, shop_id=self.shop.id)
+        db.session.add(self.product)
+        db.session.commit()
+
+        self.negotiation = Negotiation(self.product.id, self.customer.id, 100.0, 70.0)
+        self.negotiation.add_counter_offer(85.0)
+        db.session.add(self.negotiation)
+        db.session.commit()
+
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.customer.id)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def accept(self, key, body=None):
+        return self.client.post(f'/api/negotiation/{self.negotiation.id}/accept',
+                                json=body or {}, headers={'Idempotency-Key': key})
+
+    def test_retry_replays_first_response(self):
+        first = self.accept('retry-1')
+        self.assertEqual(first.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', first.headers)
+
+        second = self.accept('retry-1')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.get_json(), first.get_json())
+        self.assertEqual(CartItem.query.count(), 1)
+
+        # Without the key the request runs again and is refused
+        self.assertEqual(self.client.post(f'/api/negotiation/{self.negotiation.id}/accept').status_code, 400)
+
+    def test_failed_attempt_frees_the_key(self):
+        self.negotiation.counter_price = None
+        db.session.commit()
+        self.assertEqual(self.accept('retry-2').status_code, 400)
+        self.assertEqual(db.session.execute(db.select(idempotency_key)).all(), [])
+
+        self.negotiation.counter_price = 85.0
+        db.session.commit()
+        self.assertEqual(self.accept('retry-2').status_code, 200)
+
+    def test_cart_created_by_a_failed_checkout_frees_the_key(self):
+        # The first checkout creates the user's (empty) cart, then fails validation
+        body = {'shipping': {'address': '1 Test Road'}, 'payment_method': 'cod'}
+        headers = {'Idempotency-Key': 'first-checkout'}
+        self.assertEqual(self.client.post('/api/checkout', json=body, headers=headers).status_code, 400)
+        self.assertEqual(db.session.execute(db.select(idempotency_key)).all(), [])
+
+        self.assertEqual(self.accept('add-lamp').status_code, 200)
+        response = self.client.post('/api/checkout', json=body, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', response.headers)
+        self.assertIsNotNone(db.session.execute(db.select(idempotency_key.c.committed_at)
+                                                .where(idempotency_key.c.key == 'first-checkout')).scalar())
+
+    def test_conflicting_and_in_progress_keys(self):
+        self.accept('retry-3', {'note': 'a'})
+        self.assertEqual(self.accept('retry-3', {'note': 'b'}).status_code, 422)
+
+        now = datetime.utcnow()
+        db.session.execute(db.insert(idempotency_key).values(
+            user_id=self.customer.id, key='busy', created_at=now,
+            request_hash=hashlib.sha256(b'POST/api/checkout{}').hexdigest(),
+            expires_at=now + timedelta(hours=1)
+        ))
+        db.session.commit()
+        response = self.client.post('/api/checkout', data='{}', content_type='application/json',
+                                    headers={'Idempotency-Key': 'busy'})
+        self.assertEqual(response.status_code, 409)
+
+    def test_committed_attempt_is_never_run_again(self):
+        # The first attempt committed its writes but died before storing the response
+        self.assertEqual(self.accept('retry-4').status_code, 200)
+        db.session.execute(db.update(idempotency_key).values(status_code=None, body=None))
+        db.session.commit()
+        row = db.session.execute(db.select(idempotency_key)).one()
+        self.assertIsNotNone(row.committed_at)
+
+        response = self.accept('retry-4')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(CartItem.query.count(), 1)
+
+    def test_unfinished_attempt_is_not_reclaimed(self):
+        long_ago = datetime.utcnow() - timedelta(hours=1)
+        db.session.execute(db.insert(idempotency_key).values(
+            user_id=self.customer.id, key='slow', created_at=long_ago,
+            request_hash=hashlib.sha256(f'POST/api/negotiation/{self.negotiation.id}/accept{{}}'.encode()).hexdigest(),
+            expires_at=long_ago + timedelta(days=1)
+        ))
+        db.session.commit()
+        self.assertEqual(self.accept('slow').status_code, 409)
+        self.assertEqual(CartItem.query.count(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
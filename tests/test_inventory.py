@@ -0,0 +1,119 @@
+import unittest
+from datetime import datetime, timedelta
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop, Product
+from ecommerce.models.cart import Cart
+from ecommerce.models.order import Order
+from ecommerce.utils.inventory import (
+    available_stock, reserve, release_expired, stock_reservation
+)
+
+class InventoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.customer = User(
+            username='testcustomer',
+            email='customer@test.com',
+            role='user'
+        )
+        self.customer.set_password('password')
+        self.other = User(
+            username='othercustomer',
+            email='other@test.com',
+            role='user'
+        )
+        self.other.set_password('password')
+        self.owner = User(
+            username='testshopowner',
+            email='owner@test.com',
+            role='shop_owner'
+        )
+        self.owner.set_password('password')
+        db.session.add_all([self.customer, self.other, self.owner])
+        db.session.commit()
+
+        self.shop = Shop(name='Test Shop', description='', owner_id=self.owner.id)
+        db.session.add(self.shop)
+        db.session.commit()
+
+        self.product = Product(name='Mango', description='', price=5.0, stock=10, shop_id=self.shop.id)
+        db.session.add(self.product)
+        db.session.commit()
+
+        self.other_cart = Cart(user_id=self.other.id)
+        db.session.add(self.other_cart)
+        db.session.commit()
+
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.customer.id)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def reservations(self):
+        return db.session.execute(
+            db.select(stock_reservation.c.cart_id, stock_reservation.c.quantity)
+            .order_by(stock_reservation.c.cart_id)
+        ).all()
+
+    def test_add_reserves_instead_of_decrementing(self):
+        reserve(self.other_cart.id, {self.product.id: 6})
+        db.session.commit()
+
+        response = self.client.post('/api/add', json={'product_id': self.product.id, 'quantity': 3})
+        self.assertEqual(response.get_json()['product']['remaining_stock'], 1)
+        response = self.client.post('/api/add', json={'product_id': self.product.id, 'quantity': 2})
+        self.assertEqual(response.status_code, 400)
+
+        db.session.refresh(self.product)
+        self.assertEqual(self.product.stock, 10)
+        cart = Cart.query.filter_by(user_id=self.customer.id).one()
+        self.assertEqual(self.reservations(), [(self.other_cart.id, 6), (cart.id, 3)])
+        self.assertEqual(available_stock([self.product.id]), {self.product.id: 1})
+        self.assertEqual(available_stock([self.product.id], exclude_cart_id=cart.id), {self.product.id: 4})
+
+    def test_expired_reservations_stop_counting_and_are_reaped(self):
+        reserve(self.other_cart.id, {self.product.id: 10})
+        db.session.commit()
+        self.assertEqual(available_stock([self.product.id]), {self.product.id: 0})
+
+        db.session.execute(db.update(stock_reservation).values(expires_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+        self.assertEqual(available_stock([self.product.id]), {self.product.id: 10})
+        self.assertEqual(release_expired(), 1)
+        self.assertEqual(self.reservations(), [])
+
+    def test_updates_and_removal_follow_the_cart(self):
+        self.client.post('/api/add', json={'product_id': self.product.id, 'quantity': 2})
+        cart = Cart.query.filter_by(user_id=self.customer.id).one()
+
+        self.client.post('/api/cart/ops', json={'ops': [{'op': 'set', 'product_id': self.product.id, 'quantity': 5}]})
+        self.assertEqual(self.reservations(), [(cart.id, 5)])
+        self.client.post('/api/update', json={'product_id': self.product.id, 'quantity': 4})
+        self.assertEqual(self.reservations(), [(cart.id, 4)])
+        self.client.post('/api/remove', json={'product_id': self.product.id})
+        self.assertEqual(self.reservations(), [])
+
+    def test_checkout_commits_reserved_stock(self):
+        self.client.post('/api/add', json={'product_id': self.product.id, 'quantity': 4})
+        self.client.post('/api/checkout', json={
+            'shipping': {'address': '1 Test Road'},
+            'payment_method': 'cod'
+        })
+        self.assertEqual(Order.query.filter_by(customer_id=self.customer.id).count(), 1)
+
+        db.session.refresh(self.product)
+        self.assertEqual(self.product.stock, 6)
+        self.assertEqual(self.reservations(), [])
+
+if __name__ == '__main__':
+    unittest.main()
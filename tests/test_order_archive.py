@@ -0,0 +1,187 @@
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop, Product
+from ecommerce.models.order import Order, OrderItem, OrderNote, ArchivedOrder, ArchivedOrderItem
+from ecommerce.models.negotiation import DeliveryNegotiation
+from ecommerce.utils.order_placement import insert_orders
+from ecommerce.utils.order_archive import archive_orders, get_order, orders_total, recent_orders
+from ecommerce.utils.pagination import clear_count_cache
+from ecommerce.utils.recommendations import refresh_recommendations, rebuild_recommendations, recommended_products
+
+class OrderArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        clear_count_cache()
+        self.client = self.app.test_client()
+
+        self.customer = User(
+            username='testcustomer',
+            email='customer@test.com',
+            role='user'
+        )
+        self.customer.set_password('password')
+        self.owner = User(
+            username='testshopowner',
+            email='owner@test.com',
+            role='shop_owner'
+        )
+        self.owner.set_password('password')
+        db.session.add_all([self.customer, self.owner])
+        db.session.commit()
+
+        self.shop = Shop(name='Test Shop', description='', owner_id=self.owner.id)
+        db.session.add(self.shop)
+        db.session.commit()
+
+        self.product = Product(name='Rice', description='', price=10.0, stock=50, shop_id=self.shop.id)
+        db.session.add(self.product)
+        db.session.commit()
+        self.customer_id = self.customer.id
+        self.owner_id = self.owner.id
+        self.shop_id = self.shop.id
+        self.product_id = self.product.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def place(self, status, age_days):
+        order_id, = insert_orders(self.customer_id, {self.shop_id: [(self.product_id, 2, 10.0)]})
+        db.session.commit()
+        updated_at = datetime.utcnow() - timedelta(days=age_days)
+        db.session.execute(db.update(Order).where(Order.id == order_id)
+                           .values(status=status, created_at=updated_at, updated_at=updated_at))
+        db.session.commit()
+        return order_id
+
+    def test_moves_only_old_finished_orders(self):
+        old_completed = self.place('completed', 200)
+        old_cancelled = self.place('cancelled', 120)
+        recent = self.place('completed', 5)
+        open_order = self.place('confirmed', 200)
+        negotiated = self.place('completed', 200)
+        db.session.add(DeliveryNegotiation(order_id=negotiated, customer_id=self.customer_id,
+                                           initial_fee=5.0, offered_fee=4.0))
+        db.session.add(OrderNote(order_id=old_completed, user_id=self.owner_id, content='Left at the door'))
+        db.session.commit()
+
+        self.assertEqual(archive_orders(older_than_days=90, batch_size=1), 2)
+        self.assertEqual(sorted(order.id for order in Order.query), sorted([recent, open_order, negotiated]))
+        self.assertEqual(sorted(order.id for order in ArchivedOrder.query), sorted([old_completed, old_cancelled]))
+        self.assertEqual(OrderItem.query.filter(OrderItem.order_id.in_([old_completed, old_cancelled])).count(), 0)
+        self.assertEqual(OrderNote.query.count(), 0)
+
+        archived = get_order(old_completed)
+        self.assertTrue(archived.is_archived)
+        self.assertEqual((archived.status, archived.total_amount), ('completed', 20.0))
+        self.assertEqual([(item.product.name, item.quantity) for item in archived.items], [('Rice', 2)])
+        self.assertEqual(archived.notes[0]['content'], 'Left at the door')
+        self.assertEqual(archived.to_dict()['items'][0]['subtotal'], 20.0)
+        self.assertFalse(get_order(recent).is_archived)
+
+        self.assertEqual(archive_orders(older_than_days=90), 0)
+
+    def test_customer_reads_archived_orders(self):
+        order_id = self.place('completed', 200)
+        recent = self.place('pending', 0)
+        archive_orders(older_than_days=90)
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.customer_id)
+
+        response = self.client.get(f'/user/order/{order_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Archived', response.get_data(as_text=True))
+
+        page = self.client.get('/user/orders/archive').get_data(as_text=True)
+        self.assertIn(f'#{order_id}<', page)
+        self.assertNotIn(f'#{recent}<', page)
+        page = self.client.get('/user/orders').get_data(as_text=True)
+        self.assertIn('All (1)', page)
+        self.assertNotIn(f'#{order_id}<', page)
+
+        self.assertIn('Archived (1)', self.client.get('/user/orders/archive').get_data(as_text=True))
+        self.assertEqual(self.client.get('/user/order/9999').status_code, 404)
+
+    def test_api_history_merges_archived_orders(self):
+        ids = [self.place('completed', age) for age in (300, 200, 100, 50)]
+        ids.append(self.place('pending', 0))
+        self.assertEqual(archive_orders(older_than_days=90), 3)
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.customer_id)
+
+        seen, cursor = [], None
+        while True:
+            url = '/api/orders?per_page=2&with_total=1' + (f'&cursor={cursor}' if cursor else '')
+            data = self.client.get(url).get_json()
+            self.assertEqual(data['pagination']['total'], 5)
+            seen.extend((item['id'], item['archived']) for item in data['items'])
+            cursor = data['pagination']['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, [(ids[4], False), (ids[3], False), (ids[2], True), (ids[1], True), (ids[0], True)])
+
+        # Walking back from the last page returns the previous one
+        data = self.client.get(f'/api/orders?per_page=2&cursor={data["pagination"]["prev_cursor"]}').get_json()
+        self.assertEqual([item['id'] for item in data['items']], [ids[2], ids[1]])
+
+        data = self.client.get('/api/orders?status=completed&sort=oldest').get_json()
+        self.assertEqual([item['id'] for item in data['items']], ids[:4])
+
+    def test_api_shop_orders_include_archived_orders(self):
+        ids = [self.place('completed', age) for age in (200, 5)]
+        archive_orders(older_than_days=90)
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.owner_id)
+        data = self.client.get('/api/shop/orders?status=completed').get_json()
+        self.assertEqual([(item['id'], item['archived']) for item in data['items']],
+                         [(ids[1], False), (ids[0], True)])
+
+    def test_history_figures_include_archived_orders(self):
+        courier = User(username='testcourier', email='courier@test.com', role='delivery')
+        courier.set_password('password')
+        db.session.add(courier)
+        db.session.commit()
+        courier_id = courier.id
+        old = self.place('completed', 200)
+        recent = self.place('completed', 5)
+        db.session.execute(db.update(Order).values(delivery_person_id=courier_id, updated_at=Order.updated_at))
+        db.session.commit()
+        self.assertEqual(archive_orders(older_than_days=90), 1)
+
+        self.assertEqual(orders_total(func.count, 'id', customer_id=self.customer_id), 2)
+        self.assertEqual(orders_total(func.sum, 'total_amount', customer_id=self.customer_id,
+                                      status='completed'), 40.0)
+        self.assertEqual(orders_total(func.sum, 'delivery_fee', delivery_person_id=courier_id,
+                                      status='completed'), 10.0)
+        self.assertEqual([order.id for order in recent_orders(10, 'updated_at', delivery_person_id=courier_id)],
+                         [recent, old])
+
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.owner_id)
+        response = self.client.get(f'/shop/order/{old}/details')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Archived', response.get_data(as_text=True))
+
+    def test_recommendations_count_archived_orders(self):
+        other = Product(name='Dal', description='', price=8.0, stock=50, shop_id=self.shop_id)
+        db.session.add(other)
+        db.session.commit()
+        other_id = other.id
+        order_id = self.place('completed', 200)
+        db.session.add(OrderItem(order_id=order_id, product_id=other_id, quantity=1, price=8.0))
+        db.session.commit()
+        archive_orders(older_than_days=90)
+
+        self.assertEqual(refresh_recommendations(), 1)
+        self.assertEqual([product.id for product in recommended_products(self.product_id)], [other_id])
+        self.assertEqual(rebuild_recommendations(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+import unittest
+from datetime import datetime, timedelta
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop, Product
+from ecommerce.models.order import Order
+from ecommerce.utils.order_placement import insert_orders
+from ecommerce.utils.order_events import (
+    order_status_event, shop_daily_order_counts, order_history, fold_order_events, order_totals,
+    ensure_order_events
+)
+
+class OrderEventsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.customer = User(
+            username='testcustomer',
+            email='customer@test.com',
+            role='user'
+        )
+        self.customer.set_password('password')
+        self.owner = User(
+            username='testshopowner',
+            email='owner@test.com',
+            role='shop_owner'
+        )
+        self.owner.set_password('password')
+        db.session.add_all([self.customer, self.owner])
+        db.session.commit()
+
+        self.shop = Shop(name='Test Shop', description='', owner_id=self.owner.id)
+        db.session.add(self.shop)
+        db.session.commit()
+
+        self.product = Product(name='Rice', description='', price=10.0, stock=50, shop_id=self.shop.id)
+        db.session.add(self.product)
+        db.session.commit()
+        self.shop_id = self.shop.id
+        self.owner_id = self.owner.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def place(self, quantity=1):
+        order_id, = insert_orders(self.customer.id, {self.shop_id: [(self.product.id, quantity, 10.0)]})
+        db.session.commit()
+        return order_id
+
+    def transitions(self, order_id):
+        return [(event.from_status, event.to_status) for event in order_history(order_id)]
+
+    def event_row(self, event_id, created_at):
+        return {'id': event_id, 'order_id': 1, 'shop_id': self.shop_id, 'from_status': None,
+                'to_status': 'pending', 'amount': 10.0, 'created_at': created_at}
+
+    def test_every_transition_is_logged(self):
+        order_id = self.place()
+        order = db.session.get(Order, order_id)
+        order.update_status('confirmed')
+        db.session.commit()
+        order.status = 'delivering'  # Ad-hoc write, as in the delivery routes
+        db.session.commit()
+        order.assign_delivery_person(self.owner_id)
+        db.session.commit()
+        self.assertEqual(self.transitions(order_id), [
+            (None, 'pending'), ('pending', 'confirmed'), ('confirmed', 'delivering'), ('delivering', 'assigned')
+        ])
+
+        # Saving without a status change adds nothing
+        order.special_instructions = 'Ring twice'
+        db.session.commit()
+        self.assertEqual(len(order_history(order_id)), 4)
+
+    def test_route_records_the_actor(self):
+        order_id = self.place()
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.owner_id)
+        response = self.client.post(f'/shop/order/{order_id}/update-status', json={'status': 'confirmed'})
+        self.assertEqual(response.status_code, 200)
+        last = order_history(order_id)[-1]
+        self.assertEqual((last.from_status, last.to_status, last.actor_id), ('pending', 'confirmed', self.owner_id))
+
+    def test_folded_counters_match_the_log(self):
+        completed = [self.place(quantity) for quantity in (1, 2, 3)]
+        self.place()
+        for order_id in completed:
+            order = db.session.get(Order, order_id)
+            order.update_status('confirmed')
+            order.update_status('delivering')
+            order.update_status('completed')
+        db.session.commit()
+
+        # Unfolded events are counted straight from the log
+        self.assertEqual(order_totals('completed', shop_id=self.shop_id), (3, 60.0))
+
+        self.assertEqual(fold_order_events(), 4 + 3 * 3)
+        self.assertEqual(fold_order_events(), 0)
+        rows = {row.status: (row.orders, row.amount)
+                for row in db.session.execute(db.select(shop_daily_order_counts)).all()}
+        # Net of the orders that moved on: one order is still pending
+        self.assertEqual(rows['pending'], (1, 10.0))
+        self.assertEqual(rows['confirmed'], (0, 0.0))
+        self.assertEqual(rows['completed'], (3, 60.0))
+
+        yesterday = datetime.utcnow().date() - timedelta(days=2)
+        self.assertEqual(order_totals('completed', shop_id=self.shop_id), (3, 60.0))
+        self.assertEqual(order_totals('completed', day_from=yesterday), (3, 60.0))
+        self.assertEqual(order_totals('completed', day_to=yesterday), (0, 0.0))
+
+        # New events add to the folded counters
+        order = db.session.get(Order, self.place())
+        order.update_status('cancelled')
+        db.session.commit()
+        self.assertEqual(order_totals('pending', shop_id=self.shop_id), (1, 10.0))
+        self.assertEqual(order_totals('cancelled'), (1, 10.0))
+
+    def test_reopened_order_is_counted_once(self):
+        # Status writes in the routes are not limited to update_status()'s transitions
+        order = db.session.get(Order, self.place(2))
+        order.status = 'completed'
+        db.session.commit()
+        order.status = 'delivering'
+        db.session.commit()
+        self.assertEqual(order_totals('completed', shop_id=self.shop_id), (0, 0.0))
+        order.status = 'completed'
+        db.session.commit()
+        self.assertEqual(order_totals('completed', shop_id=self.shop_id), (1, 20.0))
+
+        fold_order_events()
+        self.assertEqual(order_totals('completed', shop_id=self.shop_id), (1, 20.0))
+
+    def test_fold_waits_for_a_lower_id_that_commits_last(self):
+        self.place()
+        self.assertEqual(fold_order_events(), 1)
+        first = db.session.execute(db.select(db.func.max(order_status_event.c.id))).scalar() + 1
+        # SQLite serializes writers, so the ids a sequence would hand out to two
+        # overlapping transactions are given explicitly: the first one written
+        # commits long after the second
+        written = datetime.utcnow() - timedelta(minutes=10)
+        with db.engine.begin() as late, db.engine.connect() as early:
+            with early.begin():
+                early.execute(db.insert(order_status_event), [self.event_row(first + 1, written)])
+            self.assertEqual(fold_order_events(), 0)
+            self.assertEqual(order_totals('pending', shop_id=self.shop_id), (2, 20.0))
+            late.execute(db.insert(order_status_event), [self.event_row(first, written)])
+        self.assertEqual(fold_order_events(), 2)
+        self.assertEqual(order_totals('pending', shop_id=self.shop_id), (3, 30.0))
+
+    def test_fold_gives_up_on_an_old_gap(self):
+        self.place()
+        self.assertEqual(fold_order_events(), 1)
+        missing = db.session.execute(db.select(db.func.max(order_status_event.c.id))).scalar() + 1
+        db.session.execute(db.insert(order_status_event),
+                           [self.event_row(missing + 1, datetime.utcnow() - timedelta(hours=2))])
+        db.session.commit()
+        self.assertEqual(fold_order_events(), 1)
+        self.assertEqual(order_totals('pending', shop_id=self.shop_id), (2, 20.0))
+
+    def test_seeds_log_from_existing_orders(self):
+        order_id = self.place()
+        db.session.get(Order, order_id).update_status('confirmed')
+        db.session.commit()
+        db.session.execute(db.delete(order_status_event))
+        db.session.commit()
+
+        ensure_order_events()
+        self.assertEqual(self.transitions(order_id), [(None, 'confirmed')])
+        ensure_order_events()
+        self.assertEqual(len(order_history(order_id)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import unittest
+from sqlalchemy import event
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop, Product
+from ecommerce.models.cart import Cart, CartItem
+from ecommerce.models.order import Order, OrderItem
+from ecommerce.utils.order_placement import insert_orders, load_orders
+
+class OrderPlacementTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.customer = User(
+            username='testcustomer',
+            email='customer@test.com',
+            role='user'
+        )
+        self.customer.set_password('password')
+        self.owner = User(
+            username='testshopowner',
+            email='owner@test.com',
+            role='shop_owner'
+        )
+        self.owner.set_password('password')
+        db.session.add_all([self.customer, self.owner])
+        db.session.commit()
+
+        self.shops = [Shop(name=f'Shop {i}', description='', owner_id=self.owner.id) for i in range(4)]
+        db.session.add_all(self.shops)
+        db.session.commit()
+
+        self.products = [
+            Product(name=f'Product {i}', description='', price=2.0 + i, stock=10,
+                    shop_id=self.shops[i % 4].id)
+            for i in range(16)
+        ]
+        db.session.add_all(self.products)
+        db.session.commit()
+
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.count_statement)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self.count_statement)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def count_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def inserts(self):
+        return [s for s in self.statements if s.startswith('INSERT INTO')]
+
+    def order_inserts(self):
+        # The status event log gets one more bulk insert
+        return [s for s in self.inserts() if s.split()[2].strip('"') in ('order', 'order_item')]
+
+    def test_insert_orders_in_two_statements(self):
+        shop_lines = {
+            shop.id: [(product.id, 2, product.price) for product in self.products if product.shop_id == shop.id]
+            for shop in self.shops
+        }
+        self.statements.clear()
+        order_ids = insert_orders(self.customer.id, shop_lines, payment_method='bkash',
+                                  payment_details={'mobile_number': '017'})
+        db.session.commit()
+        self.assertEqual(len(self.order_inserts()), 2)
+        self.assertEqual(len(self.inserts()), 3)
+
+        orders = load_orders(order_ids)
+        self.assertEqual([order.shop_id for order in orders], [shop.id for shop in self.shops])
+        first = orders[0]
+        self.assertEqual(first.status, 'pending')
+        self.assertEqual(first.payment_details, {'mobile_number': '017'})
+        self.assertEqual(first.delivery_fee, 5.0)
+        self.assertEqual(first.total_amount, 2 * (2.0 + 6.0 + 10.0 + 14.0))
+        self.assertEqual(len(first.items), 4)
+
+    def fill_cart(self, line_count):
+        cart = Cart(user_id=self.customer.id)
+        db.session.add(cart)
+        db.session.commit()
+        db.session.add_all([
+            CartItem(cart_id=cart.id, product_id=product.id, quantity=1)
+            for product in self.products[:line_count]
+        ])
+        db.session.commit()
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.customer.id)
+
+    def checkout(self, line_count):
+        self.fill_cart(line_count)
+        self.statements.clear()
+        response = self.client.post('/api/checkout', json={
+            'shipping': {'address': '1 Test Road'},
+            'payment_method': 'cod'
+        })
+        self.response = response
+        return self.inserts()
+
+    def test_checkout_inserts_do_not_grow_with_cart(self):
+        inserts = self.checkout(16)
+        self.assertEqual(len(self.order_inserts()), 2)
+        self.assertEqual(Order.query.count(), 4)
+        self.assertEqual(OrderItem.query.count(), 16)
+        self.assertEqual(CartItem.query.count(), 0)
+        self.assertEqual(db.session.get(Product, self.products[0].id).stock, 9)
+
+    def test_checkout_reports_stage_timings(self):
+        self.checkout(8)
+        self.assertEqual(self.response.status_code, 200)
+        stages = [entry.split(';')[0] for entry in self.response.headers['Server-Timing'].split(', ')]
+        self.assertEqual(stages, ['validate', 'reserve', 'write', 'notify', 'commit'])
+        # Products and their shops are loaded together
+        product_selects = [s for s in self.statements if s.startswith('SELECT') and 'FROM cart_item JOIN product' in s]
+        self.assertEqual(len(product_selects), 1)
+
+    def test_validation_reports_every_failing_line(self):
+        self.fill_cart(4)
+        for product in self.products[1:3]:
+            product.stock = 0
+        db.session.commit()
+
+        response = self.client.post('/api/checkout', json={
+            'shipping': {'address': '1 Test Road'},
+            'payment_method': 'cod'
+        })
+        self.assertEqual(response.status_code, 400)
+        message = response.get_json()['message']
+        self.assertIn('Product 1', message)
+        self.assertIn('Product 2', message)
+        self.assertEqual(Order.query.count(), 0)
+        self.assertEqual(CartItem.query.count(), 4)
+
+    def test_checkout_page_places_orders_through_the_same_engine(self):
+        self.fill_cart(6)
+        response = self.client.post('/checkout', data={'address': '1 Test Road', 'payment_method': 'cod'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('validate;dur=', response.headers['Server-Timing'])
+        self.assertEqual(Order.query.count(), 4)
+        self.assertEqual(OrderItem.query.count(), 6)
+        self.assertEqual(CartItem.query.count(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
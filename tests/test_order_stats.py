@@ -0,0 +1,117 @@
+import unittest
+from sqlalchemy import event
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop, Product
+from ecommerce.models.order import Order, OrderItem
+from ecommerce.utils.order_stats import count_by_status, customer_key, shop_key, clear_order_stats
+from ecommerce.utils.order_placement import insert_orders
+
+class OrderStatsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        clear_order_stats()
+        self.client = self.app.test_client()
+
+        self.customer = User(
+            username='testcustomer',
+            email='customer@test.com',
+            role='user'
+        )
+        self.customer.set_password('password')
+        self.owner = User(
+            username='testshopowner',
+            email='owner@test.com',
+            role='shop_owner'
+        )
+        self.owner.set_password('password')
+        db.session.add_all([self.customer, self.owner])
+        db.session.commit()
+
+        self.shop = Shop(name='Test Shop', description='', owner_id=self.owner.id)
+        db.session.add(self.shop)
+        db.session.commit()
+        self.customer_id = self.customer.id
+        self.shop_id = self.shop.id
+
+        self.rice = Product(name='Rice', description='', price=10.0, stock=50, shop_id=self.shop_id)
+        self.dal = Product(name='Dal', description='', price=8.0, stock=50, shop_id=self.shop_id)
+        db.session.add_all([self.rice, self.dal])
+        db.session.commit()
+
+        # Two pending, one confirmed and one completed order, each with two items
+        lines = [(self.rice.id, 1, 10.0), (self.dal.id, 1, 8.0)]
+        self.order_ids = [insert_orders(self.customer_id, {self.shop_id: lines})[0] for _ in range(4)]
+        db.session.commit()
+        orders = Order.query.order_by(Order.id).all()
+        orders[2].status = 'confirmed'
+        orders[3].status = 'completed'
+        db.session.commit()
+
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.count_statement)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self.count_statement)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def count_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def test_counts_every_status_in_one_query(self):
+        # The item join repeats each order twice
+        query = Order.query.filter_by(customer_id=self.customer_id).join(Order.items).distinct()
+        counts = count_by_status(query)
+        self.assertEqual(len(self.statements), 1)
+        self.assertIn('GROUP BY', self.statements[0])
+        self.assertEqual(counts, {'all': 4, 'pending': 2, 'confirmed': 1, 'delivering': 0,
+                                  'completed': 1, 'cancelled': 0})
+
+    def test_cached_counts_are_dropped_on_status_change(self):
+        query = Order.query.filter_by(shop_id=self.shop_id)
+        self.assertEqual(count_by_status(query, shop_key(self.shop_id))['pending'], 2)
+        self.statements.clear()
+        self.assertEqual(count_by_status(query, shop_key(self.shop_id))['pending'], 2)
+        self.assertEqual(self.statements, [])
+
+        order = db.session.get(Order, self.order_ids[0])
+        order.update_status('confirmed')
+        db.session.commit()
+        counts = count_by_status(query, shop_key(self.shop_id))
+        self.assertEqual((counts['pending'], counts['confirmed']), (1, 2))
+
+        # New orders written in bulk invalidate too
+        insert_orders(self.customer_id, {self.shop_id: [(self.rice.id, 1, 10.0)]})
+        db.session.commit()
+        self.assertEqual(count_by_status(query, shop_key(self.shop_id))['all'], 5)
+        self.assertEqual(count_by_status(Order.query.filter_by(customer_id=self.customer_id),
+                                         customer_key(self.customer_id))['pending'], 2)
+
+    def test_rolled_back_change_keeps_the_cache(self):
+        query = Order.query.filter_by(customer_id=self.customer_id)
+        count_by_status(query, customer_key(self.customer_id))
+        order = db.session.get(Order, self.order_ids[0])
+        order.status = 'cancelled'
+        db.session.flush()
+        db.session.rollback()
+        self.statements.clear()
+        self.assertEqual(count_by_status(query, customer_key(self.customer_id))['cancelled'], 0)
+        self.assertEqual(self.statements, [])
+
+    def test_shop_tabs_count_all_statuses_while_filtered(self):
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.owner.id)
+        response = self.client.get('/shop/orders?status=pending')
+        self.assertEqual(response.status_code, 200)
+        page = response.get_data(as_text=True)
+        self.assertIn('Confirmed (1)', page)
+        self.assertIn('Completed (1)', page)
+        self.assertEqual(len([s for s in self.statements if 'GROUP BY' in s and 'count' in s.lower()]), 1)
+
+if __name__ == '__main__':
+    unittest.main()
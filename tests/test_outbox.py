@@ -0,0 +1,124 @@
+import unittest
+from datetime import datetime, timedelta
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop, Product
+from ecommerce.models.cart import Cart, CartItem
+from ecommerce.models.order import Order
+from ecommerce.utils.outbox import notification_outbox, enqueue, drain_outbox, purge_outbox
+
+class OutboxTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app.extensions['mail'].default_sender = 'shop@test.com'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.customer = User(
+            username='testcustomer',
+            email='customer@test.com',
+            role='user'
+        )
+        self.customer.set_password('password')
+        self.owner = User(
+            username='testshopowner',
+            email='owner@test.com',
+            role='shop_owner'
+        )
+        self.owner.set_password('password')
+        db.session.add_all([self.customer, self.owner])
+        db.session.commit()
+
+        self.shop = Shop(name='Test Shop', description='', owner_id=self.owner.id)
+        db.session.add(self.shop)
+        db.session.commit()
+
+        self.product = Product(name='Rice', description='', price=10.0, stock=5, shop_id=self.shop.id)
+        db.session.add(self.product)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def outbox(self):
+        return db.session.execute(db.select(notification_outbox).order_by(notification_outbox.c.id)).all()
+
+    def test_checkout_queues_notifications_and_drain_sends_them(self):
+        cart = Cart(user_id=self.customer.id)
+        db.session.add(cart)
+        db.session.commit()
+        db.session.add(CartItem(cart_id=cart.id, product_id=self.product.id, quantity=2))
+        db.session.commit()
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.customer.id)
+
+        response = self.client.post('/api/checkout', json={
+            'shipping': {'address': '1 Test Road'}, 'payment_method': 'cod'
+        })
+        self.assertEqual(response.status_code, 200)
+        order_id = response.get_json()['order_ids'][0]
+        rows = self.outbox()
+        self.assertEqual(sorted(row.kind for row in rows),
+                         ['admin_order_status', 'customer_order_status', 'shop_owner_new_order'])
+        self.assertTrue(all(row.payload['order_id'] == order_id and row.status == 'pending' for row in rows))
+
+        self.assertEqual(drain_outbox(self.app, workers=1), 3)
+        db.session.expire_all()
+        self.assertTrue(all(row.status == 'sent' and row.attempts == 1 for row in self.outbox()))
+        self.assertEqual(drain_outbox(self.app, workers=1), 0)
+
+    def test_rolled_back_transaction_queues_nothing(self):
+        enqueue('all_delivery_persons', message='New orders are waiting')
+        db.session.rollback()
+        self.assertEqual(self.outbox(), [])
+
+    def test_failed_send_backs_off_then_fails(self):
+        self.app.config['OUTBOX_MAX_ATTEMPTS'] = 2
+        enqueue('customer_order_status', order_id=12345)  # No such order
+        db.session.commit()
+
+        self.assertEqual(drain_outbox(self.app, workers=1), 0)
+        db.session.expire_all()
+        row, = self.outbox()
+        self.assertEqual((row.status, row.attempts), ('pending', 1))
+        self.assertGreater(row.next_attempt_at, datetime.utcnow() + timedelta(seconds=20))
+        self.assertIsNotNone(row.last_error)
+
+        # Not due yet
+        self.assertEqual(drain_outbox(self.app, workers=1), 0)
+        self.assertEqual(self.outbox()[0].attempts, 1)
+
+        db.session.execute(db.update(notification_outbox).values(next_attempt_at=datetime.utcnow()))
+        db.session.commit()
+        self.assertEqual(drain_outbox(self.app, workers=1), 0)
+        db.session.expire_all()
+        row, = self.outbox()
+        self.assertEqual((row.status, row.attempts), ('failed', 2))
+
+    def test_unknown_kind_is_rejected(self):
+        with self.assertRaises(ValueError):
+            enqueue('carrier_pigeon', order_id=1)
+
+    def test_purge_removes_old_sent_and_failed_rows(self):
+        now = datetime.utcnow()
+        long_ago = now - timedelta(days=60)
+        rows = [('sent', now, now), ('sent', long_ago, long_ago), ('failed', now, None),
+                ('failed', long_ago, None), ('pending', long_ago, None)]
+        db.session.execute(db.insert(notification_outbox), [
+            {'kind': 'all_delivery_persons', 'payload': {'message': 'Hi'}, 'status': status,
+             'created_at': created_at, 'next_attempt_at': created_at, 'sent_at': sent_at}
+            for status, created_at, sent_at in rows
+        ])
+        db.session.commit()
+
+        self.assertEqual(purge_outbox(), 2)
+        self.assertEqual([(row.status, row.created_at) for row in self.outbox()],
+                         [('sent', now), ('failed', now), ('pending', long_ago)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+from datetime import datetime, timedelta
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop
+from ecommerce.models.order import Order
+from ecommerce.routes.user import ORDER_SORTS
+from ecommerce.utils.pagination import keyset_paginate, encode_cursor, InvalidCursor, clear_count_cache
+
+class KeysetPaginationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        clear_count_cache()
+        self.client = self.app.test_client()
+
+        self.customer = User(
+            username='testcustomer',
+            email='customer@test.com',
+            role='user'
+        )
+        self.customer.set_password('password')
+        self.shop_owner = User(
+            username='testshopowner',
+            email='owner@test.com',
+            role='shop_owner'
+        )
+        self.shop_owner.set_password('password')
+        db.session.add_all([self.customer, self.shop_owner])
+        db.session.commit()
+
+        self.shop = Shop(
+            name='Test Shop',
+            description='Test shop description',
+            owner_id=self.shop_owner.id
+        )
+        db.session.add(self.shop)
+        db.session.commit()
+
+        # Pairs of orders share a timestamp and amount so ties must be broken by id
+        start = datetime(2025, 1, 1)
+        for i in range(25):
+            order = Order(customer_id=self.customer.id, shop_id=self.shop.id)
+            order.created_at = start + timedelta(hours=i // 2)
+            order.total_amount = float(i // 2)
+            db.session.add(order)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def walk(self, order, per_page=4):
+        query = Order.query.filter_by(customer_id=self.customer.id)
+        pages = []
+        cursor = None
+        while True:
+            pagination = keyset_paginate(query, order, cursor=cursor, per_page=per_page)
+            pages.append(pagination)
+            if not pagination.has_next:
+                return pages
+            cursor = pagination.next_cursor
+
+    def test_forward_walk_matches_offset_order(self):
+        for sort, order in ORDER_SORTS.items():
+            pages = self.walk(order)
+            walked = [o.id for page in pages for o in page.items]
+            expected = [o.id for o in Order.query.order_by(*[
+                column.desc() if direction == 'desc' else column.asc()
+                for column, direction in order
+            ])]
+            self.assertEqual(walked, expected, sort)
+            self.assertFalse(pages[0].has_prev)
+            self.assertTrue(all(page.has_prev for page in pages[1:]))
+
+    def test_backward_walk(self):
+        order = ORDER_SORTS['newest']
+        pages = self.walk(order)
+        query = Order.query.filter_by(customer_id=self.customer.id)
+
+        previous = keyset_paginate(query, order, cursor=pages[2].prev_cursor, per_page=4)
+        self.assertEqual([o.id for o in previous.items], [o.id for o in pages[1].items])
+        self.assertTrue(previous.has_prev)
+        self.assertTrue(previous.has_next)
+
+        first = keyset_paginate(query, order, cursor=pages[1].prev_cursor, per_page=4)
+        self.assertEqual([o.id for o in first.items], [o.id for o in pages[0].items])
+        self.assertFalse(first.has_prev)
+
+    def test_cursor_for_other_sort_is_rejected(self):
+        cursor = encode_cursor(ORDER_SORTS['newest'], [datetime(2025, 1, 1), 1])
+        query = Order.query.filter_by(customer_id=self.customer.id)
+        with self.assertRaises(InvalidCursor):
+            keyset_paginate(query, ORDER_SORTS['highest'], cursor=cursor)
+        with self.assertRaises(InvalidCursor):
+            keyset_paginate(query, ORDER_SORTS['newest'], cursor='not-a-cursor')
+
+    def test_api_orders(self):
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.customer.id)
+
+        response = self.client.get('/api/orders?per_page=10&with_total=1')
+        data = response.get_json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data['items']), 10)
+        self.assertEqual(data['pagination']['total'], 25)
+
+        response = self.client.get('/api/orders', query_string={
+            'per_page': 10,
+            'cursor': data['pagination']['next_cursor']
+        })
+        second = response.get_json()
+        self.assertEqual(len(second['items']), 10)
+        self.assertTrue(second['items'][0]['created_at'] <= data['items'][-1]['created_at'])
+
+        response = self.client.get('/api/orders?cursor=garbage')
+        self.assertEqual(response.status_code, 400)
+
+    def test_orders_page_renders_in_both_modes(self):
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.customer.id)
+
+        self.assertEqual(self.client.get('/user/orders').status_code, 200)
+        self.assertEqual(self.client.get('/user/orders?page=2').status_code, 200)
+
+if __name__ == '__main__':
+    unittest.main()
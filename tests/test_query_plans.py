@@ -0,0 +1,149 @@
+import re
+import unittest
+from sqlalchemy import event
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop, Product
+from ecommerce.models.order import Order, OrderItem
+from ecommerce.models.cart import Cart, CartItem
+from ecommerce.models.negotiation import Negotiation
+from ecommerce.models.review import Review
+from ecommerce.utils.order_stats import clear_order_stats
+
+# Tables that grow with use; reading any of them with a full scan is a regression
+WATCHED_TABLES = {'order', 'order_item', 'cart_item', 'negotiation', 'review'}
+SCAN = re.compile(r'^SCAN (\w+)')
+LIMIT = re.compile(r'\bLIMIT\b', re.IGNORECASE)
+
+class QueryPlanTestCase(unittest.TestCase):
+    """Run EXPLAIN QUERY PLAN on the queries behind the busiest pages"""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        clear_order_stats()
+        self.client = self.app.test_client()
+
+        self.customer = User(username='testcustomer', email='customer@test.com', role='user')
+        self.owner = User(username='testshopowner', email='owner@test.com', role='shop_owner')
+        self.courier = User(username='testcourier', email='courier@test.com', role='delivery')
+        self.admin = User(username='testadmin', email='admin@test.com', role='admin')
+        for user in (self.customer, self.owner, self.courier, self.admin):
+            user.set_password('password')
+        db.session.add_all([self.customer, self.owner, self.courier, self.admin])
+        db.session.commit()
+
+        self.shop = Shop(name='Test Shop', description='', owner_id=self.owner.id)
+        db.session.add(self.shop)
+        db.session.commit()
+
+        self.product = Product(name='Rice', description='', price=10.0, stock=50, shop_id=self.shop.id,
+                               min_price=8.0)
+        db.session.add(self.product)
+        db.session.commit()
+
+        for status in ('pending', 'confirmed', 'delivering', 'completed'):
+            order = Order(customer_id=self.customer.id, shop_id=self.shop.id, delivery_address='1 Test Road')
+            order.status = status
+            if status in ('delivering', 'completed'):
+                order.delivery_person_id = self.courier.id
+            db.session.add(order)
+            db.session.flush()
+            db.session.add(OrderItem(order_id=order.id, product_id=self.product.id, quantity=1, price=10.0))
+        cart = Cart(user_id=self.customer.id)
+        db.session.add(cart)
+        db.session.flush()
+        db.session.add(CartItem(cart_id=cart.id, product_id=self.product.id, quantity=1))
+        db.session.add(Negotiation(self.product.id, self.customer.id, 10.0, 9.0))
+        db.session.add(Review(self.product.id, self.customer.id, 4))
+        db.session.commit()
+        self.ids = {'customer': self.customer.id, 'shop_owner': self.owner.id, 'delivery': self.courier.id,
+                    'admin': self.admin.id, 'product': self.product.id}
+
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.capture)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self.capture)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def capture(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            self.statements.append((statement, parameters))
+
+    def login(self, role):
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.ids[role])
+
+    def assert_no_full_scans(self):
+        self.assertTrue(self.statements, 'No queries were captured')
+        statements, self.statements = self.statements, []
+        with db.engine.connect() as conn:
+            for statement, parameters in statements:
+                plan = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+                details = [row[-1] for row in plan]
+                # Walking an index in ORDER BY order stops after LIMIT rows
+                ordered_walk = LIMIT.search(statement) and \
+                    not any('TEMP B-TREE FOR ORDER BY' in detail for detail in details)
+                for detail in details:
+                    scan = SCAN.match(detail)
+                    if scan and scan.group(1) in WATCHED_TABLES:
+                        if ordered_walk and ' USING INDEX ' in detail:
+                            continue
+                        self.fail(f'Full scan of {scan.group(1)}: {detail}\n{statement}')
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+
+    def test_customer_pages(self):
+        self.login('customer')
+        self.get('/user/dashboard')
+        self.get('/user/orders')
+        self.get('/user/orders?status=pending&sort=oldest')
+        self.get('/api/cart/count')
+        self.assert_no_full_scans()
+
+    def test_shop_pages(self):
+        self.login('shop_owner')
+        self.get('/shop/orders')
+        self.get('/shop/orders?status=pending')
+        self.assert_no_full_scans()
+
+    def test_shop_dashboard(self):
+        self.login('shop_owner')
+        self.get('/shop/dashboard')
+        self.assert_no_full_scans()
+
+    def test_admin_pages(self):
+        self.login('admin')
+        self.get('/admin/dashboard')
+        self.get('/admin/orders')
+        self.get('/admin/orders?status=pending')
+        self.get('/api/admin/dashboard-stats')
+        self.assert_no_full_scans()
+
+    def test_delivery_dashboard(self):
+        self.login('delivery')
+        self.get('/delivery/dashboard')
+        self.assert_no_full_scans()
+
+    def test_cart_and_negotiation_lookups(self):
+        self.login('customer')
+        response = self.client.post('/api/add', json={'product_id': self.ids['product'], 'quantity': 1})
+        self.assertEqual(response.status_code, 200)
+        Negotiation.query.filter_by(product_id=self.ids['product'], customer_id=self.ids['customer'],
+                                    status='pending').first()
+        self.assert_no_full_scans()
+
+    def test_product_reviews(self):
+        db.session.get(Product, self.ids['product']).reviews
+        self.assert_no_full_scans()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import re
+import unittest
+from unittest import mock
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop, Product
+from ecommerce.utils import ranking
+from ecommerce.utils.ranking import rank_products, rebuild_ranking_index
+from ecommerce.utils.search_cache import invalidate
+from ecommerce.utils.pagination import keyset_paginate_ranked
+
+class RankingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        invalidate()
+        self.client = self.app.test_client()
+
+        self.owner = User(
+            username='testshopowner',
+            email='owner@test.com',
+            role='shop_owner'
+        )
+        self.owner.set_password('password')
+        db.session.add(self.owner)
+        db.session.commit()
+
+        self.shop = Shop(name='Test Shop', description='', owner_id=self.owner.id)
+        db.session.add(self.shop)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_product(self, name, description='', category=None, rating=0.0, rating_count=0):
+        product = Product(name=name, description=description, price=10.00, stock=10,
+                          shop_id=self.shop.id, category=category)
+        product.rating = rating
+        product.rating_count = rating_count
+        db.session.add(product)
+        db.session.commit()
+        return product
+
+    def ranked_ids(self, query):
+        invalidate()
+        return [product_id for product_id, _ in rank_products(query)]
+
+    def test_field_weights(self):
+        in_description = self.add_product('Rice Bowl', 'Served with chicken')
+        in_category = self.add_product('Wings', 'Crispy', 'Chicken')
+        in_name = self.add_product('Chicken Roast', 'Slow cooked')
+
+        self.assertEqual(self.ranked_ids('chicken'), [in_name.id, in_category.id, in_description.id])
+
+    def test_shorter_field_and_rarer_terms_rank_higher(self):
+        long_name = self.add_product('Chicken Curry With Rice And Salad')
+        short_name = self.add_product('Chicken Curry')
+        self.add_product('Beef Curry')
+
+        self.assertEqual(self.ranked_ids('curry chicken'), [short_name.id, long_name.id])
+
+    def test_all_tokens_must_match_last_as_prefix(self):
+        curry = self.add_product('Chicken Curry')
+        self.add_product('Chicken Roast')
+
+        self.assertEqual(self.ranked_ids('chicken cur'), [curry.id])
+        self.assertEqual(self.ranked_ids('cur chicken'), [])
+
+    def test_rating_breaks_ties(self):
+        plain = self.add_product('Mango Juice')
+        loved = self.add_product('Mango Juice', rating=4.9, rating_count=40)
+        disliked = self.add_product('Mango Juice', rating=1.5, rating_count=40)
+
+        self.assertEqual(self.ranked_ids('mango'), [loved.id, plain.id, disliked.id])
+
+    def test_index_follows_changes(self):
+        product = self.add_product('Mango Juice')
+        product.name = 'Orange Juice'
+        db.session.commit()
+        self.assertEqual(self.ranked_ids('mango'), [])
+        self.assertEqual(self.ranked_ids('orange'), [product.id])
+
+        db.session.delete(product)
+        db.session.commit()
+        self.assertEqual(self.ranked_ids('orange'), [])
+
+        self.add_product('Lemon Juice')
+        rebuild_ranking_index()
+        self.assertEqual(len(self.ranked_ids('juice')), 1)
+
+    def test_pages_reuse_the_ranking(self):
+        for i in range(15):
+            self.add_product(f'Mango Juice {i}')
+        invalidate()
+
+        with mock.patch.object(ranking, '_score', wraps=ranking._score) as score:
+            response = self.client.get('/search?q=mango&type=products')
+            self.assertEqual(response.status_code, 200)
+            html = response.get_data(as_text=True)
+            cursor = html.split('cursor=')[1].split('&')[0].split('"')[0]
+            response = self.client.get('/search', query_string={'q': 'mango', 'type': 'products',
+                                                                'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(score.call_count, 1)
+
+    def test_cursor_survives_a_changed_ranking(self):
+        for i in range(15):
+            self.add_product(f'Mango Juice {i}')
+        html = self.client.get('/search?q=mango&type=products').get_data(as_text=True)
+        cursor = html.split('cursor=')[1].split('&')[0].split('"')[0]
+        first_page = set(re.findall(r'Mango Juice \d+', html))
+
+        # A commit drops the cached ranking and the next one has another size
+        self.add_product('Mango Juice 15')
+        response = self.client.get('/search', query_string={'q': 'mango', 'type': 'products', 'cursor': cursor})
+        self.assertEqual(response.status_code, 200)
+        second_page = set(re.findall(r'Mango Juice \d+', response.get_data(as_text=True)))
+        self.assertEqual((len(first_page), len(second_page)), (12, 4))
+        self.assertFalse(first_page & second_page)
+
+        first = keyset_paginate_ranked([(5, 3.0), (2, 2.0), (7, 2.0), (1, 1.0)], per_page=2)
+        self.assertEqual(first.items, [5, 2])
+        ranking_now = [(9, 2.5), (2, 2.0), (7, 2.0), (1, 1.0)]
+        second = keyset_paginate_ranked(ranking_now, cursor=first.next_cursor, per_page=2)
+        self.assertEqual((second.items, second.has_next, second.total), ([7, 1], False, 4))
+        self.assertEqual(keyset_paginate_ranked(ranking_now, cursor=second.prev_cursor, per_page=2).items, [9, 2])
+        # A row that dropped out is placed by its score
+        top = keyset_paginate_ranked([(5, 3.0), (2, 2.0)], per_page=1)
+        self.assertEqual(keyset_paginate_ranked(ranking_now, cursor=top.next_cursor, per_page=2).items, [9, 2])
+
+    def test_filters_apply_to_every_match(self):
+        for i in range(5):
+            self.add_product(f'Mango Juice {i}', category='Drinks')
+        # Ranked after every juice in the unfiltered search
+        for i in range(2):
+            self.add_product(f'Mango Cake {i}', category='Sweets')
+        invalidate()
+
+        response = self.client.get('/search', query_string={'q': 'mango', 'type': 'products',
+                                                            'category': 'Sweets'})
+        self.assertEqual(response.status_code, 200)
+        html = response.get_data(as_text=True)
+        self.assertIn('Mango Cake 0', html)
+        self.assertIn('Mango Cake 1', html)
+        self.assertNotIn('Mango Juice', html)
+
+    def test_short_last_token_matches_whole_terms_only(self):
+        self.add_product('Chicken Roast')
+        tea = self.add_product('Ch Tea')
+
+        self.assertEqual(self.ranked_ids('ch'), [tea.id])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop, Product
+from ecommerce.models.order import Order, OrderItem
+from ecommerce.utils.recommendations import (
+    refresh_recommendations, rebuild_recommendations, recommended_products, product_cooccurrence
+)
+
+class RecommendationsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.customer = User(
+            username='testcustomer',
+            email='customer@test.com',
+            role='user'
+        )
+        self.customer.set_password('password')
+        self.owner = User(
+            username='testshopowner',
+            email='owner@test.com',
+            role='shop_owner'
+        )
+        self.owner.set_password('password')
+        db.session.add_all([self.customer, self.owner])
+        db.session.commit()
+
+        self.shop = Shop(name='Test Shop', description='', owner_id=self.owner.id)
+        db.session.add(self.shop)
+        db.session.commit()
+
+        self.rice, self.dal, self.oil, self.salt = [
+            Product(name=name, description='', price=10.00, stock=100, shop_id=self.shop.id)
+            for name in ('Rice', 'Dal', 'Oil', 'Salt')
+        ]
+        db.session.add_all([self.rice, self.dal, self.oil, self.salt])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def place_order(self, products, status='completed'):
+        order = Order(customer_id=self.customer.id, shop_id=self.shop.id)
+        for product in products:
+            order.items.append(OrderItem(product_id=product.id, quantity=1, price=product.price))
+        order.status = status
+        db.session.add(order)
+        db.session.commit()
+        return order
+
+    def test_ranks_by_cooccurrence(self):
+        self.place_order([self.rice, self.dal, self.oil])
+        self.place_order([self.rice, self.dal])
+        self.place_order([self.rice, self.salt], status='pending')
+
+        self.assertEqual(refresh_recommendations(), 2)
+        self.assertEqual(recommended_products(self.rice.id), [self.dal, self.oil])
+        self.assertEqual(recommended_products(self.oil.id), [self.rice, self.dal])
+        self.assertEqual(recommended_products(self.salt.id), [])
+
+    def test_incremental_refresh(self):
+        self.place_order([self.rice, self.dal])
+        self.place_order([self.rice, self.dal])
+        refresh_recommendations()
+        self.assertEqual(refresh_recommendations(), 0)
+
+        order = self.place_order([self.rice, self.salt], status='pending')
+        self.place_order([self.rice, self.salt])
+        order.status = 'completed'
+        db.session.commit()
+        self.assertEqual(refresh_recommendations(), 2)
+        self.assertEqual(recommended_products(self.rice.id), [self.dal, self.salt])
+
+        self.place_order([self.rice, self.salt])
+        refresh_recommendations(batch_size=1)
+        self.assertEqual(recommended_products(self.rice.id), [self.salt, self.dal])
+
+        # A full rebuild gives the same counts as the incremental refreshes
+        counts = db.session.execute(db.select(product_cooccurrence)).all()
+        rebuild_recommendations()
+        self.assertEqual(sorted(db.session.execute(db.select(product_cooccurrence)).all()), sorted(counts))
+
+    def test_product_page_uses_recommendations(self):
+        self.place_order([self.rice, self.salt])
+        refresh_recommendations()
+
+        response = self.client.get(f'/shop/{self.shop.id}/products/{self.rice.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Salt', response.get_data(as_text=True))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop, Product
+from ecommerce.utils.cache import LRUCache
+from ecommerce.utils.search_cache import search_cache, invalidate
+
+class SearchCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        invalidate()
+        self.client = self.app.test_client()
+
+        self.owner = User(
+            username='testshopowner',
+            email='owner@test.com',
+            role='shop_owner'
+        )
+        self.owner.set_password('password')
+        self.admin = User(
+            username='testadmin',
+            email='admin@test.com',
+            role='admin'
+        )
+        self.admin.set_password('password')
+        db.session.add_all([self.owner, self.admin])
+        db.session.commit()
+
+        self.shop = Shop(name='Test Shop', description='', owner_id=self.owner.id)
+        db.session.add(self.shop)
+        db.session.commit()
+
+        self.product = Product(name='Mango Juice', description='', price=50, stock=10,
+                               shop_id=self.shop.id, category='Drinks')
+        db.session.add(self.product)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def search(self, query):
+        response = self.client.get('/search', query_string={'q': query, 'type': 'products'})
+        self.assertEqual(response.status_code, 200)
+        return response.get_data(as_text=True)
+
+    def test_repeated_search_is_served_from_cache(self):
+        self.assertIn('Mango Juice', self.search('mango'))
+        misses = search_cache.misses
+        hits = search_cache.hits
+
+        self.assertIn('Mango Juice', self.search('  MANGO '))
+        self.assertEqual(search_cache.hits, hits + 1)
+        self.assertEqual(search_cache.misses, misses)
+
+    def test_product_change_invalidates(self):
+        self.assertIn('Mango Juice', self.search('mango'))
+
+        self.product.name = 'Orange Juice'
+        db.session.commit()
+        self.assertEqual(len(search_cache), 0)
+        self.assertNotIn('Orange Juice', self.search('mango'))
+        self.assertIn('Orange Juice', self.search('orange'))
+
+    def test_irrelevant_or_rolled_back_changes_keep_cache(self):
+        self.search('mango')
+
+        self.product.stock = 3
+        db.session.commit()
+        self.assertEqual(len(search_cache), 1)
+
+        self.product.name = 'Orange Juice'
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(len(search_cache), 1)
+
+    def test_suggestions_are_cached(self):
+        response = self.client.get('/api/search/suggestions?q=mango')
+        self.assertEqual([item['name'] for item in response.get_json()], ['Mango Juice'])
+        hits = search_cache.hits
+        self.client.get('/api/search/suggestions?q=Mango')
+        self.assertEqual(search_cache.hits, hits + 1)
+
+        db.session.delete(self.product)
+        db.session.commit()
+        response = self.client.get('/api/search/suggestions?q=mango')
+        self.assertEqual(response.get_json(), [])
+
+    def test_stats_require_admin(self):
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.owner.id)
+        self.assertEqual(self.client.get('/api/admin/search-cache-stats').status_code, 403)
+
+    def test_stats(self):
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.admin.id)
+        response = self.client.get('/api/admin/search-cache-stats')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('hit_rate', response.get_json()['search_cache'])
+
+    def test_lru_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop, Product
+from ecommerce.utils.search_index import search_product_ids
+
+class SearchIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.owner = User(
+            username='testshopowner',
+            email='owner@test.com',
+            role='shop_owner'
+        )
+        self.owner.set_password('password')
+        db.session.add(self.owner)
+        db.session.commit()
+
+        self.shop = Shop(
+            name='Test Shop',
+            description='Test shop description',
+            owner_id=self.owner.id
+        )
+        db.session.add(self.shop)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_product(self, name, description='', category=None):
+        product = Product(
+            name=name,
+            description=description,
+            price=10.00,
+            stock=10,
+            shop_id=self.shop.id,
+            category=category
+        )
+        db.session.add(product)
+        db.session.commit()
+        return product
+
+    def test_insert_is_indexed(self):
+        chicken = self.add_product('Chicken Curry', 'Spicy curry', 'Food')
+        self.add_product('Tomato', 'Fresh red tomatoes', 'Vegetables')
+
+        self.assertEqual(search_product_ids('chicken'), [chicken.id])
+        # Partially typed words match as a prefix
+        self.assertEqual(search_product_ids('chick'), [chicken.id])
+
+    def test_ranks_name_above_description(self):
+        in_description = self.add_product('Rice Bowl', 'Served with chicken')
+        in_name = self.add_product('Chicken Wings', 'Crispy')
+
+        self.assertEqual(search_product_ids('chicken'), [in_name.id, in_description.id])
+
+    def test_update_and_delete_are_synced(self):
+        product = self.add_product('Mango Juice', 'Fresh')
+
+        product.name = 'Orange Juice'
+        db.session.commit()
+        self.assertEqual(search_product_ids('mango'), [])
+        self.assertEqual(search_product_ids('orange'), [product.id])
+
+        db.session.delete(product)
+        db.session.commit()
+        self.assertEqual(search_product_ids('orange'), [])
+
+    def test_search_route_uses_index(self):
+        self.add_product('Chicken Curry', 'Spicy curry', 'Food')
+        self.add_product('Tomato', 'Fresh red tomatoes', 'Vegetables')
+
+        response = self.client.get('/search?q=curry')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Chicken Curry', response.data)
+        self.assertNotIn(b'Fresh red tomatoes', response.data)
+
+if __name__ == '__main__':
+    unittest.main()
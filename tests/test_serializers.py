@@ -0,0 +1,108 @@
+import unittest
+from sqlalchemy import event
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop, Product
+from ecommerce.models.order import Order
+from ecommerce.utils.order_placement import insert_orders
+from ecommerce.utils.serializers import ORDER, InvalidFields
+
+class SerializersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.admin = User(username='testadmin', email='admin@test.com', role='admin')
+        self.admin.set_password('password')
+        self.customer = User(username='testcustomer', email='customer@test.com', role='user')
+        self.customer.set_password('password')
+        self.owner = User(username='testshopowner', email='owner@test.com', role='shop_owner')
+        self.owner.set_password('password')
+        db.session.add_all([self.admin, self.customer, self.owner])
+        db.session.commit()
+        self.admin_id = self.admin.id
+
+        self.shop = Shop(name='Test Shop', description='', owner_id=self.owner.id)
+        db.session.add(self.shop)
+        db.session.commit()
+
+        self.rice = Product(name='Rice', description='', price=10.0, stock=50, shop_id=self.shop.id)
+        self.dal = Product(name='Dal', description='', price=8.0, stock=50, shop_id=self.shop.id)
+        db.session.add_all([self.rice, self.dal])
+        db.session.commit()
+
+        lines = [(self.rice.id, 1, 10.0), (self.dal.id, 2, 8.0)]
+        for _ in range(5):
+            insert_orders(self.customer.id, {self.shop.id: lines}, delivery_address='12 Road')
+        db.session.commit()
+        db.session.expunge_all()
+
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.count_statement)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self.count_statement)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def count_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def orders(self, plan):
+        return Order.query.options(*plan.load_options()).order_by(Order.id).all()
+
+    def test_default_plan_matches_to_dict(self):
+        plan = ORDER.plan()
+        dumped = plan.dump_many(self.orders(plan))
+        db.session.expunge_all()
+        self.assertEqual(dumped, [order.to_dict() for order in Order.query.order_by(Order.id).all()])
+
+    def test_sparse_fields(self):
+        plan = ORDER.plan('id,status,total_amount,items.product.name,customer.username')
+        dumped = plan.dump(self.orders(plan)[0])
+        self.assertEqual(dumped, {
+            'id': dumped['id'],
+            'status': 'pending',
+            'total_amount': 26.0,
+            'items': [{'product': {'name': 'Rice'}}, {'product': {'name': 'Dal'}}],
+            'customer': {'username': 'testcustomer'}
+        })
+
+    def test_eager_loading_keeps_query_count_flat(self):
+        # Orders joined to customer, shop and delivery person, then items joined to product and shop
+        plan = ORDER.plan()
+        self.statements.clear()
+        plan.dump_many(self.orders(plan))
+        self.assertEqual(len(self.statements), 2)
+
+        plan = ORDER.plan('id,status')
+        self.statements.clear()
+        plan.dump_many(self.orders(plan))
+        self.assertEqual(len(self.statements), 1)
+
+    def test_unknown_fields_are_rejected(self):
+        with self.assertRaises(InvalidFields):
+            ORDER.plan('id,items.product.secret')
+        with self.assertRaises(InvalidFields):
+            ORDER.plan('status.name')
+
+    def test_dashboard_stats_fields(self):
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.admin_id)
+        response = self.client.get('/api/admin/dashboard-stats?fields=id,status,items.product.name')
+        self.assertEqual(response.status_code, 200)
+        recent = response.get_json()['recent_orders']
+        self.assertEqual(len(recent), 5)
+        self.assertEqual(set(recent[0]), {'id', 'status', 'items'})
+        self.assertEqual(recent[0]['items'][0], {'product': {'name': 'Rice'}})
+
+        response = self.client.get('/api/admin/dashboard-stats?fields=id,password_hash')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['status'], 'error')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import fcntl
+import os
+import shutil
+import tempfile
+import unittest
+from ecommerce import create_app, db
+from ecommerce.utils.server_session import (
+    init_session_interface, encode_session, decode_session
+)
+
+def sample_cart(size):
+    return {
+        str(product_id): {
+            'quantity': product_id % 5 + 1,
+            'price': 10.5 + product_id,
+            'negotiated_price': 9.0 if product_id % 2 else None
+        }
+        for product_id in range(1, size + 1)
+    }
+
+class ServerSessionTestCase(unittest.TestCase):
+    backend = 'sqlalchemy'
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.tempdir = tempfile.mkdtemp()
+        self.app.config['SESSION_BACKEND'] = self.backend
+        self.app.config['SESSION_DBM_PATH'] = os.path.join(self.tempdir, 'sessions')
+        init_session_interface(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.tempdir)
+
+    def test_encoding_round_trip(self):
+        data = {'cart': sample_cart(50), '_user_id': '3', '_flashes': [('info', 'Hi')]}
+        blob = encode_session(data)
+        self.assertEqual(decode_session(blob), data)
+
+        # Carts that do not fit the packed layout still round trip
+        odd = {'cart': {'7': {'quantity': 1}}}
+        self.assertEqual(decode_session(encode_session(odd)), odd)
+
+    def test_out_of_range_cart_lines_are_dropped(self):
+        cart = sample_cart(2)
+        cart['3'] = {'quantity': -1, 'price': 10.0, 'negotiated_price': None}
+        cart['4'] = {'quantity': 2 ** 40, 'price': 10.0, 'negotiated_price': None}
+        cart[str(2 ** 40)] = {'quantity': 1, 'price': 10.0, 'negotiated_price': None}
+        self.assertEqual(decode_session(encode_session({'cart': cart})), {'cart': sample_cart(2)})
+
+    def test_cookie_only_carries_id(self):
+        cart = sample_cart(200)
+        with self.client.session_transaction() as session:
+            session['cart'] = cart
+        cookie = self.client.get_cookie('session')
+        self.assertLess(len(cookie.value), 100)
+
+        with self.client.session_transaction() as session:
+            self.assertEqual(session['cart'], cart)
+            session['cart'].pop('1')
+            session.modified = True
+        with self.client.session_transaction() as session:
+            self.assertNotIn('1', session['cart'])
+            self.assertEqual(len(session['cart']), 199)
+
+    def test_tampered_cookie_starts_fresh(self):
+        with self.client.session_transaction() as session:
+            session['cart'] = sample_cart(2)
+        cookie = self.client.get_cookie('session')
+        self.client.set_cookie('session', cookie.value[:-2] + 'xx')
+        with self.client.session_transaction() as session:
+            self.assertNotIn('cart', session)
+
+    def test_expired_sessions_are_ignored_and_purged(self):
+        with self.client.session_transaction() as session:
+            session['cart'] = sample_cart(2)
+        store = self.app.session_interface.store
+        self.assertEqual(store.purge_expired(), 0)
+
+        self.app.session_interface.ttl = -1
+        with self.client.session_transaction() as session:
+            session['cart'] = sample_cart(3)
+        with self.client.session_transaction() as session:
+            self.assertNotIn('cart', session)
+        self.assertEqual(store.purge_expired(), 1)
+
+class DbmServerSessionTestCase(ServerSessionTestCase):
+    backend = 'dbm'
+
+    def test_access_locks_out_other_processes(self):
+        store = self.app.session_interface.store
+        with store._open(), open(store.path + '.lock') as other:
+            # flock locks held through another open file conflict, as in another process
+            with self.assertRaises(BlockingIOError):
+                fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        with open(store.path + '.lock') as other:
+            fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop, Product
+from ecommerce.models.cart import Cart, CartItem
+from ecommerce.models.order import Order
+from ecommerce.utils.inventory import decrement_stock, reserve, InsufficientStock
+
+class StockConcurrencyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.owner = User(
+            username='testshopowner',
+            email='owner@test.com',
+            role='shop_owner'
+        )
+        self.owner.set_password('password')
+        db.session.add(self.owner)
+        db.session.commit()
+
+        self.shop = Shop(name='Test Shop', description='', owner_id=self.owner.id)
+        db.session.add(self.shop)
+        db.session.commit()
+
+        self.rice = Product(name='Rice', description='', price=10.0, stock=5, shop_id=self.shop.id)
+        self.dal = Product(name='Dal', description='', price=8.0, stock=1, shop_id=self.shop.id)
+        db.session.add_all([self.rice, self.dal])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_shortfall_rolls_back_every_line(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            decrement_stock({self.rice.id: 2, self.dal.id: 2})
+        self.assertEqual(raised.exception.product_id, self.dal.id)
+        self.assertIn('Dal', str(raised.exception))
+        db.session.rollback()
+        self.assertEqual((self.rice.stock, self.dal.stock), (5, 1))
+
+        decrement_stock({self.rice.id: 5, self.dal.id: 1})
+        db.session.commit()
+        self.assertEqual((self.rice.stock, self.dal.stock), (0, 0))
+
+    def test_other_carts_reservations_are_not_taken(self):
+        customers = [User(username=f'customer{i}', email=f'customer{i}@test.com', role='user') for i in range(2)]
+        for customer in customers:
+            customer.password_hash = self.owner.password_hash
+        db.session.add_all(customers)
+        db.session.commit()
+        mine, theirs = Cart(user_id=customers[0].id), Cart(user_id=customers[1].id)
+        db.session.add_all([mine, theirs])
+        db.session.commit()
+        reserve(mine.id, {self.rice.id: 2})
+        reserve(theirs.id, {self.rice.id: 2})
+        db.session.commit()
+
+        with self.assertRaises(InsufficientStock):
+            decrement_stock({self.rice.id: 4}, exclude_cart_id=mine.id)
+        db.session.rollback()
+        with self.assertRaises(InsufficientStock):
+            decrement_stock({self.rice.id: 2})
+        db.session.rollback()
+
+        decrement_stock({self.rice.id: 3}, exclude_cart_id=mine.id)
+        db.session.commit()
+        self.assertEqual(self.rice.stock, 2)
+
+    def test_concurrent_checkouts_never_oversell(self):
+        customers = [User(username=f'customer{i}', email=f'customer{i}@test.com', role='user') for i in range(12)]
+        for customer in customers:
+            customer.password_hash = self.owner.password_hash
+        db.session.add_all(customers)
+        db.session.commit()
+        carts = [Cart(user_id=customer.id) for customer in customers]
+        db.session.add_all(carts)
+        db.session.commit()
+        db.session.add_all([CartItem(cart_id=cart.id, product_id=self.rice.id, quantity=1) for cart in carts])
+        db.session.commit()
+        customer_ids = [customer.id for customer in customers]
+        rice_id = self.rice.id
+        db.session.remove()
+
+        def checkout(customer_id):
+            client = self.app.test_client()
+            with client.session_transaction() as session:
+                session['_user_id'] = str(customer_id)
+            client.post('/api/checkout', json={'shipping': {'address': '1 Test Road'}, 'payment_method': 'cod'})
+
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            list(pool.map(checkout, customer_ids))
+
+        self.assertEqual(Order.query.count(), 5)
+        self.assertEqual(db.session.get(Product, rice_id).stock, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+from ecommerce import create_app, db
+from ecommerce.models.user import User
+from ecommerce.models.shop import Shop, Product
+from ecommerce.utils.search_cache import invalidate
+from ecommerce.utils.trigram import trigrams, fuzzy_product_ids, fuzzy_shop_ids, rebuild_trigram_index
+
+class TrigramSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        invalidate()
+        self.client = self.app.test_client()
+
+        self.owner = User(
+            username='testshopowner',
+            email='owner@test.com',
+            role='shop_owner'
+        )
+        self.owner.set_password('password')
+        db.session.add(self.owner)
+        db.session.commit()
+
+        self.shop = Shop(name='Rahim Grocery', description='', owner_id=self.owner.id)
+        db.session.add(self.shop)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_product(self, name, category=None):
+        product = Product(name=name, description='', price=10.00, stock=10,
+                          shop_id=self.shop.id, category=category)
+        db.session.add(product)
+        db.session.commit()
+        return product
+
+    def test_trigrams(self):
+        self.assertEqual(trigrams('Cat'), {'  c', ' ca', 'cat', 'at '})
+        self.assertEqual(trigrams(''), set())
+
+    def test_misspellings_match(self):
+        chicken = self.add_product('Chicken Curry', 'Food')
+        tomato = self.add_product('Tomato', 'Vegetables')
+        potato = self.add_product('Potato', 'Vegetables')
+
+        self.assertEqual(fuzzy_product_ids('chiken'), [chicken.id])
+        self.assertEqual(fuzzy_product_ids('tomatto')[0], tomato.id)
+        # Categories are indexed too; equally similar matches come in id order
+        self.assertEqual(fuzzy_product_ids('vegetabls'), [tomato.id, potato.id])
+        self.assertEqual(fuzzy_shop_ids('rahim grocry'), [self.shop.id])
+
+    def test_index_follows_changes(self):
+        product = self.add_product('Mango Juice')
+
+        product.name = 'Orange Juice'
+        db.session.commit()
+        self.assertEqual(fuzzy_product_ids('mangoo'), [])
+        self.assertEqual(fuzzy_product_ids('ornge'), [product.id])
+
+        db.session.delete(product)
+        db.session.commit()
+        self.assertEqual(fuzzy_product_ids('ornge'), [])
+
+    def test_rebuild(self):
+        product = self.add_product('Mango Juice')
+        rebuild_trigram_index()
+        self.assertEqual(fuzzy_product_ids('mangoo'), [product.id])
+
+    def test_search_falls_back_to_fuzzy(self):
+        self.add_product('Chicken Curry', 'Food')
+
+        response = self.client.get('/search?q=chiken')
+        html = response.get_data(as_text=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Chicken Curry', html)
+        self.assertIn('No exact matches', html)
+
+        response = self.client.get('/search?q=chiken&fuzzy=1&type=products')
+        self.assertIn('Chicken Curry', response.get_data(as_text=True))
+
+if __name__ == '__main__':
+    unittest.main()